@@ -13,6 +13,18 @@
 #
 # --- History ------------------------------------------------------ #
 #
+# 2026-10-18 : * Added a batch mode that parses each model once and
+#                writes one script per subject (or per shard of
+#                subjects) to an output folder, optionally using
+#                several worker processes across model files.
+#              * The Matlab code is now compiled once per model into
+#                a template, and stamped for each participant.
+#              * Added export of the DCM structures as .mat files,
+#                built from each subject's SPM.mat and VOI files
+#                (requires NumPy and SciPy).
+#              * Parsed models can be cached on disk, and the inputs
+#                and connections of each matrix are memoized.
+#
 # 2017-11-14 : * Added support for TE values
 #              * Added support for loading model files from different 
 #                folders
@@ -126,9 +138,56 @@ Where:
     SPM.mat file is located (and where the DCM model will be 
     saved)
   <subjN> is the name of the folder corresponding to each subject.
+
+Batch Mode
+----------
+  $ dcm-generate-models.py --batch [-j <workers>] [-s <shard_size>] [-m]
+                           [-c <cache_dir>] <dcm_dir> <subject_file>
+                           <out_dir> <model_file|pattern> ...
+
+Where:
+
+  <dcm_dir> is the same as above.
+  <subject_file> is a text file listing the subject folders, one per
+    line ('#' comments are allowed).
+  <out_dir> is the folder where the Matlab scripts will be written.
+  <model_file|pattern> is a model file, or a glob pattern (e.g.,
+    'models/*.txt') matching several model files.
+  <workers> is the number of processes used to generate the model
+    files in parallel (default is 1).
+  <shard_size> is the number of subjects written in each script.
+    With the default value of 1, each subject gets its own script,
+    named <model>_<subj>.m; otherwise, scripts are named
+    <model>_shard<K>.m. A value of 0 puts all the subjects in a 
+    single <model>.m script.
+  -m also saves the DCM structure of each subject, as built by the
+    Matlab scripts before spm_dcm_estimate, as <model>_<subj>.mat
+    (using NumPy and SciPy). The VOIs, inputs, and delays are read
+    from the subject's SPM.mat and VOI_<voi>_1.mat files, in
+    <subj>/<dcm_dir>.
+  <cache_dir> is a folder where parsed models are cached. A model
+    file is parsed again only if its content has changed.
+
+Each model file is parsed only once, regardless of the number of
+subjects.
+
+Benchmark
+---------
+  $ dcm-generate-models.py --benchmark <model_file> [<N1> <N2> ...]
+
+Times the cost of emitting the Matlab code for N fake subjects (by
+default, 1,000 and 10,000), comparing the rendering of each subject
+from scratch against the stamping of a compiled template.
 """
 
-import sys, copy, os, ntpath
+import sys, os, ntpath, glob, getopt, io, time
+import hashlib, pickle
+import multiprocessing
+
+# Version of the parser and of the records of model_to_record(), part
+# of the key of cached models: change it whenever either changes, so
+# that older pickles are not reused
+CACHE_VERSION = 1
 
 
 def isDefinitionString(strng):
@@ -288,24 +347,45 @@ class Model(object):
         self.name = name
         self.participant = participant
         self.dcmFolder = dcmFolder
+        self.memo = {}
+
+    def Forget(self):
+        """
+        Clears the memoized results. Needs to be called if the
+        connections are changed after the first query.
+        """
+        self.memo = {}
 
     def InputsUsed(self):
         """
         Analyzes the connections to return a list of all the inputs
         that are actually used in the model
         """
-        U = []
-        for c in self.connections:
-            U += c.Elements()
-
-        U = [x for x in U if x.nature == "Input"]
-        #U.sort(key=lambda x: x.index)
-        #U = [x.name for x in U]
-        return(sorted(list(set(U)), key=lambda x: x.index))
-
+        if 'inputs' not in self.memo:
+            U = []
+            for c in self.connections:
+                U += c.Elements()
+
+            U = [x for x in U if x.nature == "Input"]
+            #U.sort(key=lambda x: x.index)
+            #U = [x.name for x in U]
+            self.memo['inputs'] = sorted(list(set(U)), key=lambda x: x.index)
+        return list(self.memo['inputs'])
+
+    def Connections(self, matrix):
+        """
+        Returns the connections that belong to a given matrix
+        ('a', 'b', 'c', or 'd'), in the order they were declared.
+        """
+        if 'matrices' not in self.memo:
+            P = {'a' : [], 'b' : [], 'c' : [], 'd' : []}
+            for c in self.connections:
+                P[c.matrix].append(c)
+            self.memo['matrices'] = P
+        return list(self.memo['matrices'][matrix])
 
     def IsNonlinear(self):
-        if len([x for x in self.connections if x.matrix == 'd']):
+        if len(self.Connections('d')):
             return True
         else:
             return False
@@ -326,25 +406,88 @@ class Model(object):
         N = [x.name for x in self.InputsUsed()]
         for u in U:
             u.index = N.index(u.name)+1
+        self.Forget()
 
 
-def parse_file(fileName):
+def parse_file(fileName, cacheDir=None):
     """
 Parses a file in the Model Definition Format and transforms it into
-an abstract representation of the model.
+an abstract representation of the model. If a 'cacheDir' is given,
+parsed models are stored there (as pickled records named after the
+SHA-1 hash of CACHE_VERSION and of the file's content), and a file is
+parsed again only when its content (or CACHE_VERSION) changes.
     """
 
     name = ntpath.basename(fileName)
     if '.' in name:
         name = name[0:name.rindex('.')]
-    
+
+    f = open(fileName, 'r')
+    text = f.read()
+    f.close()
+
+    if cacheDir is not None:
+        key = hashlib.sha1(("%d\n" % CACHE_VERSION + text).encode('utf-8')).hexdigest()
+        path = os.path.join(cacheDir, "%s.pickle" % key)
+        if os.path.exists(path):
+            f = open(path, 'rb')
+            model = record_to_model(pickle.load(f), name)
+            f.close()
+        else:
+            model = parse_text(text, name)
+            if not os.path.isdir(cacheDir):
+                os.makedirs(cacheDir, exist_ok=True)
+            # Writes to a temporary file first, so that parallel
+            # workers never read a partial pickle.
+            tmp = "%s.%d" % (path, os.getpid())
+            f = open(tmp, 'wb')
+            pickle.dump(model_to_record(model), f, pickle.HIGHEST_PROTOCOL)
+            f.close()
+            os.replace(tmp, path)
+        return model
+
+    return parse_text(text, name)
+
+
+def model_to_record(model):
+    """
+Transforms a parsed model into a compact record made only of 
+built-in types, which can be pickled independently of this script.
+Connections are stored as the list of their names, in the same 
+order as in the model file.
+    """
+    C = []
+    for c in model.connections:
+        if c.len == 2:
+            C.append((c.frm.name, c.to.name))
+        else:
+            C.append((c.mod.name, c.frm.name, c.to.name))
+    return {'vois' : model.vois, 'inputs' : model.inputs,
+            'te' : model.te, 'connections' : C}
+
+
+def record_to_model(record, name="Model1"):
+    """
+Rebuilds a model from a record created by model_to_record().
+    """
+    V = record['vois']
+    I = record['inputs']
+    C = [parseConnectivity(" -> ".join(x), vois=V, inputs=I)
+         for x in record['connections']]
+    return Model(vois=V, inputs=I, te=record['te'], connections=C,
+                 name=name)
+
+
+def parse_text(text, name="Model1"):
+    """
+Parses the content of a model file (as a string).
+    """
     V = [] # VOIs
     I = [] # Inputs
     C = [] # Connectivity
     TE = 0.021
 
-    f = open(fileName, 'r')
-    for line in f.readlines():
+    for line in text.split('\n'):
         line=line.strip()
  
         if '#' in line:
@@ -397,146 +540,518 @@ an abstract representation of the model.
     #print C
     return Model(vois=V, inputs=I, te=TE, connections=C, name=name)
 
-def model_to_matlab(model):
+def matlab_code(model):
     """
 Transforms an internal representation of a model into Matlab code
-that can be used in an SPM script.
+that can be used in an SPM script, and returns it as a string.
     """
     w = model.base
     p = model.participant
     f = model.dcmFolder
 
-    # Starts printing code on STOUT
-    print("\n% " + "-" * 66 +" %")
-    print("%% DCM Model (%s) for Subject %s" % (model.name, model.participant))
-    print("% " + "-" * 66 +" %\n")
-    print("clear DCM;")
-    print("load(fullfile('%s', '%s', '%s', 'SPM.mat'));" %
-          (w, p, f))
+    L = []   # Lines of code
+
+    L.append("\n% " + "-" * 66 +" %")
+    L.append("%% DCM Model (%s) for Subject %s" % (model.name, model.participant))
+    L.append("% " + "-" * 66 +" %\n")
+    L.append("clear DCM;")
+    L.append("load(fullfile('%s', '%s', '%s', 'SPM.mat'));" %
+             (w, p, f))
 
     # Loads the VOIs
-    print("\n% --- The VOIs " + '-' * 53 + " %")
+    L.append("\n% --- The VOIs " + '-' * 53 + " %")
     for i in range(len(model.vois)):
-        print("load(fullfile('%s', '%s', '%s', 'VOI_%s_1.mat'), 'xY');" %
-              (w, p, f, model.vois[i]))
-        print("DCM.xY(%d) = xY;\n" % (i+1))
+        L.append("load(fullfile('%s', '%s', '%s', 'VOI_%s_1.mat'), 'xY');" %
+                 (w, p, f, model.vois[i]))
+        L.append("DCM.xY(%d) = xY;\n" % (i+1))
     
     # Basic initialization in Matlab
 
-    print("DCM.n = length(DCM.xY); % Num of regions")
-    print("DCM.v = length(DCM.xY(1).u); % Num of time points")
-    print("DCM.Y.dt  = SPM.xY.RT;")
-    print("DCM.Y.X0  = DCM.xY(1).X0;")
-    print("for i = 1:DCM.n")
-    print("    DCM.Y.y(:,i)  = DCM.xY(i).u;")
-    print("    DCM.Y.name{i} = DCM.xY(i).name;")
-    print("end\n")
+    L.append("DCM.n = length(DCM.xY); % Num of regions")
+    L.append("DCM.v = length(DCM.xY(1).u); % Num of time points")
+    L.append("DCM.Y.dt  = SPM.xY.RT;")
+    L.append("DCM.Y.X0  = DCM.xY(1).X0;")
+    L.append("for i = 1:DCM.n")
+    L.append("    DCM.Y.y(:,i)  = DCM.xY(i).u;")
+    L.append("    DCM.Y.name{i} = DCM.xY(i).name;")
+    L.append("end\n")
 
-    print("DCM.Y.Q    = spm_Ce(ones(1,DCM.n)*DCM.v);")
-    print("DCM.U.dt   = SPM.Sess.U(1).dt;")
+    L.append("DCM.Y.Q    = spm_Ce(ones(1,DCM.n)*DCM.v);")
+    L.append("DCM.U.dt   = SPM.Sess.U(1).dt;")
 
     # Now, calculate which inputs are used:
 
-    U = [x.name for x in m.InputsUsed()]
-    U = [m.inputs.index(x)+1 for x in U]
+    U = [x.name for x in model.InputsUsed()]
+    U = [model.inputs.index(x)+1 for x in U]
     U.sort()
 
     if len(U) == 1:
-        print("DCM.U.name = [SPM.Sess.U(%d).name];" % U[0])
+        L.append("DCM.U.name = [SPM.Sess.U(%d).name];" % U[0])
     elif len(U) > 1:
-        print("DCM.U.name = [SPM.Sess.U(%d).name ..." % U[0])
+        L.append("DCM.U.name = [SPM.Sess.U(%d).name ..." % U[0])
         for j in U[1:-1]:
-            print("              SPM.Sess.U(%d).name ..." % j)
-        print("              SPM.Sess.U(%d).name];" % U[-1])
+            L.append("              SPM.Sess.U(%d).name ..." % j)
+        L.append("              SPM.Sess.U(%d).name];" % U[-1])
     else:
         raise Exception("Fatal Error: Not enough inputs in model %s" % model.name)
 
     # The Inputs 
 
-    print("\n% --- The Inputs " + '-' * 51 + " %\n")
+    L.append("\n% --- The Inputs " + '-' * 51 + " %\n")
 
     # The time series for each input seem to contain 32 time points more than
     # needed (possibly one TR in 16-bin of microtime???). At any rate, it needs
     # to be accounted for in the Matlab code.
 
     if len(U) == 1:
-        print("DCM.U.u    = [SPM.Sess.U(%d).u(33:end,1)];" % U[0])
+        L.append("DCM.U.u    = [SPM.Sess.U(%d).u(33:end,1)];" % U[0])
     elif len(U) > 1:
-        print("DCM.U.u    = [SPM.Sess.U(%d).u(33:end,1) ..." % U[0])
+        L.append("DCM.U.u    = [SPM.Sess.U(%d).u(33:end,1) ..." % U[0])
         for j in U[1:-1]:
-            print("              SPM.Sess.U(%d).u(33:end,1) ... " % j)
-        print("              SPM.Sess.U(%d).u(33:end,1)];" % U[-1])
+            L.append("              SPM.Sess.U(%d).u(33:end,1) ... " % j)
+        L.append("              SPM.Sess.U(%d).u(33:end,1)];" % U[-1])
     else:
         raise Exception("Fatal Error: Not enough inputs in model %s" % model.name)
 
     # Set delays and TE
-    print("\n% Set delays and TE (TE should be gotten from SPM?)\n")
-    print("DCM.delays = repmat(SPM.xY.RT,%d,1);" % len(model.vois))
-    print("DCM.TE     = %.3f;" % model.te)
+    L.append("\n% Set delays and TE (TE should be gotten from SPM?)\n")
+    L.append("DCM.delays = repmat(SPM.xY.RT,%d,1);" % len(model.vois))
+    L.append("DCM.TE     = %.3f;" % model.te)
 
     # Set other options
     if model.IsNonlinear():
-        print("DCM.options.nonlinear  = 1;")
+        L.append("DCM.options.nonlinear  = 1;")
     else:
-        print("DCM.options.nonlinear  = 0;")
+        L.append("DCM.options.nonlinear  = 0;")
         
-    print("DCM.options.two_state  = 0;")
-    print("DCM.options.stochastic = 0;")
-    print("DCM.options.centre = 0;")
-    print("DCM.options.nograph    = 1;")
+    L.append("DCM.options.two_state  = 0;")
+    L.append("DCM.options.stochastic = 0;")
+    L.append("DCM.options.centre = 0;")
+    L.append("DCM.options.nograph    = 1;")
 
     # The Matrices:
-    print("\n% --- The Matrices " + '-' * 49 + " %")
+    L.append("\n% --- The Matrices " + '-' * 49 + " %")
  
     # Matrix A
-    print("\nDCM.a = eye(%d,%d);" % (len(model.vois), len(model.vois)))
-    A = copy.copy(model.connections)
-    A = [x for x in A if x.matrix == 'a']
+    L.append("\nDCM.a = eye(%d,%d);" % (len(model.vois), len(model.vois)))
+    A = model.Connections('a')
     for a in A:
-        print(a)
+        L.append(str(a))
     
     # Matrix B
-    print("\nDCM.b = zeros(%d,%d,%d);" % (len(model.vois), len(model.vois), len(model.InputsUsed())))
-    B = copy.copy(model.connections)
-    B = [x for x in B if x.matrix == 'b']
+    L.append("\nDCM.b = zeros(%d,%d,%d);" % (len(model.vois), len(model.vois), len(model.InputsUsed())))
+    B = model.Connections('b')
     for b in B:
-        print(b)
+        L.append(str(b))
 
     # Matrix C
-    print("\nDCM.c = zeros(%d,%d);" % (len(model.vois), len(model.InputsUsed())))
-    C = copy.copy(model.connections)
-    C = [x for x in C if x.matrix == 'c']
+    L.append("\nDCM.c = zeros(%d,%d);" % (len(model.vois), len(model.InputsUsed())))
+    C = model.Connections('c')
     for c in C:
-        print(c)
+        L.append(str(c))
 
     # Matrix D
-    print("\nDCM.d = zeros(%d,%d,%d);" % (len(model.vois), len(model.vois), len(model.vois)))
-    D = copy.copy(model.connections)
-    D = [x for x in D if x.matrix == 'd']
+    L.append("\nDCM.d = zeros(%d,%d,%d);" % (len(model.vois), len(model.vois), len(model.vois)))
+    D = model.Connections('d')
     for d in D:
-        print(d)
+        L.append(str(d))
 
     # Saving and Estimating
-    print("\n% --- Saving and estimating " + '-' * 40 + " %\n")
-    print("save(fullfile('%s', '%s', '%s', 'DCM_%s.mat'));" %
-          (w, p, f, model.name))
-    print("disp('Estimating model %s for subject %s');" % (model.name, p))
-    print("spm_dcm_estimate(fullfile('%s', '%s', '%s', 'DCM_%s.mat'));" %
-          (w, p, f, model.name))
+    L.append("\n% --- Saving and estimating " + '-' * 40 + " %\n")
+    L.append("save(fullfile('%s', '%s', '%s', 'DCM_%s.mat'));" %
+             (w, p, f, model.name))
+    L.append("disp('Estimating model %s for subject %s');" % (model.name, p))
+    L.append("spm_dcm_estimate(fullfile('%s', '%s', '%s', 'DCM_%s.mat'));" %
+             (w, p, f, model.name))
+
+    return "\n".join(L) + "\n"
+
+
+class MatlabTemplate(object):
+    """
+The Matlab code of a model, compiled once and then stamped for each
+participant. Only the participant's name changes between subjects,
+so the code is rendered with a placeholder and split around it; 
+stamping a participant is then a single join().
+    """
+    PLACEHOLDER = "\0PARTICIPANT\0"
+
+    def __init__(self, model):
+        self.name = model.name
+        self.base = model.base
+        self.dcmFolder = model.dcmFolder
+        participant = model.participant
+        model.participant = MatlabTemplate.PLACEHOLDER
+        try:
+            self.pieces = matlab_code(model).split(MatlabTemplate.PLACEHOLDER)
+        finally:
+            model.participant = participant
+
+    def Stamp(self, participant):
+        return participant.join(self.pieces)
+
+
+def compile_matlab(model):
+    """
+Compiles the Matlab code of a model into a template that can be
+stamped for each participant (see MatlabTemplate).
+    """
+    return MatlabTemplate(model)
+
+
+def model_to_matlab(model, out=sys.stdout, template=None):
+    """
+Transforms an internal representation of a model into Matlab code
+that can be used in an SPM script. The code is written on 'out'
+(by default, the standard output). If a compiled 'template' is 
+given, it is used instead of rendering the code from scratch.
+    """
+    if template is None:
+        template = compile_matlab(model)
+    out.write(template.Stamp(model.participant))
+
+
+def model_to_arrays(model):
+    """
+Builds the DCM connectivity matrices 'a', 'b', 'c', and 'd' of a
+(checked) model as NumPy arrays, with the same shape and content as
+the ones created by the Matlab code. Indexes are 1-based in the 
+model and 0-based in the arrays.
+    """
+    import numpy as np
+
+    nv = len(model.vois)
+    nu = len(model.InputsUsed())
+
+    arrays = {'a' : np.eye(nv, nv),
+              'b' : np.zeros((nv, nv, nu)),
+              'c' : np.zeros((nv, nu)),
+              'd' : np.zeros((nv, nv, nv))}
+
+    for x in model.connections:
+        if x.len == 2:
+            arrays[x.matrix][x.to.index - 1, x.frm.index - 1] = 1
+        else:
+            arrays[x.matrix][x.to.index - 1, x.frm.index - 1, x.mod.index - 1] = 1
+
+    return arrays
+
+
+def model_to_struct(model):
+    """
+Returns the subject-independent part of the DCM structure set by the
+Matlab code (the 'a', 'b', 'c', and 'd' matrices, TE, and options),
+as a dictionary (see subject_to_struct for the rest).
+    """
+    dcm = model_to_arrays(model)
+    dcm['TE'] = float("%.3f" % model.te)
+    dcm['options'] = {'nonlinear'  : float(model.IsNonlinear()),
+                      'two_state'  : 0.0,
+                      'stochastic' : 0.0,
+                      'centre'     : 0.0,
+                      'nograph'    : 1.0}
+    return dcm
+
+
+def input_indices(model):
+    """
+Returns the sorted (1-based) indices, in SPM.Sess.U, of the inputs
+used by a model, as in the Matlab code.
+    """
+    return sorted(model.inputs.index(x.name) + 1 for x in model.InputsUsed())
+
+
+def mat_string(value):
+    """
+Returns the string inside a Matlab string or cell loaded by
+scipy.io.loadmat (which wraps them in nested arrays).
+    """
+    while not isinstance(value, str):
+        value = value.flat[0]
+    return value
+
+
+def spm_ce(n, v):
+    """
+Returns the error components of spm_Ce(ones(1, n) * v): one sparse
+(n * v) x (n * v) matrix per region, with ones on the diagonal of
+the region's block, as a (1, n) cell array.
+    """
+    import numpy as np
+    import scipy.sparse
+
+    Q = np.empty((1, n), dtype=object)
+    for i in range(n):
+        d = np.zeros(n * v)
+        d[i * v:(i + 1) * v] = 1
+        Q[0, i] = scipy.sparse.diags(d, format='csc')
+    return Q
+
+
+def subject_to_struct(model, subj, spec=None):
+    """
+Returns the complete DCM structure of a model for a subject, as
+created by the Matlab code: the subject's SPM.mat and VOI_<voi>_1.mat
+files (in <base>/<subj>/<dcm_dir>) give the VOIs (xY, Y, n, v), the
+inputs (U), and the delays. 'spec' is the result of model_to_struct
+(computed if not given).
+    """
+    import numpy as np
+    import scipy.io
+    import scipy.sparse
+
+    folder = os.path.join(model.base, subj, model.dcmFolder)
+    if spec is None:
+        spec = model_to_struct(model)
+
+    SPM = scipy.io.loadmat(os.path.join(folder, "SPM.mat"))['SPM'][0, 0]
+    RT = float(SPM['xY'][0, 0]['RT'].flat[0])
+    U = SPM['Sess'].flat[0]['U']
+
+    xY = np.concatenate([scipy.io.loadmat(os.path.join(folder, "VOI_%s_1.mat" % voi))['xY']
+                         for voi in model.vois], axis=1)
+    n = xY.shape[1]
+    v = len(xY[0, 0]['u'])
+
+    names = np.empty((1, n), dtype=object)
+    for i in range(n):
+        names[0, i] = mat_string(xY[0, i]['name'])
+    Y = {'dt' : RT,
+         'X0' : xY[0, 0]['X0'],
+         'y'  : np.column_stack([xY[0, i]['u'].ravel() for i in range(n)]),
+         'name' : names,
+         'Q'  : spm_ce(n, v)}
+
+    # The time series of the inputs have 32 more time points than
+    # needed (see matlab_code)
+    idx = input_indices(model)
+    if len(idx) == 0:
+        raise Exception("Fatal Error: Not enough inputs in model %s" % model.name)
+    inputs = [U.flat[j - 1] for j in idx]
+    columns = []
+    unames = np.empty((1, len(idx)), dtype=object)
+    for k, x in enumerate(inputs):
+        u = x['u']
+        u = u.toarray() if scipy.sparse.issparse(u) else np.asarray(u)
+        columns.append(u[32:, 0])
+        unames[0, k] = mat_string(x['name'])
+
+    dcm = {'xY' : xY,
+           'n'  : float(n),
+           'v'  : float(v),
+           'Y'  : Y,
+           'U'  : {'dt' : float(U.flat[0]['dt'].flat[0]),
+                   'name' : unames,
+                   'u' : np.column_stack(columns)},
+           'delays' : np.full((n, 1), RT)}
+    dcm.update(spec)
+    return dcm
+
+
+def export_mat(model, subjects, outDir):
+    """
+Writes the DCM structure of a model for all the given subjects, in
+files named <model>_<subj>.mat, ready for spm_dcm_estimate (see
+subject_to_struct). The subject-independent part of the structure is
+built only once. Returns the list of files that have been written.
+    """
+    import scipy.io
+
+    spec = model_to_struct(model)
+    written = []
+    for subj in subjects:
+        path = os.path.join(outDir, "%s_%s.mat" % (model.name, subj))
+        scipy.io.savemat(path, {'DCM' : subject_to_struct(model, subj, spec)},
+                         oned_as='column')
+        written.append(path)
+
+    return written
+
+
+def read_subjects(fileName):
+    """
+Reads a subject manifest, i.e. a text file with one subject folder
+per line. Empty lines and comments (starting with '#') are ignored.
+    """
+    subjects = []
+    f = open(fileName, 'r')
+    for line in f.readlines():
+        if '#' in line:
+            line = line[0:line.find('#')]
+        line = line.strip()
+        if len(line) > 0:
+            subjects.append(line)
+    f.close()
+    return subjects
+
+
+def expand_model_files(patterns):
+    """
+Expands a list of file names and glob patterns into a sorted list
+of model files (each file appearing only once).
+    """
+    files = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern))
+        if len(matches) == 0:
+            raise Exception("No model file matches: %s" % pattern)
+        files += [x for x in matches if x not in files]
+    return files
+
+
+def shard_subjects(subjects, shardSize):
+    """
+Splits the list of subjects into consecutive shards of 'shardSize'
+subjects each. A shard size of 0 returns a single shard.
+    """
+    if shardSize <= 0:
+        return [subjects]
+    return [subjects[i:i+shardSize] for i in range(0, len(subjects), shardSize)]
+
+
+def generate_batch(modelFile, dcmFolder, subjects, outDir, base,
+                   shardSize=1, exportMat=False, cacheDir=None):
+    """
+Parses a model file once and writes the Matlab code for all the
+subjects in 'outDir', one script per shard of subjects. If 
+'exportMat' is True, the DCM specification of each subject is also
+saved as a .mat file (see export_mat). Parsed models are cached in 
+'cacheDir', if given (see parse_file). Returns the list of files
+that have been written.
+    """
+    m = parse_file(modelFile, cacheDir=cacheDir)
+    m.Check()
+    m.base = base
+    m.dcmFolder = dcmFolder
+    template = compile_matlab(m)
+
+    shards = shard_subjects(subjects, shardSize)
+    written = []
+    for k, shard in enumerate(shards):
+        if shardSize == 1:
+            fileName = "%s_%s.m" % (m.name, shard[0])
+        elif len(shards) == 1:
+            fileName = "%s.m" % m.name
+        else:
+            fileName = "%s_shard%03d.m" % (m.name, k + 1)
+
+        path = os.path.join(outDir, fileName)
+        out = open(path, 'w', buffering=1 << 16)
+        for i, subj in enumerate(shard):
+            if i > 0:
+                # Same separator used when printing on STDOUT
+                out.write("\n\n")
+            out.write(template.Stamp(subj))
+        out.close()
+        written.append(path)
+
+    if exportMat:
+        written += export_mat(m, subjects, outDir)
+
+    return written
+
+
+def _generate_batch_job(args):
+    # Unpacks the arguments for multiprocessing's map()
+    return generate_batch(*args)
+
+
+def batch_main(argv):
+    """
+Runs the batch mode from the command line arguments (without the
+leading '--batch' flag).
+    """
+    opts, args = getopt.getopt(argv, "j:s:mc:")
+    opts = dict(opts)
+    workers = int(opts.get("-j", 1))
+    shardSize = int(opts.get("-s", 1))
+    exportMat = "-m" in opts
+    cacheDir = opts.get("-c", None)
+
+    if len(args) < 4:
+        print(HLP_MSG)
+        return
+
+    dcmFolder, subjectFile, outDir = args[0:3]
+    modelFiles = expand_model_files(args[3:])
+    subjects = read_subjects(subjectFile)
+
+    if not os.path.isdir(outDir):
+        os.makedirs(outDir)
+
+    jobs = [(x, dcmFolder, subjects, outDir, os.getcwd(), shardSize,
+             exportMat, cacheDir) for x in modelFiles]
+
+    if workers > 1 and len(jobs) > 1:
+        pool = multiprocessing.Pool(min(workers, len(jobs)))
+        results = pool.map(_generate_batch_job, jobs)
+        pool.close()
+        pool.join()
+    else:
+        results = [_generate_batch_job(x) for x in jobs]
+
+    for modelFile, written in zip(modelFiles, results):
+        print("%s: %d file(s) written" % (modelFile, len(written)),
+              file=sys.stderr)
+
+
+def benchmark_main(argv):
+    """
+Times the per-subject emission cost of the Matlab code for a model,
+rendering each subject from scratch vs. stamping a compiled template.
+    """
+    if len(argv) < 1:
+        print(HLP_MSG)
+        return
+
+    m = parse_file(argv[0])
+    m.Check()
+    m.base = os.getcwd()
+    m.dcmFolder = "dcm_results"
+    sizes = [int(x) for x in argv[1:]] or [1000, 10000]
+
+    for n in sizes:
+        subjects = ["%06d" % (100000 + i) for i in range(n)]
+
+        out = io.StringIO()
+        t0 = time.perf_counter()
+        for subj in subjects:
+            m.participant = subj
+            out.write(matlab_code(m))
+        rendered = time.perf_counter() - t0
+        reference = out.getvalue()
+
+        out = io.StringIO()
+        t0 = time.perf_counter()
+        template = compile_matlab(m)
+        for subj in subjects:
+            out.write(template.Stamp(subj))
+        stamped = time.perf_counter() - t0
+
+        if out.getvalue() != reference:
+            raise Exception("Template output differs from rendered code")
+
+        print("%6d subjects: rendered %8.2f us/subj, stamped %8.2f us/subj (%.1fx)" %
+              (n, 1e6 * rendered / n, 1e6 * stamped / n, rendered / stamped))
 
 
 if __name__ == "__main__":
-    if len(sys.argv) < 3:
+    if len(sys.argv) > 1 and sys.argv[1] == "--batch":
+        batch_main(sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == "--benchmark":
+        benchmark_main(sys.argv[2:])
+    elif len(sys.argv) < 3:
         print(HLP_MSG)
     else:
         m=parse_file(sys.argv[1])
         m.Check()
         m.base = os.getcwd()
         m.dcmFolder = sys.argv[2]
+        template = compile_matlab(m)
         for subj in sys.argv[3:-1]:
             m.participant=subj
-            model_to_matlab(m)
+            model_to_matlab(m, template=template)
             print("\n")
         # The last one is ran aside to prevent the trailing "\n"
         m.participant=sys.argv[-1]
-        model_to_matlab(m)
+        model_to_matlab(m, template=template)
@@ -3,47 +3,151 @@
 import nilearn
 from nilearn import plotting
 from matplotlib.pyplot import cm
-from matplotlib.colors import to_rgba
+from matplotlib.colors import to_rgba, LinearSegmentedColormap
 import numpy
 from numpy import linspace
 import sys
+import getopt
+
+from voi_coords import read_xyz
 
 
 HLP_MSG="""
 Usage
 -----
-  $ dcm-plot-vois.sh <voi_xyz_1> <voi_xyz_2> .. <voi_xyz_M>
+  $ dcm-plot-vois.sh [-o <out_file>] [-m <mode>] [-s <size>] [-r <dpi>]
+                     [-b <bins>] <voi_xyz_1> <voi_xyz_2> .. <voi_xyz_M>
 
 Where:
-   
+
   <voi_xyz_X> is the text file containing the subject-by-subject
     coordinates of each voi, as returned by the extract-voi-data.sh
     script.
-
-The script will generate a single PNG file, named 'vois.png', with 
-the position of each individual VOI coordinate marked inside a glass 
+  <out_file> is the name of the image (default is 'vois.png').
+  <mode> is 'markers' (one marker per subject), 'density' (a 2D
+    histogram of the coordinates of each VOI, for very large numbers
+    of subjects), or 'auto' (the default: markers, unless a VOI has
+    more than 2000 subjects).
+  <size> is the size of the markers (default depends on the number
+    of subjects).
+  <dpi> is the resolution of the image (default is 300).
+  <bins> is the width of the bins of the density maps, in mm
+    (default is 2).
+
+The script will generate a single PNG file, named 'vois.png', with
+the position of each individual VOI coordinate marked inside a glass
 brain. Each VOI will be marked in a different color.
+
+The coordinates of all VOIs are projected on each view of the glass
+brain at once, and each VOI is drawn as a single scatter collection
+(or density image) per view.
 """
 
+# Number of subjects above which the 'auto' mode draws densities
+DENSITY_N = 2000
+
+# Index of the coordinate that is projected out in each view
+DIRECTIONS = {'x' : 0, 'y' : 1, 'z' : 2, 'l' : 0, 'r' : 0}
+
+
+def marker_size(N):
+    """
+    Calculates the proper size of the markers for the largest
+    number of subjects N
+    """
+    if N < 20:
+        return 50
+    elif N < 50:
+        return 25
+    else:
+        return 10
+
+
+def project(coords, direction):
+    """
+    Projects (n, 3) coordinates on the view of a direction. Returns
+    the (n, 2) coordinates and a mask of those that are visible
+    (only one hemisphere is visible in the 'l' and 'r' views).
+    """
+    index = DIRECTIONS[direction]
+    dims = [i for i in range(3) if i != index]
+    visible = numpy.ones(len(coords), dtype=bool)
+    if direction == 'l':
+        visible = coords[:, 0] <= 0
+    elif direction == 'r':
+        visible = coords[:, 0] >= 0
+    return coords[:, dims], visible
+
+
+def draw_markers(display, coords, labels, cols, msize, marker="+"):
+    """
+    Draws the (n, 3) coordinates on each view of a display, with one
+    scatter collection per VOI (labels are the VOI index of each
+    coordinate).
+    """
+    for display_ax in display.axes.values():
+        ax = display_ax.ax
+        xlim = ax.get_xlim()
+        ylim = ax.get_ylim()
+        xy, visible = project(coords, display_ax.direction)
+        for i in range(len(cols)):
+            sel = visible & (labels == i)
+            ax.scatter(xy[sel, 0], xy[sel, 1], s=msize,
+                       color=cols[i], marker=marker,
+                       zorder=1000, rasterized=True)
+
+        # Markers must not change the view (as in add_markers)
+        ax.set_xlim(xlim)
+        ax.set_ylim(ylim)
+
+
+def draw_density(display, coords, labels, cols, binwidth=2.0):
+    """
+    Draws, on each view of a display, the density of the (n, 3)
+    coordinates of each VOI as a 2D histogram, with the VOI's color
+    and an opacity proportional to the density.
+    """
+    for display_ax in display.axes.values():
+        ax = display_ax.ax
+        view = (ax.get_xlim(), ax.get_ylim())
+        xlim, ylim = sorted(view[0]), sorted(view[1])
+        xbins = numpy.arange(xlim[0], xlim[1] + binwidth, binwidth)
+        ybins = numpy.arange(ylim[0], ylim[1] + binwidth, binwidth)
+        xy, visible = project(coords, display_ax.direction)
+
+        for i, c in enumerate(cols):
+            sel = visible & (labels == i)
+            if not numpy.any(sel):
+                continue
+            H, _, _ = numpy.histogram2d(xy[sel, 0], xy[sel, 1], bins=[xbins, ybins])
+            H = numpy.ma.masked_equal(H.T / H.max(), 0)
+            cmap = LinearSegmentedColormap.from_list(
+                "voi%d" % i, [c[0:3] + [0.0], c[0:3] + [min(1.0, 2 * c[3])]])
+            ax.imshow(H, cmap=cmap, vmin=0, vmax=1, origin="lower",
+                      extent=(xbins[0], xbins[-1], ybins[0], ybins[-1]),
+                      interpolation="nearest", zorder=1000)
+        # imshow widens the limits to the bins: restores the view
+        ax.set_xlim(view[0])
+        ax.set_ylim(view[1])
+
+
 if __name__ == "__main__":
+    opts, args = getopt.getopt(sys.argv[1:], "o:m:s:r:b:")
+    opts = dict(opts)
 
-    if len(sys.argv[1:]) == 0:
+    if len(args) == 0:
         print(HLP_MSG)
     else:
         vois = {}
-        for filename in sys.argv[1:]:
-    
+        for filename in args:
+
             # Opens file and extract MNI coordinates
             # ----------------------------------------------------------
-    
-            f = open(filename, "r")
-            tokens = [line.split() for line in f.readlines()[1:]]
-            coords = [x[2:5] for x in tokens]
-            mni = [[float(y) for y in x] for x in coords]
-            name = tokens[0][1]
-            vois[name] = mni
-
-    
+
+            subjects, names, values = read_xyz(filename)
+            vois[names[0]] = values[:, 0:3]
+
+
         #cols = cm.tab10(linspace(0,1,len(vois.keys())))
         #cols = cm.rainbow(linspace(0,1,len(vois.keys())))
         #cols = cm.brg(linspace(0,1,len(vois.keys())))
@@ -51,39 +155,40 @@ if __name__ == "__main__":
 
         # Adds transparency
         # ----------------------------------------------------------
-        
+
         for c in cols:
             c[3] = 0.5  # Sets alpha
-            
-            
+
+
         # Plots and saves
         # ----------------------------------------------------------
-            
+
+        # All coordinates in a single array, with the index of their VOI
+        names = sorted(vois.keys())
+        coords = numpy.concatenate([vois[v] for v in names])
+        labels = numpy.repeat(numpy.arange(len(names)), [len(vois[v]) for v in names])
+        cols = [cols[i % len(cols)] for i in range(len(names))]
+
         # Calculates the proper size of the marker
-        L = [len(vois[x]) for x in vois.keys()]
+        L = [len(vois[x]) for x in names]
         N = numpy.max(L)
-        
-        msize = 100
-
-        if N < 20:
-            msize = 50
-        elif N < 50:
-            msize = 25
-        elif N < 100:
-            msize = 10
-        else:
-            msize = 10
+        msize = float(opts.get("-s", marker_size(N)))
 
-        print("L=%s, N=%s, msize=%d" % (L, N, msize))
+        mode = opts.get("-m", "auto")
+        if mode == "auto":
+            mode = "density" if N > DENSITY_N else "markers"
+
+        print("L=%s, N=%s, msize=%d, mode=%s" % (L, N, msize, mode))
 
 
         display=plotting.plot_glass_brain(None)
-        for i, v in enumerate(sorted(vois.keys())):
-            display.add_markers(vois[v], marker_color=cols[i],
-                                marker_size=msize, marker="+")
+        if mode == "density":
+            draw_density(display, coords, labels, cols, float(opts.get("-b", 2.0)))
+        else:
+            draw_markers(display, coords, labels, cols, msize)
 
-        display.savefig("vois.png", dpi=300)
+        display.savefig(opts.get("-o", "vois.png"), dpi=int(opts.get("-r", 300)))
         display.close()
 
 
-# End 
+# End
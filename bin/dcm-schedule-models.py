@@ -0,0 +1,321 @@
+#!/usr/bin/env python
+# ------------------------------------------------------------------ #
+# Splits the estimation of a DCM model space (models x subjects) into
+# balanced shards of Matlab code, and runs them locally across a pool
+# of Matlab processes, resuming unfinished jobs after a crash.
+#
+# --- History ------------------------------------------------------ #
+#
+# 2026-10-18 : * File created.
+# ------------------------------------------------------------------ #
+
+HLP_MSG="""
+Usage
+-----
+  $ dcm-schedule-models.py [-n <shards>] [-c <cache_dir>] <dcm_dir>
+                           <subject_file> <out_dir>
+                           <model_file|pattern> ...
+
+  $ dcm-schedule-models.py --run [-j <workers>] [-m <command>]
+                           [-c <cache_dir>] <out_dir>
+
+Where:
+
+  <dcm_dir>, <subject_file>, <model_file|pattern>, and <cache_dir>
+    are the same as in 'dcm-generate-models.py --batch'.
+  <out_dir> is the folder where the shards (shard_<K>.m) and the
+    manifest (manifest.json) are written.
+  <shards> is the number of shards (default is 8).
+  <workers> is the number of Matlab processes that are run in
+    parallel (default is the number of shards).
+  <command> is the command used to run a Matlab script, with '%s'
+    standing for the script's path (default is:
+    matlab -nodisplay -nosplash -batch "run('%s')")
+
+Scheduling
+----------
+Each job estimates one model for one subject. The jobs of a subject
+are kept together (in the order of the models), so each subject's
+SPM.mat and VOI files are only used by one shard, and the subjects
+are assigned to shards so that the total expected cost of each shard
+is balanced: the cost of a job is the number of connections of the
+model (plus its self-connections), doubled for nonlinear models
+(i.e., models with a 'd' matrix). Within a shard, the subjects with
+the most expensive jobs come first.
+
+Running
+-------
+In '--run' mode, the manifest is read, and a job is considered done
+when its DCM_<model>.mat file exists and contains an estimated DCM
+(i.e., a DCM with a free energy 'F'). The unfinished jobs of each
+shard are written in <out_dir>/pending/shard_<K>.m, and the pending
+shards are run in parallel. Running the same command again after a
+crash resumes only the unfinished jobs.
+"""
+
+import sys, os, json, getopt, heapq, shlex, subprocess
+import importlib.util
+import multiprocessing.pool
+
+MATLAB_CMD = "matlab -nodisplay -nosplash -batch \"run('%s')\""
+
+NONLINEAR_FACTOR = 2
+
+
+def load_generator():
+    """
+Loads 'dcm-generate-models.py' (whose name is not a valid module
+name) from the same folder as this script.
+    """
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        "dcm-generate-models.py")
+    spec = importlib.util.spec_from_file_location("dcm_generate_models", path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+gen = load_generator()
+
+
+def expected_cost(model):
+    """
+Returns the expected (relative) cost of estimating a model.
+    """
+    cost = len(model.connections) + len(model.vois)
+    if model.IsNonlinear():
+        cost *= NONLINEAR_FACTOR
+    return cost
+
+
+def balance_jobs(jobs, nshards):
+    """
+Assigns jobs (dictionaries with 'Subject', 'Model', and 'Cost' keys)
+to 'nshards' shards, keeping all the jobs of a subject together. The
+groups of jobs of each subject are balanced with the Longest
+Processing Time rule: groups are taken in order of decreasing total
+cost, and each is given to the least loaded shard. Within a group,
+jobs are ordered by model. Sets the 'Shard' key of each job
+(1-based) and returns the shards as lists of jobs.
+    """
+    groups = {}
+    for job in jobs:
+        groups.setdefault(job['Subject'], []).append(job)
+    for group in groups.values():
+        group.sort(key=lambda x: x['Model'])
+    order = sorted(groups.items(), key=lambda x: (-sum(j['Cost'] for j in x[1]), x[0]))
+
+    nshards = max(1, min(nshards, len(groups)))
+    heap = [(0, k) for k in range(nshards)]
+    shards = [[] for k in range(nshards)]
+    for subj, group in order:
+        load, k = heapq.heappop(heap)
+        for job in group:
+            job['Shard'] = k + 1
+        shards[k] += group
+        heapq.heappush(heap, (load + sum(j['Cost'] for j in group), k))
+    return shards
+
+
+def shard_name(k):
+    return "shard_%03d.m" % k
+
+
+def write_shard(path, jobs, models):
+    """
+Writes the Matlab code of the given jobs in a single script.
+    """
+    out = open(path, 'w', buffering=1 << 16)
+    for i, job in enumerate(jobs):
+        if i > 0:
+            out.write("\n\n")
+        out.write(models[job['ModelFile']].Stamp(job['Subject']))
+    out.close()
+
+
+def compile_models(modelFiles, dcmFolder, base, cacheDir=None):
+    """
+Parses each model file once and returns a dictionary of parsed
+models and one of compiled Matlab templates, indexed by the
+absolute path of each file.
+    """
+    parsed = {}
+    templates = {}
+    for modelFile in modelFiles:
+        m = gen.parse_file(modelFile, cacheDir=cacheDir)
+        m.Check()
+        m.base = base
+        m.dcmFolder = dcmFolder
+        key = os.path.abspath(modelFile)
+        parsed[key] = m
+        templates[key] = gen.compile_matlab(m)
+    return parsed, templates
+
+
+def schedule(modelFiles, dcmFolder, subjects, outDir, base, nshards=8,
+             cacheDir=None):
+    """
+Creates the jobs for all models and subjects, writes them as
+balanced shards in 'outDir', together with a manifest, and returns
+the manifest.
+    """
+    parsed, templates = compile_models(modelFiles, dcmFolder, base,
+                                       cacheDir=cacheDir)
+    jobs = []
+    for modelFile in modelFiles:
+        m = parsed[os.path.abspath(modelFile)]
+        cost = expected_cost(m)
+        for subj in subjects:
+            output = os.path.join(base, subj, dcmFolder, "DCM_%s.mat" % m.name)
+            jobs.append({'Subject' : subj,
+                         'Model' : m.name,
+                         'ModelFile' : os.path.abspath(modelFile),
+                         'Nonlinear' : m.IsNonlinear(),
+                         'Cost' : cost,
+                         'Output' : output})
+
+    shards = balance_jobs(jobs, nshards)
+    for k, shard in enumerate(shards):
+        write_shard(os.path.join(outDir, shard_name(k + 1)), shard, templates)
+
+    manifest = {'base' : base,
+                'dcm_dir' : dcmFolder,
+                'shards' : len(shards),
+                'jobs' : [job for shard in shards for job in shard]}
+
+    f = open(os.path.join(outDir, "manifest.json"), 'w')
+    json.dump(manifest, f, indent=1)
+    f.close()
+    return manifest
+
+
+def is_estimated(path):
+    """
+Checks whether a DCM file exists and contains an estimated model.
+    """
+    if not os.path.exists(path):
+        return False
+
+    import scipy.io
+    try:
+        mat = scipy.io.loadmat(path, variable_names=['DCM'],
+                               squeeze_me=True, struct_as_record=False)
+    except NotImplementedError:
+        # Matlab v7.3 files are HDF5 files, which SciPy cannot read
+        try:
+            import h5py
+        except ImportError:
+            raise Exception("%s is a Matlab v7.3 (HDF5) file: h5py is needed "
+                            "to check whether it is estimated" % path)
+        f = h5py.File(path, 'r')
+        done = 'DCM' in f and 'F' in f['DCM']
+        f.close()
+        return done
+    except Exception:
+        # Partially written file
+        return False
+
+    return 'DCM' in mat and hasattr(mat['DCM'], 'F')
+
+
+def pending_shards(manifest, outDir, cacheDir=None):
+    """
+Writes the unfinished jobs of each shard in <out_dir>/pending and
+returns the list of pending scripts.
+    """
+    pending = {}
+    for job in manifest['jobs']:
+        if not is_estimated(job['Output']):
+            pending.setdefault(job['Shard'], []).append(job)
+
+    if len(pending) == 0:
+        return []
+
+    modelFiles = sorted(set(job['ModelFile'] for jobs in pending.values()
+                            for job in jobs))
+    parsed, templates = compile_models(modelFiles, manifest['dcm_dir'],
+                                       manifest['base'], cacheDir=cacheDir)
+
+    pendingDir = os.path.join(outDir, "pending")
+    if not os.path.isdir(pendingDir):
+        os.makedirs(pendingDir)
+
+    scripts = []
+    for k in sorted(pending.keys()):
+        path = os.path.join(pendingDir, shard_name(k))
+        write_shard(path, pending[k], templates)
+        scripts.append(path)
+        print("Shard %d: %d unfinished job(s)" % (k, len(pending[k])),
+              file=sys.stderr)
+    return scripts
+
+
+def run_script(args):
+    """
+Runs a single Matlab script and returns its exit code.
+    """
+    script, command = args
+    cmd = shlex.split(command % os.path.abspath(script))
+    log = open(script[:-2] + ".log", 'w')
+    code = subprocess.call(cmd, stdout=log, stderr=subprocess.STDOUT)
+    log.close()
+    return code
+
+
+def run(outDir, workers=None, command=MATLAB_CMD, cacheDir=None):
+    """
+Runs all the unfinished jobs listed in the manifest of 'outDir'.
+    """
+    f = open(os.path.join(outDir, "manifest.json"), 'r')
+    manifest = json.load(f)
+    f.close()
+
+    scripts = pending_shards(manifest, outDir, cacheDir=cacheDir)
+    if len(scripts) == 0:
+        print("All jobs are done", file=sys.stderr)
+        return []
+
+    if workers is None:
+        workers = manifest['shards']
+
+    # Each worker just waits for its Matlab process, so threads are
+    # enough here.
+    pool = multiprocessing.pool.ThreadPool(max(1, min(workers, len(scripts))))
+    codes = pool.map(run_script, [(x, command) for x in scripts])
+    pool.close()
+    pool.join()
+
+    for script, code in zip(scripts, codes):
+        if code != 0:
+            print("%s failed (exit code %d)" % (script, code), file=sys.stderr)
+    return codes
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--run":
+        opts, args = getopt.getopt(sys.argv[2:], "j:m:c:")
+        opts = dict(opts)
+        if len(args) != 1:
+            print(HLP_MSG)
+        else:
+            workers = int(opts["-j"]) if "-j" in opts else None
+            run(args[0], workers=workers,
+                command=opts.get("-m", MATLAB_CMD),
+                cacheDir=opts.get("-c", None))
+    else:
+        opts, args = getopt.getopt(sys.argv[1:], "n:c:")
+        opts = dict(opts)
+        if len(args) < 4:
+            print(HLP_MSG)
+        else:
+            dcmFolder, subjectFile, outDir = args[0:3]
+            if not os.path.isdir(outDir):
+                os.makedirs(outDir)
+            manifest = schedule(gen.expand_model_files(args[3:]), dcmFolder,
+                                gen.read_subjects(subjectFile), outDir,
+                                os.getcwd(), nshards=int(opts.get("-n", 8)),
+                                cacheDir=opts.get("-c", None))
+            print("%d job(s) in %d shard(s)" % (len(manifest['jobs']),
+                                                manifest['shards']),
+                  file=sys.stderr)
@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+# ------------------------------------------------------------------ #
+# Random-effects Bayesian model selection (RFX-BMS), as in SPM's
+# spm_BMS, computed directly from the log-evidence matrices saved in
+# the BMS.mat files (e.g., tfMRI/all_architectures/<Task>/BMS.mat).
+#
+# --- History ------------------------------------------------------ #
+#
+# 2026-10-18 : * File created.
+#              * load_bms() can read BMS.mat through mat_cache.py.
+# ------------------------------------------------------------------ #
+
+HLP_MSG="""
+Usage
+-----
+  $ dcm_bms.py [-n <samples>] [-s <seed>] <BMS1.mat> <BMS2.mat> ...
+
+Where:
+
+  <BMSX.mat> is a file saved by SPM's BMS batch.
+  <samples> is the number of Dirichlet samples used to compute the
+    exceedance probabilities (default is 1000000, as in SPM).
+  <seed> is the seed of the random number generator (default is 0).
+
+Reruns the analysis saved in each file from its log-evidence matrix,
+and prints, for each model, the stored and recomputed expected
+frequencies (RFX) or posterior probabilities (FFX), and exceedance
+probabilities.
+
+Method
+------
+The log-evidence matrix (subject x model) is BMS.DCM.rfx.F (or
+BMS.DCM.ffx.F). The Dirichlet parameters 'alpha' of the model
+frequencies are estimated with the variational updates of spm_BMS
+(Stephan et al., 2009), starting from a flat prior (alpha0 = 1).
+Exceedance probabilities are computed in closed form for two models,
+and by sampling the Dirichlet posterior otherwise (all samples are
+drawn and compared at once, in blocks). Protected exceedance
+probabilities use the Bayesian omnibus risk (Rigoux et al., 2014).
+
+All the functions accept a batch of analyses: the subjects can be
+given a (analysis x subject) array of weights, so that the analysis
+of many subsets or resamples of the subjects is a single array
+operation.
+
+Note that, unlike the VB estimates computed here, some of the stored
+results were computed by Gibbs sampling (spm_BMS_gibbs), so their
+'alpha' differ slightly (and may be below 1); exceedance
+probabilities agree.
+"""
+
+import sys, getopt
+import numpy as np
+import scipy.io
+from scipy.special import digamma, gammaln, betainc
+
+import mat_cache
+
+
+class BMS(object):
+    """
+The contents of a BMS.mat file.
+
+  method   : 'rfx' or 'ffx'
+  F        : (subject, model) log-evidence matrix
+  stored   : dictionary with the results saved by SPM ('alpha',
+             'exp_r', 'xp', 'pxp', and 'bor' for RFX; 'post' for FFX)
+  data     : the model space file used by SPM
+    """
+    def __init__(self, method, F, stored, data=""):
+        self.method = method
+        self.F = F
+        self.stored = stored
+        self.data = data
+
+    def Models(self):
+        return self.F.shape[1]
+
+    def Subjects(self):
+        return self.F.shape[0]
+
+
+def load_bms(fileName, cache=False):
+    """
+Loads a BMS.mat file saved by SPM. With 'cache', the file is read
+through its cache (see mat_cache.py), which is built if needed.
+    """
+    if cache:
+        m = mat_cache.load_mat(fileName)
+        method = 'rfx' if "BMS.DCM.rfx.F" in m else 'ffx'
+        prefix = "BMS.DCM.%s.model." % method
+        stored = {}
+        for name in m.Fields():
+            if name.startswith(prefix):
+                value = np.asarray(m.Field(name, squeeze=True), dtype=np.float64)
+                stored[name[len(prefix):]] = np.atleast_1d(value)
+        F = np.asarray(m.Field("BMS.DCM.%s.F" % method), dtype=np.float64)
+        return BMS(method, np.atleast_2d(F), stored,
+                   m.Strings().get("BMS.DCM.%s.data" % method, ""))
+
+    mat = scipy.io.loadmat(fileName, squeeze_me=True, struct_as_record=False)
+    dcm = mat['BMS'].DCM
+    method = 'rfx' if hasattr(dcm, 'rfx') else 'ffx'
+    res = getattr(dcm, method)
+
+    stored = {}
+    for name in res.model._fieldnames:
+        stored[name] = np.atleast_1d(np.asarray(getattr(res.model, name), dtype=np.float64))
+    return BMS(method, np.atleast_2d(np.asarray(res.F, dtype=np.float64)),
+               stored, str(res.data))
+
+
+def _weights(lme, weights):
+    """
+Returns the weights as a (batch, subject) array, and whether the
+results should be returned without the batch dimension.
+    """
+    if weights is None:
+        return np.ones((1, lme.shape[0])), True
+    weights = np.asarray(weights, dtype=np.float64)
+    if weights.ndim == 1:
+        return weights[None], True
+    return weights, False
+
+
+def subject_posteriors(lme, alpha):
+    """
+Returns the (batch, subject, model) posterior probability of each
+model for each subject, given the (batch, model) Dirichlet
+parameters.
+    """
+    elogr = digamma(alpha) - digamma(alpha.sum(axis=-1, keepdims=True))
+    logu = lme[None] + elogr[:, None, :]
+    logu -= logu.max(axis=2, keepdims=True)
+    u = np.exp(logu)
+    return u / u.sum(axis=2, keepdims=True)
+
+
+def rfx_bms(lme, weights=None, alpha0=None, tol=1e-3, max_iter=10000):
+    """
+Estimates the Dirichlet parameters of the model frequencies from a
+(subject, model) log-evidence matrix, with the variational updates
+of spm_BMS. Subjects can be weighted, with a (subject,) array or a
+(batch, subject) array to run several analyses at once (e.g., the
+number of times each subject is drawn in a bootstrap sample).
+Returns 'alpha' and the posterior of each model for each subject
+('g'), with shapes (model,) and (subject, model), or (batch, model)
+and (batch, subject, model).
+    """
+    lme = np.asarray(lme, dtype=np.float64)
+    w, single = _weights(lme, weights)
+    K = lme.shape[1]
+    alpha0 = np.ones(K) if alpha0 is None else np.asarray(alpha0, dtype=np.float64)
+
+    alpha = np.tile(alpha0, (w.shape[0], 1))
+    active = np.ones(w.shape[0], dtype=bool)
+    it = 0
+    while np.any(active) and it < max_iter:
+        it += 1
+        g = subject_posteriors(lme, alpha[active])
+        new = alpha0 + np.einsum('bs,bsk->bk', w[active], g)
+        change = np.sqrt(np.sum((new - alpha[active]) ** 2, axis=1))
+        alpha[active] = new
+        active[np.where(active)[0][change <= tol]] = False
+
+    g = subject_posteriors(lme, alpha)
+    if single:
+        return alpha[0], g[0]
+    return alpha, g
+
+
+def expected_frequencies(alpha):
+    """
+Returns the expected frequency of each model.
+    """
+    alpha = np.asarray(alpha, dtype=np.float64)
+    return alpha / alpha.sum(axis=-1, keepdims=True)
+
+
+def exceedance(alpha, nsamp=1000000, rng=None, block=10000):
+    """
+Returns the probability that each model is more frequent than all
+the others, given the (model,) or (batch, model) Dirichlet
+parameters. Uses the closed form for two models, and 'nsamp'
+Dirichlet samples (drawn in blocks of 'block') otherwise.
+    """
+    alpha = np.asarray(alpha, dtype=np.float64)
+    single = alpha.ndim == 1
+    alpha = np.atleast_2d(alpha)
+    B, K = alpha.shape
+
+    if K == 2:
+        # P(r1 > r2) = P(r2 < 0.5), with r2 ~ Beta(alpha2, alpha1)
+        xp1 = betainc(alpha[:, 1], alpha[:, 0], 0.5)
+        xp = np.stack([xp1, 1 - xp1], axis=1)
+    else:
+        if rng is None:
+            rng = np.random.default_rng(0)
+        counts = np.zeros(B * K)
+        offsets = K * np.arange(B)[None, :]
+        done = 0
+        while done < nsamp:
+            n = min(block, nsamp - done)
+            # Normalizing the gamma draws does not change the argmax
+            r = rng.standard_gamma(alpha, size=(n, B, K))
+            counts += np.bincount((offsets + r.argmax(axis=2)).ravel(), minlength=B * K)
+            done += n
+        xp = counts.reshape((B, K)) / float(nsamp)
+
+    return xp[0] if single else xp
+
+
+def free_energy(lme, alpha, g, weights=None, alpha0=None):
+    """
+Returns the (batch,) free energy of the RFX model (the lower bound
+on the group evidence), as in SPM's spm_BMS_F.
+    """
+    lme = np.asarray(lme, dtype=np.float64)
+    w, single = _weights(lme, weights)
+    alpha = np.atleast_2d(alpha)
+    g = g[None] if g.ndim == 2 else g
+    alpha0 = np.ones(lme.shape[1]) if alpha0 is None else np.asarray(alpha0)
+
+    a0 = alpha.sum(axis=1)
+    elogr = digamma(alpha) - digamma(a0)[:, None]
+    sqf = np.sum(gammaln(alpha), axis=1) - gammaln(a0) - \
+        np.sum((alpha - 1) * elogr, axis=1)
+    sqm = -np.einsum('bs,bsk->b', w, g * np.log(g + np.finfo(float).eps))
+    elj = gammaln(alpha0.sum()) - np.sum(gammaln(alpha0)) + \
+        np.sum((alpha0 - 1) * elogr, axis=1) + \
+        np.einsum('bs,bsk->b', w, g * (elogr[:, None, :] + lme[None]))
+    F = elj + sqf + sqm
+    return F[0] if single else F
+
+
+def null_free_energy(lme, weights=None):
+    """
+Returns the (batch,) evidence of the null hypothesis that all models
+are equally frequent, as in SPM's spm_BMS_bor.
+    """
+    lme = np.asarray(lme, dtype=np.float64)
+    w, single = _weights(lme, weights)
+    K = lme.shape[1]
+    x = lme - lme.max(axis=1, keepdims=True)
+    g = np.exp(x) / np.exp(x).sum(axis=1, keepdims=True)
+    per = np.sum(g * (lme - np.log(K) - np.log(g + np.finfo(float).eps)), axis=1)
+    F0 = w.dot(per)
+    return F0[0] if single else F0
+
+
+def protected_exceedance(lme, alpha, g, xp, weights=None, alpha0=None):
+    """
+Returns the Bayesian omnibus risk and the protected exceedance
+probabilities.
+    """
+    F1 = free_energy(lme, alpha, g, weights, alpha0)
+    F0 = null_free_energy(lme, weights)
+    bor = 1.0 / (1.0 + np.exp(np.clip(F1 - F0, -700, 700)))
+    K = np.shape(xp)[-1]
+    pxp = (1 - np.asarray(bor))[..., None] * xp + np.asarray(bor)[..., None] / K
+    return bor, pxp
+
+
+def ffx_bms(lme, weights=None):
+    """
+Returns the fixed-effects posterior probability of each model (flat
+prior), for one analysis or a batch of weighted analyses.
+    """
+    lme = np.asarray(lme, dtype=np.float64)
+    w, single = _weights(lme, weights)
+    x = w.dot(lme)
+    x -= x.max(axis=1, keepdims=True)
+    post = np.exp(x) / np.exp(x).sum(axis=1, keepdims=True)
+    return post[0] if single else post
+
+
+def run_bms(bms, nsamp=1000000, rng=None):
+    """
+Reruns the analysis of a BMS object. Returns a dictionary with the
+same fields as its 'stored' results.
+    """
+    if bms.method == 'ffx':
+        return {'post' : ffx_bms(bms.F)}
+    alpha, g = rfx_bms(bms.F)
+    xp = exceedance(alpha, nsamp=nsamp, rng=rng)
+    bor, pxp = protected_exceedance(bms.F, alpha, g, xp)
+    return {'alpha' : alpha,
+            'exp_r' : expected_frequencies(alpha),
+            'xp' : xp,
+            'bor' : np.atleast_1d(bor),
+            'pxp' : pxp,
+            'g_post' : g}
+
+
+if __name__ == "__main__":
+    opts, args = getopt.getopt(sys.argv[1:], "n:s:")
+    opts = dict(opts)
+    if len(args) < 1:
+        print(HLP_MSG)
+    else:
+        rng = np.random.default_rng(int(opts.get("-s", 0)))
+        print("File\tMethod\tModel\tStored\tComputed\tStoredXP\tComputedXP")
+        for fileName in args:
+            bms = load_bms(fileName)
+            res = run_bms(bms, nsamp=int(opts.get("-n", 1000000)), rng=rng)
+            field = 'post' if bms.method == 'ffx' else 'exp_r'
+            for k in range(bms.Models()):
+                if bms.method == 'ffx':
+                    xp = ("NA", "NA")
+                else:
+                    xp = ("%.4f" % bms.stored['xp'][k], "%.4f" % res['xp'][k])
+                print("%s\t%s\t%d\t%.4f\t%.4f\t%s\t%s" %
+                      (fileName, bms.method, k + 1, bms.stored[field][k],
+                       res[field][k], xp[0], xp[1]))
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# ------------------------------------------------------------------ #
+# Stability of the random-effects BMS of each task: reruns the
+# analysis (see dcm_bms.py) on bootstrap or jackknife samples of the
+# subjects, in parallel, and reports confidence intervals of the
+# expected frequencies and exceedance probabilities.
+#
+# --- History ------------------------------------------------------ #
+#
+# 2026-10-18 : * File created.
+# ------------------------------------------------------------------ #
+
+HLP_MSG="""
+Usage
+-----
+  $ dcm_bms_resample.py [-m bootstrap|jackknife] [-n <samples>]
+                        [-x <xp_samples>] [-c <chunk>] [-j <workers>]
+                        [-s <seed>] [-l <level>] [-o <out.npz>]
+                        <root_dir> [<folder1> <folder2> ...]
+
+Where:
+
+  <root_dir> is the folder with one subfolder (with a BMS.mat file)
+    per task, e.g. tfMRI/all_architectures.
+  <folderX> is the name of a subfolder (default is All and the six
+    tasks).
+  -m selects the resampling method (default is 'bootstrap').
+  <samples> is the number of bootstrap samples (default is 1000; the
+    jackknife always uses one sample per left-out subject).
+  <xp_samples> is the number of Dirichlet samples used to compute the
+    exceedance probabilities of each resample (default is 10000).
+  <chunk> is the number of resamples per job (default is 100).
+  <workers> is the number of worker processes (default is 1).
+  <seed> is the seed of the random number generator (default is 0).
+  <level> is the level of the confidence intervals (default 0.95).
+  <out.npz> is an optional file where the expected frequencies and
+    exceedance probabilities of all the resamples are saved.
+
+Prints, for each folder and model, the expected frequency and the
+exceedance probability of the full sample, and their confidence
+intervals.
+
+Resampling
+----------
+Each resample is a vector of weights over the subjects (how many
+times each subject is drawn in a bootstrap sample, or 0 for the
+subject left out by the jackknife), so that a chunk of resamples is
+a single batched analysis. The log-evidence matrices are placed in
+shared memory once, and read by all the workers without copying.
+
+Bootstrap intervals are percentile intervals. Jackknife intervals
+use the jackknife standard error and the normal approximation.
+
+Each chunk has its own random number generator, seeded from <seed>,
+the folder, and the chunk's number, so the results do not depend on
+the number of workers.
+"""
+
+import sys, os, getopt
+import multiprocessing
+import numpy as np
+from scipy.stats import norm
+
+import dcm_bms
+import shared_arrays
+
+FOLDERS = ["All", "Emotion", "Gambling", "Language", "Relational", "Social", "WM"]
+
+
+def chunk_rng(seed, folder, chunk=None):
+    """
+Returns the random number generator of a chunk, which only depends
+on the seed, the folder, and the chunk's number (None for the
+analysis of the full sample).
+    """
+    key = [seed, FOLDERS.index(folder) if folder in FOLDERS else len(FOLDERS)]
+    return np.random.default_rng(key if chunk is None else key + [chunk])
+
+
+def resample_weights(method, N, start, n, rng):
+    """
+Returns the (resample, subject) weights of 'n' resamples, starting
+at resample 'start'.
+    """
+    if method == "jackknife":
+        w = np.ones((n, N))
+        w[np.arange(n), np.arange(start, start + n)] = 0
+        return w
+    return rng.multinomial(N, np.full(N, 1.0 / N), size=n).astype(np.float64)
+
+
+def _resample_job(args):
+    """
+Runs one chunk of resamples of a folder. Returns the folder, the
+first resample, and the (resample, model) expected frequencies and
+exceedance probabilities.
+    """
+    folder, method, start, n, chunk, seed, nxp = args
+    lme = shared_arrays.get(folder)
+    rng = chunk_rng(seed, folder, chunk)
+    w = resample_weights(method, lme.shape[0], start, n, rng)
+    alpha, g = dcm_bms.rfx_bms(lme, w)
+    xp = dcm_bms.exceedance(alpha, nsamp=nxp, rng=rng)
+    return folder, start, dcm_bms.expected_frequencies(alpha), xp
+
+
+def intervals(method, full, samples, level=0.95):
+    """
+Returns the (model,) lower and upper limits of the confidence
+intervals of a statistic, given its value on the full sample and on
+the (resample, model) resamples.
+    """
+    if method == "jackknife":
+        n = samples.shape[0]
+        se = np.sqrt((n - 1.0) / n * np.sum((samples - samples.mean(0)) ** 2, axis=0))
+        z = norm.ppf(0.5 + level / 2.0)
+        return np.clip(full - z * se, 0, 1), np.clip(full + z * se, 0, 1)
+    q = 100 * (1 - level) / 2.0
+    return np.percentile(samples, q, axis=0), np.percentile(samples, 100 - q, axis=0)
+
+
+def run_resampling(root, folders=FOLDERS, method="bootstrap", nboot=1000, nxp=10000,
+                   chunk=100, seed=0, workers=1):
+    """
+Resamples the BMS of each folder. Returns a dictionary indexed by
+folder, with the full-sample 'exp_r' and 'xp', and the (resample,
+model) arrays 'exp_r_samples' and 'xp_samples'.
+    """
+    lme = dict((f, dcm_bms.load_bms(os.path.join(root, f, "BMS.mat"), cache=True).F)
+               for f in folders)
+
+    jobs = []
+    for f in folders:
+        total = lme[f].shape[0] if method == "jackknife" else nboot
+        for k, start in enumerate(range(0, total, chunk)):
+            jobs.append((f, method, start, min(chunk, total - start), k, seed, nxp))
+
+    results = {}
+    for f in folders:
+        total = lme[f].shape[0] if method == "jackknife" else nboot
+        K = lme[f].shape[1]
+        alpha, g = dcm_bms.rfx_bms(lme[f])
+        results[f] = {'exp_r' : dcm_bms.expected_frequencies(alpha),
+                      'xp' : dcm_bms.exceedance(alpha, rng=chunk_rng(seed, f)),
+                      'exp_r_samples' : np.empty((total, K)),
+                      'xp_samples' : np.empty((total, K))}
+
+    blocks, specs = shared_arrays.share(lme)
+    try:
+        if workers > 1 and len(jobs) > 1:
+            pool = multiprocessing.Pool(min(workers, len(jobs)), shared_arrays.attach, (specs,))
+            done = pool.imap_unordered(_resample_job, jobs)
+        else:
+            pool = None
+            shared_arrays.attach(specs)
+            done = map(_resample_job, jobs)
+
+        for f, start, expr, xp in done:
+            results[f]['exp_r_samples'][start:start + len(expr)] = expr
+            results[f]['xp_samples'][start:start + len(xp)] = xp
+
+        if pool is not None:
+            pool.close()
+            pool.join()
+    finally:
+        shared_arrays.release(blocks)
+
+    return results
+
+
+if __name__ == "__main__":
+    opts, args = getopt.getopt(sys.argv[1:], "m:n:x:c:j:s:l:o:")
+    opts = dict(opts)
+    method = opts.get("-m", "bootstrap")
+    if len(args) < 1 or method not in ["bootstrap", "jackknife"]:
+        print(HLP_MSG)
+    else:
+        level = float(opts.get("-l", 0.95))
+        results = run_resampling(args[0], args[1:] or FOLDERS, method=method,
+                                 nboot=int(opts.get("-n", 1000)),
+                                 nxp=int(opts.get("-x", 10000)),
+                                 chunk=int(opts.get("-c", 100)),
+                                 seed=int(opts.get("-s", 0)),
+                                 workers=int(opts.get("-j", 1)))
+
+        print("Folder\tModel\tExpected\tExpected_low\tExpected_high\tExceedance\tExceedance_low\tExceedance_high")
+        for f, res in results.items():
+            elow, ehigh = intervals(method, res['exp_r'], res['exp_r_samples'], level)
+            xlow, xhigh = intervals(method, res['xp'], res['xp_samples'], level)
+            for k in range(len(res['exp_r'])):
+                print("%s\t%d\t%.4f\t%.4f\t%.4f\t%.4f\t%.4f\t%.4f" %
+                      (f, k + 1, res['exp_r'][k], elow[k], ehigh[k],
+                       res['xp'][k], xlow[k], xhigh[k]))
+
+        if "-o" in opts:
+            np.savez(opts["-o"], **dict(("%s_%s" % (f, key), res[key])
+                                       for f, res in results.items()
+                                       for key in ['exp_r', 'xp', 'exp_r_samples', 'xp_samples']))
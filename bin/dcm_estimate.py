@@ -0,0 +1,385 @@
+#!/usr/bin/env python
+# ------------------------------------------------------------------ #
+# Approximate estimation of deterministic linear DCMs (the 'a' and 'c'
+# models of dcm-generate-models.py, with 'nonlinear = 0') by
+# Variational Laplace, as SPM's spm_nlsi_GN, for many subjects at
+# once, using the forward model of dcm_simulate.py.
+#
+# --- History ------------------------------------------------------ #
+#
+# 2026-10-18 : * File created.
+#              * Also writes the posterior variances (_vA.txt, _vC.txt).
+# ------------------------------------------------------------------ #
+
+HLP_MSG="""
+Usage
+-----
+  $ dcm_estimate.py [-r <TR>] [-b <block>] [-u <inputs_file>] [-i <iter>]
+                    [-m <microtime>] <model_file> <data_dir> <out_prefix>
+
+Where:
+
+  <model_file> is a model description (see dcm-generate-models.py);
+    models with modulatory ('b' or 'd') connections are rejected.
+  <data_dir> is a folder with one <subject>/cmc.txt file per subject
+    (one row per scan, and one column per VOI, in the order of the
+    model; e.g., tfMRI/granger/WM or the output of dcm_simulate.py).
+  <out_prefix> is the prefix of the output tables.
+  <TR> is the repetition time, in secs (default is 0.72).
+  <inputs_file> is a text file with one row per scan and one column
+    per input of the model (default is the block design of
+    dcm_simulate.py, with blocks of <block> secs, default 20).
+  <iter> is the maximum number of iterations (default is 64).
+  <microtime> is the number of integration steps per scan (default is
+    8; SPM uses 16).
+
+Writes <out_prefix>_A.txt and <out_prefix>_C.txt, with the posterior
+means of each subject, in the format of the DCM_<model>_data_A.txt
+and _C.txt tables of dcm-extract-model-data.sh (and readable by
+dcm_params.py), <out_prefix>_vA.txt and <out_prefix>_vC.txt, with
+their posterior variances in the same format (see param_average.py),
+and <out_prefix>_F.txt, with the free energy of each subject.
+
+Method
+------
+The priors are those of SPM12 (spm_dcm_fmri_priors) for one-state
+linear DCMs: the connections of the 'a' matrix have a prior mean of
+1/128 and a variance of 1/64, the log self-inhibitions a mean of 0
+and a variance of 1/64, the inputs of the 'c' matrix a mean of 0 and
+a variance of 1, and the hemodynamic parameters (transit times, decay
+and epsilon) a mean of 0 and a variance of exp(-6). The noise has
+one log-precision per VOI, with a prior mean of 6 and a variance of
+1/128. As in spm_dcm_estimate, the data are rescaled to a range of at
+most 4, and their mean is treated as a confound.
+
+The posterior is found by Gauss-Newton ascent of the free energy
+(with the Levenberg-Marquardt-like step of spm_dx), alternating with
+Fisher scoring of the noise precisions, as spm_nlsi_GN. The Jacobian
+is computed by finite differences: the perturbed parameter sets of
+all the subjects are stacked and integrated in a single call to
+dcm_simulate.simulate, so each iteration costs one batched
+integration. Subjects that have converged are dropped from the
+batch.
+"""
+
+import sys, os, getopt, glob
+import numpy as np
+
+import dcm_simulate
+
+# Prior variances of spm_dcm_fmri_priors
+PRIOR_A = 1.0 / 64
+PRIOR_C = 1.0
+PRIOR_HEMO = np.exp(-6)
+
+# Hyperpriors of the log-precisions of the noise
+HYPER_MEAN = 6.0
+HYPER_VAR = 1.0 / 128
+
+# Step of the finite differences (as spm_diff)
+DX = np.exp(-8)
+
+
+class Layout(object):
+    """
+The free parameters of a linear DCM, in the order of the parameter
+vectors: the 'a' connections (including the log self-inhibitions),
+the 'c' inputs, the transit times, the decay, and epsilon.
+    """
+    def __init__(self, masks):
+        a = np.asarray(masks['a'], dtype=bool)
+        c = np.asarray(masks['c'], dtype=bool)
+        if np.any(masks['b']) or np.any(masks['d']):
+            raise Exception("Only linear models (without 'b' and 'd' connections) "
+                            "can be estimated")
+        self.n = a.shape[0]
+        self.nu = c.shape[1]
+        a = a | np.eye(self.n, dtype=bool)
+        self.a = np.nonzero(a)
+        self.c = np.nonzero(c)
+        na = len(self.a[0])
+        nc = len(self.c[0])
+        self.size = na + nc + self.n + 2
+        self.sa = slice(0, na)
+        self.sc = slice(na, na + nc)
+        self.stransit = slice(na + nc, na + nc + self.n)
+        self.sdecay = na + nc + self.n
+        self.sepsilon = na + nc + self.n + 1
+
+    def Priors(self):
+        """
+        Returns the prior means and variances of the parameters.
+        """
+        mean = np.zeros(self.size)
+        var = np.full(self.size, PRIOR_HEMO)
+        offdiag = self.a[0] != self.a[1]
+        mean[self.sa] = np.where(offdiag, 1.0 / 128, 0.0)
+        var[self.sa] = PRIOR_A
+        var[self.sc] = PRIOR_C
+        return mean, var
+
+    def Parameters(self, theta):
+        """
+        Returns the dcm_simulate.Parameters of (set, parameter) vectors.
+        """
+        k = theta.shape[0]
+        A = np.zeros((k, self.n, self.n))
+        C = np.zeros((k, self.n, self.nu))
+        A[:, self.a[0], self.a[1]] = theta[:, self.sa]
+        C[:, self.c[0], self.c[1]] = theta[:, self.sc]
+        return dcm_simulate.Parameters(A, np.zeros((k, self.n, self.n, self.nu)), C,
+                                       np.zeros((k, self.n, self.n, self.n)),
+                                       theta[:, self.stransit],
+                                       np.repeat(theta[:, self.sdecay][:, None], self.n, axis=1),
+                                       theta[:, self.sepsilon])
+
+    def Matrices(self, theta):
+        """
+        Returns the (subject, to, from) A and (subject, to, input) C
+        matrices of (subject, parameter) vectors.
+        """
+        p = self.Parameters(theta)
+        return p.A, p.C
+
+
+def predict(layout, theta, U, TR, TE, microtime):
+    """
+Returns the (set, scan x voi) predicted BOLD signals of (set,
+parameter) vectors (the signal of each VOI in turn).
+    """
+    y, _ = dcm_simulate.simulate(layout.Parameters(theta), U, TR, TE, microtime)
+    return y.transpose((0, 2, 1)).reshape((theta.shape[0], -1))
+
+
+def predict_jacobian(layout, theta, U, TR, TE, microtime):
+    """
+Returns the (subject, scan x voi) predictions and their (subject,
+scan x voi, parameter) Jacobians, computed by forward differences in
+a single integration of all the perturbed parameter sets.
+    """
+    b, P = theta.shape
+    sets = np.repeat(theta[:, None, :], P + 1, axis=1)
+    sets[:, 1:, :] += DX * np.eye(P)[None]
+    y = predict(layout, sets.reshape((b * (P + 1), P)), U, TR, TE, microtime)
+    y = y.reshape((b, P + 1, -1))
+    return y[:, 0], ((y[:, 1:] - y[:, 0:1]) / DX).transpose((0, 2, 1))
+
+
+def spm_dx(dfdx, f, t):
+    """
+Returns the update dx = (expm(dfdx t) - I) inv(dfdx) f of spm_dx for
+batches of symmetric (negative definite) Hessians, computed from
+their eigendecomposition. Large values of 't' give Newton steps and
+small values gradient steps.
+    """
+    w, V = np.linalg.eigh(dfdx)
+    w = np.minimum(w, -1e-12)
+    t = np.asarray(t)[:, None]
+    scale = np.expm1(w * t) / w
+    return np.einsum('bij,bj,bkj,bk->bi', V, scale, V, f)
+
+
+def scale_data(Y):
+    """
+Rescales each subject's (scan, voi) data so that its range is at
+most 4, as spm_dcm_estimate.
+    """
+    rng = np.max(Y, axis=(1, 2)) - np.min(Y, axis=(1, 2))
+    return Y * (4.0 / np.maximum(rng, 4.0))[:, None, None]
+
+
+def free_energy(e, J, h, p, ipC, ns, logdetC):
+    """
+Returns the free energy of each subject, the posterior covariances,
+and the quantities needed to update the precisions.
+    """
+    b, N, P = J.shape
+    n = h.shape[1]
+    prec = np.repeat(np.exp(h), ns, axis=1)
+    JPJ = np.einsum('bti,bt,btj->bij', J, prec, J)
+    Pp = JPJ + ipC[None]
+    Cp = np.linalg.inv(Pp)
+    _, logdetPp = np.linalg.slogdet(Pp)
+
+    d = h - HYPER_MEAN
+    F = -0.5 * np.sum(prec * e * e, axis=1) \
+        + 0.5 * ns * np.sum(h, axis=1) - 0.5 * N * np.log(2 * np.pi) \
+        - 0.5 * np.einsum('bi,i,bi->b', p, np.diag(ipC), p) \
+        - 0.5 * (logdetC + logdetPp) \
+        - 0.5 * np.sum(d * d, axis=1) / HYPER_VAR \
+        - 0.5 * n * np.log(1.0 + 0.5 * ns * HYPER_VAR)
+    return F, Cp, prec
+
+
+def update_precisions(e, J, h, Cp, ns):
+    """
+One step of Fisher scoring of the log-precisions of the noise of
+each VOI (as the M-step of spm_nlsi_GN).
+    """
+    b, N, P = J.shape
+    n = h.shape[1]
+    eh = np.exp(h)
+    # e' Q_i e and trace(Cp J' Q_i J) for each VOI i
+    ee = np.sum((e * e).reshape((b, n, ns)), axis=2)
+    JCJ = np.einsum('bti,bij,btj->bt', J, Cp, J).reshape((b, n, ns)).sum(axis=2)
+    dFdh = 0.5 * ns - 0.5 * eh * (ee + JCJ) - (h - HYPER_MEAN) / HYPER_VAR
+    dFdhh = -0.5 * ns - 1.0 / HYPER_VAR
+    return h + np.clip(-dFdh / dFdhh, -4, 4)
+
+
+def estimate(layout, Y, U, TR, TE=0.04, microtime=8, max_iter=64, tol=1e-2,
+             verbose=False):
+    """
+Estimates the parameters of all the subjects' (subject, scan, voi)
+data Y at once (see HLP_MSG). Returns the (subject, parameter)
+posterior means and variances, the free energies, and the number of
+iterations of each subject.
+    """
+    b, ns, n = Y.shape
+    Y = scale_data(np.asarray(Y, dtype=np.float64))
+
+    # The mean of each VOI is a confound: it is removed from the data
+    # and from the predictions
+    Y = Y - Y.mean(axis=1, keepdims=True)
+    y = Y.transpose((0, 2, 1)).reshape((b, -1))
+
+    pE, pV = layout.Priors()
+    ipC = np.diag(1.0 / pV)
+    logdetC = np.sum(np.log(pV))
+
+    theta = np.repeat(pE[None], b, axis=0)
+    h = np.zeros((b, n)) + HYPER_MEAN - 4.0
+    best = theta.copy()
+    bestF = np.full(b, -np.inf)
+    bestC = np.zeros((b, layout.size, layout.size))
+    bestG = np.zeros((b, layout.size))
+    bestH = np.zeros((b, layout.size, layout.size))
+    v = np.full(b, -4.0)
+    dF = np.zeros(b)
+    criterion = np.zeros(b, dtype=int)
+    iterations = np.zeros(b, dtype=int)
+    active = np.arange(b)
+
+    for it in range(max_iter):
+        if len(active) == 0:
+            break
+        g, J = predict_jacobian(layout, theta[active], U, TR, TE, microtime)
+
+        # Removes the mean of each VOI from the predictions
+        g = g.reshape((len(active), n, ns))
+        g = (g - g.mean(axis=2, keepdims=True)).reshape((len(active), -1))
+        J = J.reshape((len(active), n, ns, -1))
+        J = (J - J.mean(axis=2, keepdims=True)).reshape((len(active), n * ns, -1))
+        e = y[active] - g
+        p = theta[active] - pE
+
+        # M-step: noise precisions
+        hh = h[active]
+        for k in range(8):
+            prec = np.repeat(np.exp(hh), ns, axis=1)
+            Cp = np.linalg.inv(np.einsum('bti,bt,btj->bij', J, prec, J) + ipC[None])
+            new = update_precisions(e, J, hh, Cp, ns)
+            if np.max(np.abs(new - hh)) < 1e-2:
+                hh = new
+                break
+            hh = new
+        h[active] = hh
+
+        F, Cp, prec = free_energy(e, J, hh, p, ipC, ns, logdetC)
+
+        # Accepts the steps that increased F, and reverts the others
+        better = F > bestF[active]
+        up = active[better]
+        down = active[~better]
+        dF[up] = F[better] - bestF[up]
+        best[up] = theta[up]
+        bestF[up] = F[better]
+        bestC[up] = Cp[better]
+        v[up] = np.minimum(v[up] + 0.5, 4.0)
+        v[down] = np.minimum(v[down] - 2.0, -4.0)
+        dF[down] = 0.0
+
+        # Gauss-Newton step from the best parameters (with the
+        # gradient and curvature at those parameters, and a shorter
+        # step after a rejected one)
+        dFdp = np.einsum('bti,bt,bt->bi', J, prec, e) - np.einsum('ij,bj->bi', ipC, p)
+        dFdpp = -(np.einsum('bti,bt,btj->bij', J, prec, J) + ipC[None])
+        bestG[up] = dFdp[better]
+        bestH[up] = dFdpp[better]
+        theta[active] = best[active] + spm_dx(bestH[active], bestG[active], np.exp(v[active]))
+
+        iterations[active] += 1
+        criterion[up] = np.where(dF[up] < tol, criterion[up] + 1, 0)
+        criterion[down] += 1
+        if verbose:
+            print("Iteration %d: %d subject(s), mean F = %.2f" %
+                  (it + 1, len(active), np.mean(bestF[active])), file=sys.stderr)
+        active = active[criterion[active] < 4]
+
+    return best, np.array([np.diag(x) for x in bestC]), bestF, iterations
+
+
+def read_data(dataDir):
+    """
+Reads the <subject>/cmc.txt files of a folder. Returns the list of
+subjects and the (subject, scan, voi) data (all subjects must have
+the same number of scans).
+    """
+    files = sorted(glob.glob(os.path.join(dataDir, "*", "cmc.txt")))
+    subjects = [os.path.basename(os.path.dirname(x)) for x in files]
+    return subjects, np.array([np.loadtxt(x, ndmin=2) for x in files])
+
+
+def save_table(fileName, subjects, names, values):
+    """
+Writes a table in the format of dcm-extract-model-data.sh (a header,
+then one row per subject, with trailing tabs). Matrices are written
+column by column, as Matlab's reshape.
+    """
+    f = open(fileName, 'w')
+    f.write("Subject\t" + "".join("%s\t" % x for x in names) + "\n")
+    for s, m in zip(subjects, values):
+        f.write("%s\t" % s + "".join("%f\t" % x for x in m.T.ravel()) + "\n")
+    f.close()
+
+
+if __name__ == "__main__":
+    opts, args = getopt.getopt(sys.argv[1:], "r:b:u:i:m:")
+    opts = dict(opts)
+    if len(args) < 3:
+        print(HLP_MSG)
+    else:
+        gen = dcm_simulate.load_generator()
+        model = gen.parse_file(args[0])
+        masks = dcm_simulate.model_masks(model)
+        layout = Layout(masks)
+        inputs = [x.name for x in model.InputsUsed()]
+
+        TR = float(opts.get("-r", 0.72))
+        microtime = int(opts.get("-m", 8))
+        subjects, Y = read_data(args[1])
+        if "-u" in opts:
+            U = np.repeat(np.loadtxt(opts["-u"], ndmin=2), microtime, axis=0)
+        else:
+            U = dcm_simulate.block_inputs(Y.shape[1], TR, layout.nu,
+                                          float(opts.get("-b", 20.0)), microtime)
+
+        mean, var, F, iterations = estimate(layout, Y, U, TR, model.te, microtime,
+                                            int(opts.get("-i", 64)), verbose=True)
+        A, C = layout.Matrices(mean)
+        vA, vC = layout.Matrices(var)
+
+        prefix = args[2]
+        save_table(prefix + "_A.txt", subjects,
+                   ["%s-to-%s" % (frm, to) for frm in model.vois for to in model.vois], A)
+        save_table(prefix + "_C.txt", subjects,
+                   ["%s-to-%s" % (u, to) for u in inputs for to in model.vois], C)
+        save_table(prefix + "_vA.txt", subjects,
+                   ["%s-to-%s" % (frm, to) for frm in model.vois for to in model.vois], vA)
+        save_table(prefix + "_vC.txt", subjects,
+                   ["%s-to-%s" % (u, to) for u in inputs for to in model.vois], vC)
+        f = open(prefix + "_F.txt", 'w')
+        f.write("Subject\tF\tIterations\n")
+        for s, x, k in zip(subjects, F, iterations):
+            f.write("%s\t%f\t%d\n" % (s, x, k))
+        f.close()
@@ -0,0 +1,346 @@
+#!/usr/bin/env python
+# ------------------------------------------------------------------ #
+# Loads the DCM parameter tables extracted by dcm-extract-model-data.sh
+# (e.g., <Task>/DCM_smm_direct_data_A.txt) for all tasks into a single
+# NumPy array, with a binary cache that can be memory-mapped.
+#
+# --- History ------------------------------------------------------ #
+#
+# 2026-10-18 : * File created.
+#              * Duplicated rows are left out; added read_combined().
+# ------------------------------------------------------------------ #
+
+HLP_MSG="""
+Usage
+-----
+  $ dcm_params.py <root_dir> [<matrix1> <matrix2> ...]
+
+Where:
+
+  <root_dir> is the folder containing one subfolder per task (e.g.,
+    tfMRI/all_architectures).
+  <matrixX> is the name of a DCM matrix (A, B, C, or D; default is
+    all of them).
+
+Loads the parameter tables of each matrix for all tasks (building
+the cache if needed) and prints a summary.
+
+Tables
+------
+Parameter tables are tab-separated files with a header and one row
+per subject. The first column is the subject (optionally preceded
+by a column with the task's name), and the other columns are named
+after the connections, in the order used by SPM:
+
+  <from>-to-<to>           for the A and C matrices
+  <from>-to-<to>-by-<mod>  for the B and D matrices
+
+Each matrix is loaded into an array of shape (task, subject, from,
+to) or, for B and D, (task, subject, mod, from, to). Subjects that
+are missing in a task are filled with NaN. For the B and C matrices
+the input axes are positional, because the names of the inputs
+differ between tasks (see Parameters.inputs).
+
+Rows that appear more than once for the same subject (and task)
+cannot be told apart, so they are all left out with a warning, as
+param.analysis.R leaves out the subjects without exactly one row per
+task. read_combined() reads the tables of all the tasks with a Task
+column (e.g. data_A.txt) in the same way.
+
+The arrays are cached as .npy files (with a .json index) in a
+'.cache' folder inside <root_dir>. The cache is rebuilt whenever
+one of the tables changes.
+"""
+
+import sys, os, json
+import numpy as np
+
+TASKS = ["Emotion", "Gambling", "Language", "Relational", "Social", "WM"]
+
+VOIS = ['Action', 'LTM', 'Perception', 'Procedural', 'WM']
+
+PATTERN = "%(task)s/DCM_smm_direct_data_%(matrix)s.txt"
+
+CACHE_DIR = ".cache"
+
+# Version of the cached arrays (the cache is rebuilt when it changes)
+CACHE_VERSION = 2
+
+
+def parse_column(name):
+    """
+Splits a column name ('<from>-to-<to>[-by-<mod>]') into a tuple
+(from, to, mod). The modulator is None for the A and C matrices.
+    """
+    mod = None
+    if "-by-" in name:
+        name, mod = name.split("-by-")
+    frm, to = name.split("-to-")
+    return frm, to, mod
+
+
+def read_table(fileName, tasks=False):
+    """
+Reads a parameter table. Returns the list of subjects, the list of
+column names, and a 2-D array of values (subject x column). With
+'tasks', the list of the tasks of the rows (from the Task column) is
+also returned, first.
+    """
+    f = open(fileName, 'r')
+    lines = [x for x in f.read().split('\n') if len(x.strip()) > 0]
+    f.close()
+
+    # Trailing tabs leave an empty last field
+    header = lines[0].rstrip('\t').split('\t')
+    skip = header.index("Subject")
+    columns = header[skip + 1:]
+
+    rows = [x.rstrip('\t').split('\t') for x in lines[1:]]
+    subjects = [x[skip] for x in rows]
+    values = np.array([x[skip + 1:] for x in rows], dtype=np.float64)
+    if values.shape[1:] != (len(columns),):
+        raise Exception("Inconsistent number of columns in %s" % fileName)
+
+    if tasks:
+        t = header.index("Task")
+        return [x[t] for x in rows], subjects, columns, values
+    return subjects, columns, values
+
+
+def unique_rows(keys, fileName):
+    """
+Returns a boolean array marking the rows whose key (e.g. the subject,
+or the task and subject) appears only once. Duplicated rows cannot
+be told apart, so all of them are left out, with a warning: like
+param.analysis.R, which only keeps the subjects with exactly one row
+per task.
+    """
+    count = {}
+    for k in keys:
+        count[k] = count.get(k, 0) + 1
+    duplicated = sorted(set(k for k in keys if count[k] > 1))
+    if len(duplicated) > 0:
+        print("Warning: duplicated rows left out of %s: %s" % (fileName, duplicated),
+              file=sys.stderr)
+    return np.array([count[k] == 1 for k in keys], dtype=bool)
+
+
+def table_axes(columns):
+    """
+Returns the labels of the (mod, from, to) or (from, to) axes of a
+matrix, in the order of the columns (the last axis changes fastest).
+    """
+    parsed = [parse_column(x) for x in columns]
+    frm = []
+    to = []
+    mod = []
+    for f, t, m in parsed:
+        for lst, x in [(frm, f), (to, t), (mod, m)]:
+            if x not in lst:
+                lst.append(x)
+
+    if mod == [None]:
+        axes = [frm, to]
+    else:
+        axes = [mod, frm, to]
+
+    shape = tuple(len(x) for x in axes)
+    if np.prod(shape) != len(columns):
+        raise Exception("Columns do not form a full matrix: %s" % (shape,))
+    return axes
+
+
+class Parameters(object):
+    """
+The parameters of a DCM matrix for all tasks and subjects.
+
+  values   : array of shape (task, subject, ...)
+  tasks    : list of task names
+  subjects : list of subject IDs (union over all tasks)
+  axes     : for each trailing axis, a list of labels (for the input
+             axes, the labels of the first task; see 'inputs')
+  inputs   : for each task, the names of its inputs (B and C only)
+    """
+    def __init__(self, matrix, values, tasks, subjects, axes, inputs):
+        self.matrix = matrix
+        self.values = values
+        self.tasks = tasks
+        self.subjects = subjects
+        self.axes = axes
+        self.inputs = inputs
+        self.task_index = dict((x, i) for i, x in enumerate(tasks))
+        self.subject_index = dict((x, i) for i, x in enumerate(subjects))
+
+    def Task(self, task):
+        """
+        Returns the (subject, ...) array of a task.
+        """
+        return self.values[self.task_index[task]]
+
+    def Present(self):
+        """
+        Returns a boolean (task, subject) array, True where the
+        subject has parameters for the task.
+        """
+        v = self.values.reshape(self.values.shape[0:2] + (-1,))
+        return ~np.all(np.isnan(v), axis=2)
+
+    def Select(self, subjects=None, tasks=None):
+        """
+        Returns a view (or copy, if needed) restricted to the given
+        subjects and tasks, in the given order.
+        """
+        t = range(len(self.tasks)) if tasks is None else \
+            [self.task_index[x] for x in tasks]
+        s = range(len(self.subjects)) if subjects is None else \
+            [self.subject_index[x] for x in subjects]
+        values = self.values[np.ix_(list(t), list(s))]
+        return Parameters(self.matrix, values,
+                          [self.tasks[i] for i in t],
+                          [self.subjects[i] for i in s],
+                          self.axes,
+                          dict((self.tasks[i], self.inputs[self.tasks[i]])
+                               for i in t if self.tasks[i] in self.inputs))
+
+
+def build_parameters(root, matrix="A", tasks=TASKS, pattern=PATTERN):
+    """
+Parses the tables of a matrix for all tasks and returns a
+Parameters object.
+    """
+    tables = []
+    for task in tasks:
+        fileName = os.path.join(root, pattern % {'task' : task, 'matrix' : matrix})
+        subjects, columns, values = read_table(fileName)
+        keep = unique_rows(subjects, fileName)
+        tables.append(([x for x, k in zip(subjects, keep) if k], columns, values[keep]))
+
+    subjects = sorted(set(x for t in tables for x in t[0]))
+    subject_index = dict((x, i) for i, x in enumerate(subjects))
+
+    # Input names differ between tasks (B and C matrices), so the
+    # input axis is positional and as long as the longest one
+    axes = [table_axes(t[1]) for t in tables]
+    inputAxis = {'B' : 0, 'C' : 0}.get(matrix.upper(), None)
+    inputs = {}
+    if inputAxis is not None:
+        inputs = dict((task, a[inputAxis]) for task, a in zip(tasks, axes))
+
+    shape = [max(len(a[k]) for a in axes) for k in range(len(axes[0]))]
+    values = np.full([len(tasks), len(subjects)] + shape, np.nan)
+
+    for i, (subj, columns, vals) in enumerate(tables):
+        rows = [subject_index[x] for x in subj]
+        tshape = tuple(len(x) for x in axes[i])
+        block = tuple(slice(0, n) for n in tshape)
+        values[(i, rows) + block] = vals.reshape((len(subj),) + tshape)
+
+    common = max(axes, key=lambda a: [len(x) for x in a])
+    return Parameters(matrix, values, list(tasks), subjects, common, inputs)
+
+
+def read_combined(fileName, matrix=""):
+    """
+Reads a table with the parameters of all the tasks, with a Task
+column (e.g. data_A.txt, as read by param.analysis.R). Returns a
+Parameters object (see unique_rows for duplicated rows).
+    """
+    tasks, subjects, columns, values = read_table(fileName, tasks=True)
+    keep = unique_rows(list(zip(tasks, subjects)), fileName)
+
+    names = sorted(set(tasks), key=tasks.index)
+    subj = sorted(set(subjects))
+    index = dict((x, i) for i, x in enumerate(subj))
+    axes = table_axes(columns)
+    shape = tuple(len(x) for x in axes)
+    array = np.full((len(names), len(subj)) + shape, np.nan)
+    for task, s, v, k in zip(tasks, subjects, values, keep):
+        if k:
+            array[(names.index(task), index[s])] = v.reshape(shape)
+    return Parameters(matrix, array, names, subj, axes, {})
+
+
+def table_signature(root, matrix, tasks, pattern):
+    """
+Returns the size and modification time of each table, which are
+used to check whether a cache is still valid.
+    """
+    sig = []
+    for task in tasks:
+        fileName = os.path.join(root, pattern % {'task' : task, 'matrix' : matrix})
+        st = os.stat(fileName)
+        sig.append([fileName, st.st_size, st.st_mtime])
+    return sig
+
+
+def load_parameters(root, matrix="A", tasks=TASKS, pattern=PATTERN,
+                    cacheDir=None, mmap=True):
+    """
+Loads the parameters of a matrix for all tasks, using the binary
+cache in 'cacheDir' (by default, <root>/.cache) whenever it is up
+to date. With 'mmap', the cached array is memory-mapped (read-only)
+instead of being read in memory.
+    """
+    if cacheDir is None:
+        cacheDir = os.path.join(root, CACHE_DIR)
+
+    base = os.path.join(cacheDir, "params_%s" % matrix)
+    sig = table_signature(root, matrix, tasks, pattern)
+
+    if os.path.exists(base + ".json") and os.path.exists(base + ".npy"):
+        f = open(base + ".json", 'r')
+        index = json.load(f)
+        f.close()
+        if index['signature'] == sig and index.get('version') == CACHE_VERSION:
+            values = np.load(base + ".npy", mmap_mode='r' if mmap else None)
+            return Parameters(matrix, values, index['tasks'],
+                              index['subjects'], index['axes'],
+                              index['inputs'])
+
+    params = build_parameters(root, matrix, tasks=tasks, pattern=pattern)
+
+    if not os.path.isdir(cacheDir):
+        os.makedirs(cacheDir, exist_ok=True)
+    np.save(base + ".npy", params.values)
+    f = open(base + ".json", 'w')
+    json.dump({'signature' : sig,
+               'version' : CACHE_VERSION,
+               'tasks' : params.tasks,
+               'subjects' : params.subjects,
+               'axes' : params.axes,
+               'inputs' : params.inputs}, f)
+    f.close()
+
+    if mmap:
+        params.values = np.load(base + ".npy", mmap_mode='r')
+    return params
+
+
+def read_matrix(fileName):
+    """
+Reads a group matrix saved by Matlab as comma-separated values
+(e.g., <Task>_avg_A.txt), where rows are the targets and columns are
+the sources of the connections. Returns it as a (from, to) array,
+like the matrices in Parameters.
+    """
+    return np.loadtxt(fileName, delimiter=',', ndmin=2).T
+
+
+def load_matrices(root, name="avg_A", tasks=TASKS):
+    """
+Loads a group matrix (e.g., 'avg_A' or 'optimized_avg_A') for all
+tasks, as a (task, from, to) array.
+    """
+    return np.array([read_matrix(os.path.join(root, task, "%s_%s.txt" % (task, name)))
+                     for task in tasks])
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(HLP_MSG)
+    else:
+        root = sys.argv[1]
+        for matrix in (sys.argv[2:] or ['A', 'B', 'C', 'D']):
+            p = load_parameters(root, matrix)
+            print("%s: %s, %d subjects in %d tasks" %
+                  (matrix, p.values.shape, len(p.subjects), len(p.tasks)))
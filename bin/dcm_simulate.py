@@ -0,0 +1,351 @@
+#!/usr/bin/env python
+# ------------------------------------------------------------------ #
+# Forward simulation of DCMs for fMRI (bilinear or nonlinear neuronal
+# dynamics and the balloon hemodynamic model of SPM), for the models
+# written by dcm-generate-models.py. Many parameter sets (e.g., many
+# subjects) are integrated at once, so that synthetic data can be
+# generated to screen model spaces before they are estimated in SPM.
+#
+# --- History ------------------------------------------------------ #
+#
+# 2026-10-18 : * File created.
+# ------------------------------------------------------------------ #
+
+HLP_MSG="""
+Usage
+-----
+  $ dcm_simulate.py [-n <subjects>] [-s <scans>] [-r <TR>] [-b <block>]
+                    [-N <snr>] [-x <seed>] <model_file> <out_dir>
+
+Where:
+
+  <model_file> is a model description (see dcm-generate-models.py).
+  <out_dir> is the folder where one sub-<K>/cmc.txt file is written
+    for each simulated subject (one column per VOI, in the order of
+    the model, as the files used in the Granger analysis).
+  <subjects> is the number of subjects (default is 100).
+  <scans> is the number of scans (default is 405).
+  <TR> is the repetition time, in secs (default is 0.72).
+  <block> is the duration of the blocks of the inputs, in secs
+    (default is 20; see block_inputs).
+  <snr> is the signal-to-noise ratio (the ratio of the standard
+    deviations of the signal and of the white noise added to it;
+    default is 0, i.e. no noise).
+  <seed> is the seed of the random numbers (default is 0).
+
+The parameters of each subject are drawn around the model's
+connections (see sample_parameters), and also saved as
+<out_dir>/parameters.npz.
+
+Model
+-----
+The neuronal states x (one per VOI) follow
+
+  dx/dt = (A + sum_j u_j B_j + sum_k x_k D_k) x + C u
+
+where the diagonal of A holds log self-inhibitions (the effective
+self-connection is -exp(A_ii)/2, in Hz) and C is scaled by 1/16, as
+in SPM12's spm_fx_fmri. Each VOI has four hemodynamic states: the
+vasodilatory signal s, and the log of the flow f, volume v, and
+deoxyhemoglobin content q, with
+
+  ds/dt = x - kappa s - gamma (f - 1)
+  df/dt = s
+  dv/dt = (f - v^(1/alpha)) / tau
+  dq/dt = (f (1 - (1 - E0)^(1/f)) / E0 - v^(1/alpha) q / v) / tau
+
+(for the non-log states), with kappa = 0.64 exp(decay), gamma = 0.32,
+tau = 2 exp(transit), alpha = 0.32, and E0 = 0.4. The BOLD signal is
+that of spm_gx_fmri (for 3T), with the echo time (TE) of the model.
+
+The states of all the parameter sets are integrated together with a
+fourth-order Runge-Kutta scheme, with a time step of TR / 16 (the
+micro-time resolution of SPM), and inputs that are constant within
+each step.
+"""
+
+import sys, os, getopt
+import importlib.util
+import numpy as np
+
+# Hemodynamic constants of spm_fx_fmri and spm_gx_fmri
+KAPPA = 0.64
+GAMMA = 0.32
+TAU = 2.0
+ALPHA = 0.32
+E0 = 0.4
+V0 = 4.0
+R0 = 25.0
+NU0 = 40.3
+
+# Scaling of the inputs in spm_fx_fmri
+INPUT_SCALE = 1.0 / 16
+
+MICROTIME = 16
+
+
+def load_generator():
+    """
+Loads 'dcm-generate-models.py' (whose name is not a valid module
+name) from the same folder as this script.
+    """
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        "dcm-generate-models.py")
+    spec = importlib.util.spec_from_file_location("dcm_generate_models", path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+class Parameters(object):
+    """
+A batch of DCM parameters (the first axis of each array is the
+batch):
+
+  A       : (batch, to, from) connections (log self-inhibitions on
+            the diagonal)
+  B       : (batch, to, from, input) modulations by the inputs
+  C       : (batch, to, input) driving inputs
+  D       : (batch, to, from, voi) modulations by the VOIs
+  transit : (batch, voi) log scaling of the transit time
+  decay   : (batch, voi) log scaling of the signal decay
+  epsilon : (batch,) log ratio of intra- to extravascular signal
+    """
+    def __init__(self, A, B, C, D, transit=None, decay=None, epsilon=None):
+        self.A = np.asarray(A, dtype=np.float64)
+        self.B = np.asarray(B, dtype=np.float64)
+        self.C = np.asarray(C, dtype=np.float64)
+        self.D = np.asarray(D, dtype=np.float64)
+        batch, n = self.A.shape[0:2]
+        self.transit = np.zeros((batch, n)) if transit is None else np.asarray(transit)
+        self.decay = np.zeros((batch, n)) if decay is None else np.asarray(decay)
+        self.epsilon = np.zeros(batch) if epsilon is None else np.asarray(epsilon)
+
+    def Size(self):
+        return self.A.shape[0]
+
+    def IsNonlinear(self):
+        return bool(np.any(self.D != 0))
+
+    def Effective(self):
+        """
+        Returns the A matrices with the effective self-connections
+        (-exp(A_ii)/2) on the diagonal.
+        """
+        A = self.A.copy()
+        n = A.shape[1]
+        i = np.arange(n)
+        A[:, i, i] = -np.exp(self.A[:, i, i]) / 2.0
+        return A
+
+    def Stable(self):
+        """
+        Returns a boolean (batch,) array, True where the effective A
+        matrix (without modulations) has only eigenvalues with a
+        negative real part.
+        """
+        return np.max(np.linalg.eigvals(self.Effective()).real, axis=1) < 0
+
+    def Save(self, fileName):
+        np.savez(fileName, A=self.A, B=self.B, C=self.C, D=self.D,
+                 transit=self.transit, decay=self.decay, epsilon=self.epsilon)
+
+
+def model_masks(model):
+    """
+Returns the 'a', 'b', 'c', and 'd' matrices of a model (see
+model_to_arrays in dcm-generate-models.py), with the inputs that are
+not used by the model removed.
+    """
+    gen = sys.modules.get("dcm_generate_models") or load_generator()
+    model.Check()
+    return gen.model_to_arrays(model)
+
+
+def sample_parameters(masks, batch, rng=None, sd=None, self_sd=0.1, hemo_sd=0.0,
+                      max_tries=100):
+    """
+Draws 'batch' sets of parameters for the connections present in the
+masks (see model_masks). Each parameter is drawn from a normal
+distribution with the mean and standard deviation of 'sd' (a
+dictionary of (mean, sd) per matrix), the log self-inhibitions from
+N(0, self_sd), and the hemodynamic parameters from N(0, hemo_sd).
+Unstable sets (see Parameters.Stable) are drawn again.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    if sd is None:
+        sd = {'a' : (0.1, 0.1), 'b' : (0.0, 0.1), 'c' : (1.0, 0.2), 'd' : (0.0, 0.05)}
+
+    def draw(m, size):
+        mask = np.asarray(masks[m], dtype=bool)
+        mean, s = sd[m]
+        return (mean + s * rng.standard_normal((size,) + mask.shape)) * mask
+
+    n = masks['a'].shape[0]
+    i = np.arange(n)
+    params = None
+    todo = np.arange(batch)
+    for k in range(max_tries):
+        A = draw('a', len(todo))
+        A[:, i, i] = self_sd * rng.standard_normal((len(todo), n))
+        new = Parameters(A, draw('b', len(todo)), draw('c', len(todo)), draw('d', len(todo)),
+                         hemo_sd * rng.standard_normal((len(todo), n)),
+                         hemo_sd * rng.standard_normal((len(todo), n)),
+                         hemo_sd * rng.standard_normal(len(todo)))
+        if params is None:
+            params = new
+        else:
+            for x in ['A', 'B', 'C', 'D', 'transit', 'decay', 'epsilon']:
+                getattr(params, x)[todo] = getattr(new, x)
+        todo = np.flatnonzero(~params.Stable())
+        if len(todo) == 0:
+            return params
+    raise Exception("Could not draw stable parameters")
+
+
+def block_inputs(nscans, TR, ninputs, block=20.0, microtime=MICROTIME):
+    """
+Returns a (time, input) array of boxcar inputs, sampled at TR /
+'microtime', where each input is on during one block (of 'block'
+secs) out of ninputs + 1, at a different time for each input.
+    """
+    dt = TR / microtime
+    t = np.arange(nscans * microtime) * dt
+    cycle = (np.floor(t / block).astype(int)) % (ninputs + 1)
+    return np.array([cycle == (j + 1) for j in range(ninputs)], dtype=np.float64).T.reshape(
+        (len(t), ninputs))
+
+
+def derivatives(params, A, states, u, bilinear=True, nonlinear=True):
+    """
+Returns the derivatives of the (batch, voi, 5) states, for the
+effective A matrices and the (batch, input) inputs u of a time step.
+The states are x, s, log f, log v, and log q. The B (or D) terms are
+skipped unless 'bilinear' (or 'nonlinear') is set.
+    """
+    x = states[..., 0]
+    s = states[..., 1]
+    f = np.exp(states[..., 2])
+    v = np.exp(states[..., 3])
+    q = np.exp(states[..., 4])
+
+    J = A
+    if bilinear:
+        J = J + np.einsum('btfi,bi->btf', params.B, u)
+    if nonlinear:
+        J = J + np.einsum('btfk,bk->btf', params.D, x)
+    dx = np.einsum('btf,bf->bt', J, x) + INPUT_SCALE * np.einsum('bti,bi->bt', params.C, u)
+
+    kappa = KAPPA * np.exp(params.decay)
+    tau = TAU * np.exp(params.transit)
+    fv = v ** (1.0 / ALPHA)
+    ff = (1.0 - (1.0 - E0) ** (1.0 / f)) / E0
+
+    d = np.empty_like(states)
+    d[..., 0] = dx
+    d[..., 1] = x - kappa * s - GAMMA * (f - 1.0)
+    d[..., 2] = s / f
+    d[..., 3] = (f - fv) / (tau * v)
+    d[..., 4] = (f * ff - fv * q / v) / (tau * q)
+    return d
+
+
+def bold(params, states, TE=0.04):
+    """
+Returns the BOLD signal of the (..., batch, voi, 5) states, as
+spm_gx_fmri.
+    """
+    v = np.exp(states[..., 3])
+    q = np.exp(states[..., 4])
+    epsilon = np.exp(params.epsilon)[:, None]
+    k1 = 4.3 * NU0 * E0 * TE
+    k2 = epsilon * R0 * E0 * TE
+    k3 = 1.0 - epsilon
+    return V0 * (k1 * (1.0 - q) + k2 * (1.0 - q / v) + k3 * (1.0 - v))
+
+
+def simulate(params, U, TR, TE=0.04, microtime=MICROTIME):
+    """
+Integrates all the parameter sets at once. U is a (time, input)
+array of inputs, shared by all the sets, or a (batch, time, input)
+array, sampled at TR / 'microtime'. Returns the (batch, scan, voi)
+BOLD signal, sampled at the end of each scan, and the (batch, scan,
+voi) neuronal states.
+    """
+    U = np.asarray(U, dtype=np.float64)
+    if U.ndim == 2:
+        U = np.broadcast_to(U, (params.Size(),) + U.shape)
+    batch, T, _ = U.shape
+    n = params.A.shape[1]
+    nscans = T // microtime
+    dt = TR / microtime
+
+    A = params.Effective()
+    flags = (bool(np.any(params.B != 0)), params.IsNonlinear())
+    states = np.zeros((batch, n, 5))
+    y = np.empty((nscans, batch, n))
+    x = np.empty((nscans, batch, n))
+    for t in range(nscans * microtime):
+        u = U[:, t]
+        k1 = derivatives(params, A, states, u, *flags)
+        k2 = derivatives(params, A, states + dt / 2 * k1, u, *flags)
+        k3 = derivatives(params, A, states + dt / 2 * k2, u, *flags)
+        k4 = derivatives(params, A, states + dt * k3, u, *flags)
+        states = states + dt / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+        if (t + 1) % microtime == 0:
+            y[t // microtime] = bold(params, states, TE)
+            x[t // microtime] = states[..., 0]
+
+    return y.transpose((1, 0, 2)), x.transpose((1, 0, 2))
+
+
+def add_noise(y, snr, rng=None):
+    """
+Adds white noise to (batch, scan, voi) signals, with a standard
+deviation of 1/snr of that of each signal (no noise if snr is 0).
+    """
+    if not snr:
+        return y
+    if rng is None:
+        rng = np.random.default_rng()
+    sd = np.std(y, axis=1, keepdims=True) / snr
+    return y + sd * rng.standard_normal(y.shape)
+
+
+def save_series(y, outDir, prefix="sub-"):
+    """
+Writes each (scan, voi) series of y as <outDir>/<prefix><K>/cmc.txt.
+    """
+    for k, series in enumerate(y):
+        folder = os.path.join(outDir, "%s%d" % (prefix, k + 1))
+        if not os.path.isdir(folder):
+            os.makedirs(folder, exist_ok=True)
+        np.savetxt(os.path.join(folder, "cmc.txt"), series, fmt="%.15g", delimiter="\t")
+
+
+if __name__ == "__main__":
+    opts, args = getopt.getopt(sys.argv[1:], "n:s:r:b:N:x:")
+    opts = dict(opts)
+    if len(args) < 2:
+        print(HLP_MSG)
+    else:
+        gen = load_generator()
+        model = gen.parse_file(args[0])
+        masks = model_masks(model)
+        rng = np.random.default_rng(int(opts.get("-x", 0)))
+
+        nsubj = int(opts.get("-n", 100))
+        nscans = int(opts.get("-s", 405))
+        TR = float(opts.get("-r", 0.72))
+
+        params = sample_parameters(masks, nsubj, rng)
+        U = block_inputs(nscans, TR, masks['c'].shape[1], float(opts.get("-b", 20.0)))
+        y, x = simulate(params, U, TR, model.te)
+        y = add_noise(y, float(opts.get("-N", 0)), rng)
+
+        save_series(y, args[1])
+        params.Save(os.path.join(args[1], "parameters.npz"))
+        print("%s: %d subjects, %d scans, %d VOIs (%s)" %
+              (model.name, nsubj, nscans, len(model.vois), ", ".join(model.vois)))
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# ------------------------------------------------------------------ #
+# Scores the Granger connectivity of every subject against every
+# candidate architecture of tfMRI/granger/architectures.tsv (CMC,
+# hubs, and hierarchical models) with broadcasted array operations.
+#
+# --- History ------------------------------------------------------ #
+#
+# 2026-10-18 : * File created.
+# ------------------------------------------------------------------ #
+
+HLP_MSG="""
+Usage
+-----
+  $ granger_architectures.py [-a <alpha>] [-c <column>] [-d]
+                             <architectures.tsv> <granger1.tsv> ...
+
+Where:
+
+  <architectures.tsv> is the file describing the architectures, with
+    columns Model, From, To, and Link (e.g. tfMRI/granger/
+    architectures.tsv).
+  <grangerX.tsv> is a file of Granger results (see granger_var.py or
+    granger_null.py), one per task.
+  <alpha> is the significance level used to turn p-values into links
+    (default is 0.05).
+  <column> is the column with the p-values (default is 'p').
+  -d includes the self-connections (the diagonal), which are left
+    out by default because the Granger tests only concern
+    connections between different VOIs.
+
+Prints, for each task and architecture, the mean number of hits,
+misses, false alarms, and correct rejections per subject, the mean
+overlap, the log-likelihood, and the group-level posterior
+probability of the architecture.
+
+Scoring
+-------
+Architectures are loaded into a boolean (model, from, to) array,
+and the significant connections of each subject into a boolean
+(subject, from, to) array; all the counts are then computed at once
+by broadcasting them against each other.
+
+The likelihood of a subject's connections under an architecture is
+a Bernoulli model of each connection: a connection of the
+architecture is found with probability h (the hit rate), and a
+connection outside of it with probability f (the false alarm rate).
+Unless given, h and f are the maximum likelihood estimates of each
+architecture in each task. Assuming a uniform prior over
+architectures, the group-level posterior is proportional to the
+product of the likelihoods of all subjects (i.e., fixed effects).
+"""
+
+import sys, os, getopt
+import numpy as np
+
+VOIS = ['Action', 'LTM', 'Perception', 'Procedural', 'WM']
+
+
+def load_architectures(fileName, vois=VOIS):
+    """
+Loads the architectures of a TSV file (columns Model, From, To, and
+Link) into a boolean (model, from, to) array. Returns the list of
+model names (in order of appearance) and the array. Files without a
+Model column (e.g. cmc_theory.txt) hold a single architecture, named
+after the file.
+    """
+    f = open(fileName, 'r')
+    lines = [x.split('\t') for x in f.read().split('\n') if len(x.strip()) > 0]
+    f.close()
+
+    header = [x.strip() for x in lines[0]]
+    if "Model" not in header:
+        name = os.path.splitext(os.path.basename(fileName))[0]
+        header.append("Model")
+        lines = [lines[0]] + [x + [name] for x in lines[1:]]
+    cm, cf, ct, cl = [header.index(x) for x in ["Model", "From", "To", "Link"]]
+
+    names = []
+    for row in lines[1:]:
+        if row[cm] not in names:
+            names.append(row[cm])
+
+    index = dict((x, i) for i, x in enumerate(vois))
+    arch = np.zeros((len(names), len(vois), len(vois)), dtype=bool)
+    for row in lines[1:]:
+        arch[names.index(row[cm]), index[row[cf]], index[row[ct].strip()]] = \
+            float(row[cl]) > 0
+    return names, arch
+
+
+def load_significance(fileName, alpha=0.05, column="p", vois=VOIS):
+    """
+Reads a file of Granger results (with columns Task, Subject, From,
+To, and a p-value column) and returns the task(s), the subjects, and
+a boolean (subject, from, to) array of significant connections.
+Connections that are not in the file (e.g. the diagonal) are False.
+    """
+    f = open(fileName, 'r')
+    lines = [x.split('\t') for x in f.read().split('\n') if len(x.strip()) > 0]
+    f.close()
+
+    header = lines[0]
+    cs, cf, ct, cp = [header.index(x) for x in ["Subject", "From", "To", column]]
+    tasks = sorted(set(x[header.index("Task")] for x in lines[1:]))
+
+    subjects = []
+    sindex = {}
+    for row in lines[1:]:
+        if row[cs] not in sindex:
+            sindex[row[cs]] = len(subjects)
+            subjects.append(row[cs])
+
+    index = dict((x, i) for i, x in enumerate(vois))
+    rows = np.array([sindex[x[cs]] for x in lines[1:]])
+    frm = np.array([index[x[cf]] for x in lines[1:]])
+    to = np.array([index[x[ct]] for x in lines[1:]])
+    pvals = np.array([x[cp] for x in lines[1:]], dtype=float)
+
+    sig = np.zeros((len(subjects), len(vois), len(vois)), dtype=bool)
+    sig[rows, frm, to] = pvals < alpha
+    return tasks, subjects, sig
+
+
+def edge_mask(K=len(VOIS), diagonal=False):
+    """
+Returns the (from, to) boolean mask of the connections to score.
+    """
+    mask = np.ones((K, K), dtype=bool)
+    if not diagonal:
+        mask[np.diag_indices(K)] = False
+    return mask
+
+
+def score(sig, arch, mask=None):
+    """
+Compares the (subject, from, to) significant connections against the
+(model, from, to) architectures. Returns a dictionary of (subject,
+model) arrays: 'hits', 'misses', 'false_alarms', and
+'correct_rejections' (counts), and 'overlap' (the proportion of
+correctly classified connections).
+    """
+    if mask is None:
+        mask = edge_mask(sig.shape[1])
+    s = (sig & mask)[:, None].reshape(sig.shape[0], 1, -1)
+    a = (arch & mask)[None].reshape(1, arch.shape[0], -1)
+    m = mask.reshape(1, 1, -1)
+
+    hits = np.sum(s & a, axis=2)
+    misses = np.sum(~s & a, axis=2)
+    fas = np.sum(s & ~a & m, axis=2)
+    crs = np.sum(~s & ~a & m, axis=2)
+    return {'hits' : hits,
+            'misses' : misses,
+            'false_alarms' : fas,
+            'correct_rejections' : crs,
+            'overlap' : (hits + crs) / float(mask.sum())}
+
+
+def rates(counts):
+    """
+Returns the maximum likelihood hit and false alarm rates of each
+model, pooling all the subjects, as two (model,) arrays.
+    """
+    h = counts['hits'].sum(0) / np.maximum(1, (counts['hits'] + counts['misses']).sum(0))
+    f = counts['false_alarms'].sum(0) / \
+        np.maximum(1, (counts['false_alarms'] + counts['correct_rejections']).sum(0))
+    return h, f
+
+
+def log_likelihood(counts, h=None, f=None, eps=1e-6):
+    """
+Returns the (subject, model) log-likelihood of each subject's
+connections under each architecture (see HLP_MSG). The hit and false
+alarm rates 'h' and 'f' can be scalars or (model,) arrays; by default
+they are estimated from the counts. Rates are clipped to [eps, 1-eps].
+    """
+    if h is None or f is None:
+        hh, ff = rates(counts)
+        h = hh if h is None else h
+        f = ff if f is None else f
+    h = np.clip(h, eps, 1 - eps)
+    f = np.clip(f, eps, 1 - eps)
+    return counts['hits'] * np.log(h) + counts['misses'] * np.log(1 - h) + \
+        counts['false_alarms'] * np.log(f) + \
+        counts['correct_rejections'] * np.log(1 - f)
+
+
+def posteriors(loglik, axis=-1):
+    """
+Normalizes log-likelihoods into posterior probabilities along an
+axis (uniform prior).
+    """
+    x = loglik - loglik.max(axis=axis, keepdims=True)
+    p = np.exp(x)
+    return p / p.sum(axis=axis, keepdims=True)
+
+
+def group_posteriors(loglik):
+    """
+Returns the fixed-effects group posterior of each model, given the
+(subject, model) log-likelihoods.
+    """
+    return posteriors(loglik.sum(axis=0))
+
+
+if __name__ == "__main__":
+    opts, args = getopt.getopt(sys.argv[1:], "a:c:d")
+    opts = dict(opts)
+    if len(args) < 2:
+        print(HLP_MSG)
+    else:
+        names, arch = load_architectures(args[0])
+        mask = edge_mask(arch.shape[1], diagonal="-d" in opts)
+        print("Task\tModel\tHits\tMisses\tFalseAlarms\tCorrectRejections\tOverlap\tLogLik\tPosterior")
+        for fileName in args[1:]:
+            tasks, subjects, sig = load_significance(fileName,
+                                                     alpha=float(opts.get("-a", 0.05)),
+                                                     column=opts.get("-c", "p"))
+            counts = score(sig, arch, mask)
+            loglik = log_likelihood(counts)
+            post = group_posteriors(loglik)
+            for m, name in enumerate(names):
+                print("%s\t%s\t%.3f\t%.3f\t%.3f\t%.3f\t%.4f\t%.3f\t%.4f" %
+                      (",".join(tasks), name,
+                       counts['hits'][:, m].mean(), counts['misses'][:, m].mean(),
+                       counts['false_alarms'][:, m].mean(),
+                       counts['correct_rejections'][:, m].mean(),
+                       counts['overlap'][:, m].mean(), loglik[:, m].sum(), post[m]))
@@ -0,0 +1,359 @@
+#!/usr/bin/env python
+# ------------------------------------------------------------------ #
+# Null distributions of the pairwise Granger statistics, built from
+# surrogates of each subject's time series, and the corresponding
+# empirical p-values of each connection.
+#
+# --- History ------------------------------------------------------ #
+#
+# 2026-10-18 : * File created.
+#              * Saved chunks are only reused with the same settings.
+#              * Spectra are computed once per task and shared by the workers.
+# ------------------------------------------------------------------ #
+
+HLP_MSG="""
+Usage
+-----
+  $ granger_null.py [-j <workers>] [-n <surrogates>] [-c <chunk>]
+                    [-s <seed>] [-m phase|block] [-b <block_len>]
+                    [-o <out_dir>] <root_dir> [<task1> <task2> ...]
+
+Where:
+
+  <root_dir> is the folder with the Granger time series (see
+    granger_series.py), e.g. tfMRI/granger.
+  <taskX> is the name of a task (default is all tasks).
+  <workers> is the number of worker processes (default is 1).
+  <surrogates> is the number of surrogates per subject (default is
+    1000).
+  <chunk> is the number of surrogates per job (default is 20; the
+    memory used by each worker grows with it).
+  <seed> is the seed of the random number generator (default is 0).
+  -m selects the kind of surrogates: 'phase' (default) or 'block'.
+  <block_len> is the length of the blocks of the 'block' surrogates
+    (default is 20 time points).
+  <out_dir> is the folder where the results are written (default is
+    <root_dir>).
+
+For each task, writes <out_dir>/<Task>_null.tsv with one row per
+subject and connection, and columns Task, Subject, Lag, From, To, F
+(the observed pairwise Granger statistic), N (the number of
+surrogates), and p (the empirical p-value).
+
+Surrogates
+----------
+'phase' surrogates keep the amplitude spectrum of each VOI's series
+and randomize its phases, independently for each VOI. 'block'
+surrogates cut each VOI's series into blocks and shuffle them,
+independently for each VOI. In both cases the autocorrelation of
+each VOI is (approximately) preserved, while the dependencies
+between VOIs are destroyed, which is the null hypothesis of the
+Granger test. The Fourier transform of each subject's series is
+computed only once and reused for all of its surrogates: the series
+and spectra of each task are copied once into shared memory, which
+all the workers read without copying.
+
+Each surrogate is analyzed with the lag selected for the original
+series (see granger_var.py). The empirical p-value of a connection
+is (1 + number of surrogates with F >= observed F) / (1 + N).
+
+Checkpoints
+-----------
+Surrogates are generated in chunks. Each chunk has its own seed
+(derived from <seed> and the chunk's number), so the results do not
+depend on the number of workers. The counts of each chunk are saved
+in <out_dir>/<Task>_null/chunk_<K>.npz as soon as it is done; when
+the same command is run again, completed chunks are skipped. The
+folder also holds a manifest.json with the options of the run
+(<surrogates>, <chunk>, <seed>, -m and <block_len>), a signature of
+the series files, and a digest of the observed statistics; when any
+of them changes, the saved chunks are deleted and run again.
+"""
+
+import sys, os, getopt, json, hashlib
+import multiprocessing
+import numpy as np
+
+import granger_series
+import granger_var
+import shared_arrays
+
+TASKS = granger_series.TASKS
+
+VOIS = granger_series.VOIS
+
+
+def subject_spectra(series):
+    """
+Computes the Fourier transform of each subject's (time, VOI) series,
+once. Returns a list of (spectrum, length) pairs.
+    """
+    return [(np.fft.rfft(x, axis=0), len(x)) for x in series]
+
+
+def phase_surrogates(spectrum, T, n, rng):
+    """
+Creates 'n' phase-randomized surrogates of a series, given its
+(frequency, VOI) Fourier transform. Phases are random for each VOI,
+except for the zero frequency (and the Nyquist frequency, for even
+lengths), which keep their original phase, so that the surrogates
+are real and have the same mean. Returns an (n, time, VOI) array.
+    """
+    nf, K = spectrum.shape
+    phases = rng.uniform(0, 2 * np.pi, size=(n, nf, K))
+    phases[:, 0, :] = np.angle(spectrum[0])
+    if T % 2 == 0:
+        phases[:, -1, :] = np.angle(spectrum[-1])
+    return np.fft.irfft(np.abs(spectrum) * np.exp(1j * phases), n=T, axis=1)
+
+
+def block_surrogates(x, n, rng, block_len=20):
+    """
+Creates 'n' block-shuffled surrogates of a (time, VOI) series. The
+series is cut into consecutive blocks of 'block_len' time points,
+which are shuffled independently for each VOI (the remaining time
+points at the end stay in place). Returns an (n, time, VOI) array.
+    """
+    T, K = x.shape
+    nb = T // block_len
+    out = np.empty((n, T, K))
+    out[:, nb * block_len:, :] = x[nb * block_len:]
+
+    blocks = x[:nb * block_len].reshape(nb, block_len, K)
+    order = np.argsort(rng.random((n, nb, K)), axis=1)         # (n, nb, K)
+    k = np.arange(K)[None, None, :]
+    shuffled = blocks[order, :, k]                             # (n, nb, K, L)
+    out[:, :nb * block_len, :] = shuffled.transpose(0, 1, 3, 2).reshape(n, nb * block_len, K)
+    return out
+
+
+def chunk_rng(seed, task, chunk):
+    """
+Returns the random number generator of a chunk, which only depends
+on the seed, the task, and the chunk's number.
+    """
+    return np.random.default_rng([seed, TASKS.index(task) if task in TASKS else 0, chunk])
+
+
+def null_counts(series, spectra, lags, F, n, rng, method="phase", block_len=20):
+    """
+Generates 'n' surrogates of each subject and counts, for each
+subject and connection, how many have a Granger F at least as large
+as the observed one. Subjects with the same lag are analyzed in one
+batch. Returns a (subject, from, to) array of counts.
+    """
+    S = len(series)
+    K = len(VOIS)
+    counts = np.zeros((S, K, K), dtype=np.int64)
+
+    for p in np.unique(lags):
+        idx = np.where(lags == p)[0]
+        batch = []
+        for s in idx:
+            if method == "phase":
+                spectrum, T = spectra[s]
+                batch += list(phase_surrogates(spectrum, T, n, rng))
+            else:
+                batch += list(block_surrogates(np.asarray(series[s]), n, rng,
+                                               block_len=block_len))
+
+        Y, lengths = granger_var.pad_series(batch)
+        Z, X, nobs = granger_var.lagged_design(Y, lengths, p)
+        fit = granger_var.fit_var(Z, X, nobs, p)
+        Fnull, Pnull = granger_var.pairwise_granger(fit)
+        Fnull = Fnull.reshape((len(idx), n, K, K))
+        counts[idx] += np.sum(Fnull >= F[idx][:, None], axis=1)
+
+    return counts
+
+
+def chunk_path(outDir, task, chunk):
+    return os.path.join(outDir, "%s_null" % task, "chunk_%05d.npz" % chunk)
+
+
+def run_manifest(root, task, lags, F, nsurr, chunk, seed, method, block_len):
+    """
+Returns the settings and inputs that the chunks of a task depend on:
+the options of the run, a signature of the series (see
+granger_series.files_signature), and a digest of the observed lags
+and F statistics.
+    """
+    subjects, files = granger_series.subject_files(root, task)
+    digest = hashlib.sha1(np.ascontiguousarray(lags, dtype=np.int64).tobytes() +
+                          np.ascontiguousarray(F, dtype=np.float64).tobytes()).hexdigest()
+    return {'nsurr' : nsurr, 'chunk' : chunk, 'seed' : seed, 'method' : method,
+            'block_len' : block_len,
+            'series' : [[os.path.relpath(x[0], root)] + x[1:]
+                        for x in granger_series.files_signature(files)],
+            'observed' : digest}
+
+
+def check_manifest(folder, manifest):
+    """
+Compares the manifest saved in a task's chunk folder with the one of
+the current run. If they differ (or there is none), the saved chunks
+cannot be reused: they are deleted, and the new manifest is saved.
+    """
+    path = os.path.join(folder, "manifest.json")
+    if os.path.exists(path):
+        f = open(path, 'r')
+        saved = json.load(f)
+        f.close()
+        if saved == json.loads(json.dumps(manifest)):
+            return
+
+    stale = [x for x in os.listdir(folder) if x.startswith("chunk_")]
+    if len(stale) > 0:
+        print("%s: settings changed, removing %d saved chunk(s)" % (folder, len(stale)),
+              file=sys.stderr)
+    for x in stale:
+        os.remove(os.path.join(folder, x))
+    tmp = path + ".tmp"
+    f = open(tmp, 'w')
+    json.dump(manifest, f)
+    f.close()
+    os.replace(tmp, path)
+
+
+def observed(root, task, lag_max=10):
+    """
+Returns the store, the selected lags, and the observed pairwise F
+statistics of a task.
+    """
+    store = granger_series.load_store(root, task)
+    series = [store.Series(i) for i in range(len(store))]
+    lags, F, P, coefP = granger_var.granger_series_batch(series, lag_max=lag_max)
+    return store, lags, F
+
+
+def task_arrays(store, lags, F, method):
+    """
+Returns the arrays needed by the chunks of a task, to be shared by
+the workers: the series and their offsets, the observed lags and F
+statistics, and (for phase surrogates) the spectra of all the
+subjects, concatenated, with their offsets.
+    """
+    arrays = {'data' : np.asarray(store.data), 'offsets' : store.offsets,
+              'lags' : lags, 'F' : F}
+    if method == "phase":
+        spectra = subject_spectra([store.Series(i) for i in range(len(store))])
+        arrays['spectra'] = np.concatenate([x[0] for x in spectra]) if len(spectra) > 0 \
+            else np.zeros((0, len(VOIS)), dtype=complex)
+        arrays['spectrum_offsets'] = np.concatenate(
+            [[0], np.cumsum([len(x[0]) for x in spectra])]).astype(np.int64)
+    return arrays
+
+
+def _null_job(args):
+    """
+Runs one chunk of surrogates for a task, and saves its counts.
+    """
+    task, chunk, n, seed, method, block_len, path = args
+    get = lambda name: shared_arrays.get("%s/%s" % (task, name))
+    data, offsets = get('data'), get('offsets')
+    series = [data[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+    spectra = None
+    if method == "phase":
+        spec, so = get('spectra'), get('spectrum_offsets')
+        spectra = [(spec[so[i]:so[i + 1]], len(x)) for i, x in enumerate(series)]
+    counts = null_counts(series, spectra, get('lags'), get('F'), n,
+                         chunk_rng(seed, task, chunk), method=method, block_len=block_len)
+    tmp = path[:-4] + ".tmp.npz"
+    np.savez(tmp, counts=counts, n=n)
+    os.replace(tmp, path)
+    return task, chunk
+
+
+def run_null(root, tasks, outDir, nsurr=1000, chunk=20, seed=0, method="phase",
+             block_len=20, workers=1):
+    """
+Runs the surrogates of all tasks in chunks (skipping the chunks that
+are already saved), and writes the empirical p-values of each task.
+    """
+    obs = {}
+    arrays = {}
+    jobs = []
+    for task in tasks:
+        store, lags, F = observed(root, task)
+        obs[task] = (store, lags, F)
+        folder = os.path.join(outDir, "%s_null" % task)
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        check_manifest(folder, run_manifest(root, task, lags, F, nsurr, chunk,
+                                            seed, method, block_len))
+
+        for k, start in enumerate(range(0, nsurr, chunk)):
+            path = chunk_path(outDir, task, k)
+            if not os.path.exists(path):
+                jobs.append((task, k, min(chunk, nsurr - start),
+                             seed, method, block_len, path))
+
+        # The spectra are computed once per task, for all its chunks
+        if any(x[0] == task for x in jobs):
+            for name, x in task_arrays(store, lags, F, method).items():
+                arrays["%s/%s" % (task, name)] = x
+
+    print("%d chunk(s) to run" % len(jobs), file=sys.stderr)
+    blocks, specs = shared_arrays.share(arrays)
+    try:
+        if workers > 1 and len(jobs) > 1:
+            pool = multiprocessing.Pool(min(workers, len(jobs)), shared_arrays.attach, (specs,))
+            done = pool.imap_unordered(_null_job, jobs)
+        else:
+            pool = None
+            shared_arrays.attach(specs)
+            done = map(_null_job, jobs)
+
+        for task, k in done:
+            print("%s: chunk %d done" % (task, k), file=sys.stderr)
+
+        if pool is not None:
+            pool.close()
+            pool.join()
+    finally:
+        shared_arrays.release(blocks)
+
+    for task in tasks:
+        store, lags, F = obs[task]
+        counts = 0
+        n = 0
+        for k in range(len(range(0, nsurr, chunk))):
+            data = np.load(chunk_path(outDir, task, k))
+            counts = counts + data['counts']
+            n += int(data['n'])
+        if n != nsurr:
+            raise Exception("%s: the chunks have %d surrogates instead of %d" %
+                            (task, n, nsurr))
+        pvals = (1.0 + counts) / (1.0 + n)
+        write_null(os.path.join(outDir, "%s_null.tsv" % task), task,
+                   store.subjects, lags, F, n, pvals)
+
+
+def write_null(fileName, task, subjects, lags, F, n, pvals):
+    out = open(fileName, 'w', buffering=1 << 16)
+    out.write("Task\tSubject\tLag\tFrom\tTo\tF\tN\tp\n")
+    K = len(VOIS)
+    for s, subj in enumerate(subjects):
+        for i in range(K):
+            for j in range(K):
+                if i != j:
+                    out.write("%s\t%s\t%d\t%s\t%s\t%.6f\t%d\t%.6g\n" %
+                              (task, subj, lags[s], VOIS[i], VOIS[j],
+                               F[s, i, j], n, pvals[s, i, j]))
+    out.close()
+
+
+if __name__ == "__main__":
+    opts, args = getopt.getopt(sys.argv[1:], "j:n:c:s:m:b:o:")
+    opts = dict(opts)
+    if len(args) < 1 or opts.get("-m", "phase") not in ["phase", "block"]:
+        print(HLP_MSG)
+    else:
+        root = args[0]
+        run_null(root, args[1:] or TASKS, opts.get("-o", root),
+                 nsurr=int(opts.get("-n", 1000)),
+                 chunk=int(opts.get("-c", 20)),
+                 seed=int(opts.get("-s", 0)),
+                 method=opts.get("-m", "phase"),
+                 block_len=int(opts.get("-b", 20)),
+                 workers=int(opts.get("-j", 1)))
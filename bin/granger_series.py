@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# ------------------------------------------------------------------ #
+# Packs the time series used in the Granger causality analysis
+# (<Task>/sub-<ID>/cmc.txt) into one memory-mapped array per task,
+# from which each subject's series can be sliced without copying.
+#
+# --- History ------------------------------------------------------ #
+#
+# 2026-10-18 : * File created.
+# ------------------------------------------------------------------ #
+
+HLP_MSG="""
+Usage
+-----
+  $ granger_series.py [-f32] <root_dir> [<task1> <task2> ...]
+
+Where:
+
+  <root_dir> is the folder containing one subfolder per task (e.g.,
+    tfMRI/granger), each with one sub-<ID>/cmc.txt file per subject.
+  <taskX> is the name of a task (default is all tasks).
+  -f32 stores the data in single precision (default is double).
+
+Builds (or updates) the store of each task and prints a summary.
+
+Store
+-----
+Each cmc.txt file holds one row per time point, and one column per
+VOI (Action, LTM, Perception, Procedural, WM). The rows of all the
+subjects of a task are stacked into a single (time, VOI) array,
+saved as <root_dir>/.cache/<Task>_cmc.npy, and the subjects and the
+offsets of their first rows are saved in <Task>_cmc.json. Subjects
+can have different numbers of rows. The store is rebuilt whenever a
+cmc.txt file is added, removed, or changed.
+"""
+
+import sys, os, json, glob
+import numpy as np
+
+TASKS = ["Emotion", "Gambling", "Language", "Relational", "Social", "WM"]
+
+VOIS = ['Action', 'LTM', 'Perception', 'Procedural', 'WM']
+
+CACHE_DIR = ".cache"
+
+
+def read_series(fileName, dtype=np.float64):
+    """
+Reads a whitespace-separated cmc.txt file as a (time, VOI) array.
+    """
+    f = open(fileName, 'r')
+    values = np.array(f.read().split(), dtype=dtype)
+    f.close()
+    return values.reshape((-1, len(VOIS)))
+
+
+def subject_files(root, task):
+    """
+Returns the sorted lists of subjects and cmc.txt files of a task.
+    """
+    files = sorted(glob.glob(os.path.join(root, task, "sub-*", "cmc.txt")))
+    subjects = [os.path.basename(os.path.dirname(x))[4:] for x in files]
+    return subjects, files
+
+
+class SeriesStore(object):
+    """
+The time series of all the subjects of a task.
+
+  data     : (time, VOI) array with the rows of all subjects
+  subjects : list of subject IDs
+  offsets  : array with the first row of each subject, plus the
+             total number of rows
+    """
+    def __init__(self, task, data, subjects, offsets):
+        self.task = task
+        self.data = data
+        self.subjects = subjects
+        self.offsets = np.asarray(offsets)
+        self.subject_index = dict((x, i) for i, x in enumerate(subjects))
+
+    def __len__(self):
+        return len(self.subjects)
+
+    def __iter__(self):
+        for i, subj in enumerate(self.subjects):
+            yield subj, self.Series(i)
+
+    def Series(self, i):
+        """
+        Returns the (time, VOI) series of the i-th subject, as a view
+        on the store.
+        """
+        return self.data[self.offsets[i]:self.offsets[i + 1]]
+
+    def Subject(self, subj):
+        """
+        Returns the (time, VOI) series of a subject (by ID).
+        """
+        return self.Series(self.subject_index[subj])
+
+    def Lengths(self):
+        """
+        Returns the number of time points of each subject.
+        """
+        return np.diff(self.offsets)
+
+
+def build_store(root, task, dtype=np.float64):
+    """
+Reads all the cmc.txt files of a task into a SeriesStore.
+    """
+    subjects, files = subject_files(root, task)
+    series = [read_series(x, dtype=dtype) for x in files]
+    offsets = np.concatenate([[0], np.cumsum([len(x) for x in series])])
+    if len(series) > 0:
+        data = np.concatenate(series)
+    else:
+        data = np.zeros((0, len(VOIS)), dtype=dtype)
+    return SeriesStore(task, data, subjects, offsets)
+
+
+def files_signature(files):
+    """
+Returns the size and modification time of each file, which are
+used to check whether a store is still valid.
+    """
+    sig = []
+    for fileName in files:
+        st = os.stat(fileName)
+        sig.append([fileName, st.st_size, st.st_mtime])
+    return sig
+
+
+def load_store(root, task, dtype=np.float64, cacheDir=None, mmap=True):
+    """
+Loads the SeriesStore of a task from 'cacheDir' (by default,
+<root>/.cache), building it first if it is missing or out of date.
+With 'mmap', the data are memory-mapped (read-only).
+    """
+    if cacheDir is None:
+        cacheDir = os.path.join(root, CACHE_DIR)
+
+    base = os.path.join(cacheDir, "%s_cmc" % task)
+    subjects, files = subject_files(root, task)
+    sig = files_signature(files)
+    dtype = np.dtype(dtype)
+
+    if os.path.exists(base + ".json") and os.path.exists(base + ".npy"):
+        f = open(base + ".json", 'r')
+        index = json.load(f)
+        f.close()
+        if index['signature'] == sig and index['dtype'] == dtype.name:
+            data = np.load(base + ".npy", mmap_mode='r' if mmap else None)
+            return SeriesStore(task, data, index['subjects'], index['offsets'])
+
+    store = build_store(root, task, dtype=dtype)
+
+    if not os.path.isdir(cacheDir):
+        os.makedirs(cacheDir, exist_ok=True)
+    np.save(base + ".npy", store.data)
+    f = open(base + ".json", 'w')
+    json.dump({'signature' : sig,
+               'dtype' : dtype.name,
+               'subjects' : store.subjects,
+               'offsets' : [int(x) for x in store.offsets]}, f)
+    f.close()
+
+    if mmap:
+        store.data = np.load(base + ".npy", mmap_mode='r')
+    return store
+
+
+def load_all(root, tasks=TASKS, dtype=np.float64, cacheDir=None):
+    """
+Loads the stores of all tasks, as a dictionary indexed by task.
+    """
+    return dict((task, load_store(root, task, dtype=dtype, cacheDir=cacheDir))
+                for task in tasks)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    dtype = np.float64
+    if len(args) > 0 and args[0] == "-f32":
+        dtype = np.float32
+        args = args[1:]
+
+    if len(args) < 1:
+        print(HLP_MSG)
+    else:
+        for task in (args[1:] or TASKS):
+            s = load_store(args[0], task, dtype=dtype)
+            L = s.Lengths()
+            print("%s: %d subjects, %d rows (%d-%d per subject), %s" %
+                  (task, len(s), len(s.data), L.min(), L.max(), s.data.dtype))
@@ -0,0 +1,363 @@
+#!/usr/bin/env python
+# ------------------------------------------------------------------ #
+# Batched vector autoregressive (VAR) models and Granger causality
+# tests for all the subjects of a task at once. This is the Python
+# counterpart of the VARselect()/VAR()/causality() calls in
+# tfMRI/granger/granger_all.Rmd.
+#
+# --- History ------------------------------------------------------ #
+#
+# 2026-10-18 : * File created.
+#              * Lag selection derives the fits of all lags from the
+#                design of the largest one.
+# ------------------------------------------------------------------ #
+
+HLP_MSG="""
+Usage
+-----
+  $ granger_var.py [-j <workers>] [-l <lag_max>] [-o <out_dir>]
+                   <root_dir> [<task1> <task2> ...]
+
+Where:
+
+  <root_dir> is the folder with the Granger time series (see
+    granger_series.py), e.g. tfMRI/granger.
+  <taskX> is the name of a task (default is all tasks).
+  <workers> is the number of tasks analyzed in parallel (default 1).
+  <lag_max> is the maximum lag considered (default is 10, as in
+    vars::VARselect).
+  <out_dir> is the folder where the results are written (default is
+    <root_dir>).
+
+For each task, writes <out_dir>/<Task>_granger.tsv with one row per
+subject and connection, and columns Task, Subject, Lag, From, To, F,
+p (the pairwise Granger test), and Coef_p (the smallest p-value of
+the connection's VAR coefficients across lags, as in
+granger_all.Rmd).
+
+Method
+------
+As in granger_all.Rmd, the lag of each subject is selected with the
+Schwarz Criterion (SC) of vars::VARselect(), i.e. using models with a
+constant and the same sample for all lags. The VAR is then fitted
+without a constant (type = "none"). All four criteria (AIC, HQ, SC,
+and FPE) are computed from a single factorization per subject (see
+select_lags()).
+
+All the subjects of a task are fitted together: their series are
+zero-padded to the same length, the lagged design matrices are
+stacked (padded rows are masked out), and the normal equations of
+all subjects are solved in one batched operation for each lag.
+
+The Granger test of a connection From -> To is the Wald F-test used
+by vars::causality(), with the restriction limited to the lags of
+From in the equation of To. With cause = From and all the other
+VOIs as effects, causality_test() gives the same statistic as
+vars::causality(x, cause = From)$Granger.
+"""
+
+import sys, os, getopt
+import multiprocessing
+import numpy as np
+import scipy.stats
+
+import granger_series
+
+VOIS = granger_series.VOIS
+
+TASKS = granger_series.TASKS
+
+CRITERIA = ['AIC', 'HQ', 'SC', 'FPE']
+
+
+def pad_series(series):
+    """
+Stacks a list of (time, VOI) series into a zero-padded array of
+shape (subject, time, VOI). Returns the array and the lengths.
+    """
+    lengths = np.array([len(x) for x in series])
+    Y = np.zeros((len(series), lengths.max(), series[0].shape[1]))
+    for i, x in enumerate(series):
+        Y[i, :len(x)] = x
+    return Y, lengths
+
+
+def lagged_design(Y, lengths, p, start=None, const=False):
+    """
+Builds the stacked design matrices of a VAR(p) for all subjects.
+The rows are the time points from 'start' (by default, p) to the
+end; rows beyond the length of a subject's series are zeroed.
+Columns follow the order used by vars: all the VOIs at lag 1, then
+all the VOIs at lag 2, and so on, plus an optional constant.
+
+Returns Z (subject, row, column), the targets X (subject, row,
+VOI), and the number of valid rows of each subject.
+    """
+    S, T, K = Y.shape
+    if start is None:
+        start = p
+
+    cols = [Y[:, start - l:T - l, :] for l in range(1, p + 1)]
+    if const:
+        cols.append(np.ones((S, T - start, 1)))
+    Z = np.concatenate(cols, axis=2)
+    X = Y[:, start:, :]
+
+    mask = np.arange(start, T)[None, :] < lengths[:, None]
+    Z = Z * mask[:, :, None]
+    X = X * mask[:, :, None]
+    return Z, X, lengths - start
+
+
+class VARFit(object):
+    """
+The least-squares fits of a VAR(p) for a batch of subjects.
+
+  B      : (subject, column, VOI) coefficients; column j of VOI i
+           is the effect of regressor j in the equation of VOI i
+  ZtZinv : (subject, column, column) inverse of Z'Z
+  resid  : (subject, VOI, VOI) cross-products of the residuals
+  nobs   : number of observations of each subject
+    """
+    def __init__(self, B, ZtZinv, resid, nobs, p):
+        self.B = B
+        self.ZtZinv = ZtZinv
+        self.resid = resid
+        self.nobs = nobs
+        self.p = p
+        self.K = B.shape[2]
+        self.m = B.shape[1]
+
+    def Sigma(self):
+        """
+        Returns the (subject, VOI, VOI) residual covariance, with
+        the degrees of freedom correction used by vars.
+        """
+        df = (self.nobs - self.m).astype(float)
+        return self.resid / df[:, None, None]
+
+
+def fit_var(Z, X, nobs, p):
+    """
+Fits the VAR models of all subjects at once by solving the normal
+equations with a batched Cholesky factorization.
+    """
+    Zt = Z.transpose(0, 2, 1)
+    ZtZ = np.matmul(Zt, Z)
+    ZtX = np.matmul(Zt, X)
+
+    L = np.linalg.cholesky(ZtZ)
+    I = np.broadcast_to(np.eye(ZtZ.shape[1]), ZtZ.shape)
+    Linv = np.linalg.solve(L, I)
+    ZtZinv = np.matmul(Linv.transpose(0, 2, 1), Linv)
+    B = np.matmul(ZtZinv, ZtX)
+
+    E = X - np.matmul(Z, B)
+    resid = np.matmul(E.transpose(0, 2, 1), E)
+    return VARFit(B, ZtZinv, resid, nobs, p)
+
+
+def information_criteria(logdet, nobs, p, K, nconst=1):
+    """
+Returns the AIC, HQ, SC, and FPE criteria computed by vars::VARselect,
+as a (criterion, ...) array, given the log-determinant of the ML
+residual covariance.
+    """
+    npar = p * K * K + K * nconst
+    nstar = p * K + nconst
+    n = nobs.astype(float)
+    return np.array([logdet + 2.0 / n * npar,
+                     logdet + 2.0 * np.log(np.log(n)) / n * npar,
+                     logdet + np.log(n) / n * npar,
+                     ((n + nstar) / (n - nstar)) ** K * np.exp(logdet)])
+
+
+def select_lags(Y, lengths, lag_max=10, criterion='SC'):
+    """
+Selects the lag of each subject as vars::VARselect(type = "const")
+does, i.e. comparing VARs with a constant for each lag on the same
+sample. Returns the selected lags and the (criterion, lag, subject)
+values of all four criteria.
+
+Instead of fitting one VAR per lag, the design of the largest lag is
+built once, with the constant first: the design of each smaller lag
+is then a leading block of columns, and its Gram matrix a leading
+block of the full one. The Cholesky factor L of the full Gram matrix
+contains the factors of all the blocks, so with W = L^-1 Z'X the
+residual cross-products of lag p are X'X minus the sum of w_r w_r'
+over the first 1 + pK rows of W (as in a nested QR decomposition).
+    """
+    K = Y.shape[2]
+    Z, X, nobs = lagged_design(Y, lengths, lag_max, const=True)
+    Z = np.concatenate([Z[:, :, -1:], Z[:, :, :-1]], axis=2)
+
+    Zt = Z.transpose(0, 2, 1)
+    L = np.linalg.cholesky(np.matmul(Zt, Z))
+    W = np.linalg.solve(L, np.matmul(Zt, X))
+    XtX = np.matmul(X.transpose(0, 2, 1), X)
+
+    explained = np.cumsum(np.einsum('smi,smj->smij', W, W), axis=1)
+    rows = [p * K for p in range(1, lag_max + 1)]  # i.e., 1 + pK - 1
+    resid = XtX[:, None] - explained[:, rows]
+
+    logdet = np.linalg.slogdet(resid / nobs[:, None, None, None])[1]
+    values = np.array([information_criteria(logdet[:, i], nobs, p, K)
+                       for i, p in enumerate(range(1, lag_max + 1))])
+    values = values.transpose(1, 0, 2)
+    lags = np.argmin(values[CRITERIA.index(criterion)], axis=0) + 1
+    return lags, values
+
+
+def causality_test(fit, cause, effects):
+    """
+Wald F-test that the lags of VOI 'cause' have no effect on the
+equations of the VOIs in 'effects', for all subjects. The
+covariance of the coefficients is Sigma x (Z'Z)^-1, as in
+vars::causality(). Returns the F statistics, the p-values, and the
+degrees of freedom.
+    """
+    S, K, p = fit.B.shape[0], fit.K, fit.p
+    effects = list(effects)
+    E = len(effects)
+    R = [l * K + cause for l in range(p)]
+
+    b = fit.B[:, R][:, :, effects].transpose(0, 2, 1).reshape(S, E * p)
+    C = fit.ZtZinv[:, R][:, :, R]
+    sigma = fit.Sigma()[:, effects][:, :, effects]
+    V = np.einsum('sab,sij->saibj', sigma, C).reshape(S, E * p, E * p)
+
+    W = np.einsum('si,si->s', b, np.linalg.solve(V, b[:, :, None])[:, :, 0])
+    df1 = p * E
+    df2 = K * (fit.nobs - fit.m)
+    F = W / df1
+    return F, scipy.stats.f.sf(F, df1, df2), (df1, df2)
+
+
+def pairwise_granger(fit):
+    """
+Runs the Granger test of every connection. Returns (subject, from,
+to) arrays of F statistics and p-values; the diagonal is NaN.
+    """
+    S, K = fit.B.shape[0], fit.K
+    F = np.full((S, K, K), np.nan)
+    P = np.full((S, K, K), np.nan)
+    for i in range(K):
+        for j in range(K):
+            if i != j:
+                F[:, i, j], P[:, i, j], df = causality_test(fit, i, [j])
+    return F, P
+
+
+def coefficient_pvalues(fit):
+    """
+Returns the smallest p-value (across lags) of the t-tests on the VAR
+coefficients of each connection, as a (subject, from, to) array. This
+is the statistic used in granger_all.Rmd.
+    """
+    S, K, p = fit.B.shape[0], fit.K, fit.p
+    sigma = np.diagonal(fit.Sigma(), axis1=1, axis2=2)          # (S, K)
+    var = np.diagonal(fit.ZtZinv, axis1=1, axis2=2)[:, :K * p]  # (S, Kp)
+    se = np.sqrt(var[:, :, None] * sigma[:, None, :])
+    t = fit.B[:, :K * p, :] / se
+    df = (fit.nobs - fit.m).astype(float)
+    pvals = 2 * scipy.stats.t.sf(np.abs(t), df[:, None, None])
+    return pvals.reshape(S, p, K, K).min(axis=1)
+
+
+class GrangerResults(object):
+    """
+The Granger analysis of all the subjects of a task. The F, P, and
+Coef_P arrays have shape (subject, from, to).
+    """
+    def __init__(self, task, subjects, lags, F, P, coefP):
+        self.task = task
+        self.subjects = subjects
+        self.lags = lags
+        self.F = F
+        self.P = P
+        self.coefP = coefP
+
+    def Write(self, fileName):
+        out = open(fileName, 'w', buffering=1 << 16)
+        out.write("Task\tSubject\tLag\tFrom\tTo\tF\tp\tCoef_p\n")
+        K = len(VOIS)
+        for s, subj in enumerate(self.subjects):
+            for i in range(K):
+                for j in range(K):
+                    if i != j:
+                        out.write("%s\t%s\t%d\t%s\t%s\t%.6f\t%.6g\t%.6g\n" %
+                                  (self.task, subj, self.lags[s], VOIS[i],
+                                   VOIS[j], self.F[s, i, j], self.P[s, i, j],
+                                   self.coefP[s, i, j]))
+        out.close()
+
+
+def granger_series_batch(series, lag_max=10, criterion='SC'):
+    """
+Runs the Granger analysis of a list of (time, VOI) series. Subjects
+are grouped by selected lag, and each group is fitted in one batch.
+Returns the lags and the (subject, from, to) F, p, and coefficient
+p-value arrays.
+    """
+    Y, lengths = pad_series(series)
+    S, T, K = Y.shape
+    lags, values = select_lags(Y, lengths, lag_max=lag_max,
+                               criterion=criterion)
+
+    F = np.full((S, K, K), np.nan)
+    P = np.full((S, K, K), np.nan)
+    coefP = np.full((S, K, K), np.nan)
+    for p in np.unique(lags):
+        idx = np.where(lags == p)[0]
+        Z, X, nobs = lagged_design(Y[idx], lengths[idx], p)
+        fit = fit_var(Z, X, nobs, p)
+        F[idx], P[idx] = pairwise_granger(fit)
+        coefP[idx] = coefficient_pvalues(fit)
+
+    return lags, F, P, coefP
+
+
+def granger_task(root, task, lag_max=10, criterion='SC'):
+    """
+Runs the Granger analysis of all the subjects of a task.
+    """
+    store = granger_series.load_store(root, task)
+    series = [store.Series(i) for i in range(len(store))]
+    lags, F, P, coefP = granger_series_batch(series, lag_max=lag_max,
+                                             criterion=criterion)
+    return GrangerResults(task, store.subjects, lags, F, P, coefP)
+
+
+def _granger_job(args):
+    root, task, lag_max, outDir = args
+    res = granger_task(root, task, lag_max=lag_max)
+    res.Write(os.path.join(outDir, "%s_granger.tsv" % task))
+    return task, len(res.subjects)
+
+
+if __name__ == "__main__":
+    opts, args = getopt.getopt(sys.argv[1:], "j:l:o:")
+    opts = dict(opts)
+    if len(args) < 1:
+        print(HLP_MSG)
+    else:
+        root = args[0]
+        tasks = args[1:] or TASKS
+        outDir = opts.get("-o", root)
+        workers = int(opts.get("-j", 1))
+        jobs = [(root, x, int(opts.get("-l", 10)), outDir) for x in tasks]
+
+        # Builds the stores first, so that workers do not race
+        for task in tasks:
+            granger_series.load_store(root, task)
+
+        if workers > 1:
+            pool = multiprocessing.Pool(min(workers, len(jobs)))
+            results = pool.map(_granger_job, jobs)
+            pool.close()
+            pool.join()
+        else:
+            results = [_granger_job(x) for x in jobs]
+
+        for task, n in results:
+            print("%s: %d subjects" % (task, n), file=sys.stderr)
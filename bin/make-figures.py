@@ -0,0 +1,339 @@
+#!/usr/bin/env python
+# ------------------------------------------------------------------ #
+# Renders all the brain figures of create_figures.py, super_figure.py
+# and figS3.py, as a graph of tasks with their input files: only the
+# figures whose inputs have changed are redrawn, and independent
+# figures are rendered in parallel (with the Agg backend).
+#
+# --- History ------------------------------------------------------ #
+#
+# 2026-10-18 : * File created.
+# ------------------------------------------------------------------ #
+
+HLP_MSG="""
+Usage
+-----
+  $ make-figures.py [-j <workers>] [-f] [-n] [-d <root_dir>] [<figure1> ...]
+
+Where:
+
+  <root_dir> is the folder with one subfolder per task, where the
+    figures are written (default is the current folder; e.g.
+    tfMRI/all_architectures).
+  <figureX> is the name of a figure to draw (e.g. 'surface:WM' or
+    'uberfigure'; default is all of them), or of a task, to draw all
+    of its figures (e.g. 'WM').
+  <workers> is the number of worker processes (default is 1).
+  -f redraws the figures even if they are up to date.
+  -n only prints the figures that would be drawn.
+
+Graph
+-----
+Each figure is declared with the function that draws it, its output
+files, its input files (including the scripts themselves), and the
+preprocessing steps it needs: the rectified and smoothed T-maps (see
+tmap_cache.py) and their surface projections (see surf_cache.py).
+
+A figure is drawn when one of its outputs is missing, or when the
+contents of one of its inputs changed since it was last drawn (the
+hashes of the inputs are saved in <root_dir>/.cache/figures.json).
+The preprocessing steps needed by those figures are run first, and
+each step or figure is started as soon as the steps it depends on
+are done, so a change in one task only redraws the panels of that
+task (and the multi-task figures).
+"""
+
+import sys, os, json, getopt, time
+import multiprocessing
+import queue
+import importlib
+
+BIN_DIR = os.path.dirname(os.path.abspath(__file__))
+
+CACHE_DIR = ".cache"
+
+STATE = "figures.json"
+
+TASKS = ["Emotion", "Social", "Relational", "WM", "Language", "Gambling"]
+
+VOIS = ['Action', 'LTM', 'Perception', 'Procedural', 'WM']
+
+
+class Node(object):
+    """
+A preprocessing step or a figure of the graph.
+
+  name     : unique name (e.g. 'surface:WM')
+  module   : module of the function that draws it (in bin/)
+  function : name of the function
+  args     : arguments of the function
+  inputs   : input files (the module's source is always included)
+  outputs  : output files (none for preprocessing steps)
+  deps     : names of the nodes that must be run first
+    """
+    def __init__(self, name, module, function, args=(), inputs=(), outputs=(), deps=()):
+        self.name = name
+        self.module = module
+        self.function = function
+        self.args = tuple(args)
+        self.inputs = list(inputs) + [os.path.join(BIN_DIR, module + ".py")]
+        self.outputs = list(outputs)
+        self.deps = list(deps)
+
+    def IsFigure(self):
+        return len(self.outputs) > 0
+
+
+def tmap(task):
+    return os.path.join(task, "spmT_0001.nii")
+
+
+def vois_files(task):
+    return [os.path.join(task, "vois.txt")] + \
+        [os.path.join(task, "%s_xyz.txt" % voi) for voi in VOIS]
+
+
+def figure_graph(tasks=TASKS):
+    """
+Returns the list of nodes of all the figures, in an order where
+every node comes after its dependencies.
+    """
+    helpers = [os.path.join(BIN_DIR, x) for x in ["tmap_cache.py", "surf_cache.py"]]
+    loader = [os.path.join(BIN_DIR, "voi_coords.py")]
+    nodes = []
+    for t in tasks:
+        nodes += [Node("tmap:%s" % t, "tmap_cache", "load_tmap", (t,), [tmap(t)]),
+                  Node("texture:%s" % t, "make-figures", "textures", (t, 4),
+                       [tmap(t)], deps=["tmap:%s" % t]),
+                  Node("texture2:%s" % t, "make-figures", "textures", (t, 2),
+                       [tmap(t)])]
+
+    for t in tasks:
+        nodes += [Node("surface:%s" % t, "create_figures", "surface_figures", (t,),
+                       [tmap(t)] + helpers,
+                       ["%s_left.png" % t, "%s_right.png" % t],
+                       ["texture:%s" % t]),
+                  Node("xz:%s" % t, "create_figures", "xz_figure", (t,),
+                       [tmap(t)],
+                       ["%s_xz.png" % t]),
+                  Node("glass:%s" % t, "create_figures", "glass_brain_figures", (t,),
+                       [tmap(t)] + vois_files(t) + loader,
+                       ["%s_gb_left.png" % t, "%s_gb_left_group_markers.png" % t,
+                        "%s_gb_left_individual_markers.png" % t])]
+
+    if "Relational" in tasks:
+        nodes.append(Node("leftview", "create_figures", "left_view", (),
+                          [tmap("Relational")], ["leftview.png"]))
+
+    every = [x for t in tasks for x in [tmap(t)] + vois_files(t)]
+    for name in ["uberfigure", "uberfigure2", "uberfigure3"]:
+        nodes.append(Node(name, "super_figure", name, (), every + helpers + loader,
+                          ["%s.png" % name], ["tmap:%s" % t for t in tasks]))
+    nodes.append(Node("AllVisuals", "figS3", "all_visuals", (),
+                      [tmap(t) for t in tasks] + helpers, ["AllVisuals.png"],
+                      ["texture2:%s" % t for t in tasks]))
+    return nodes
+
+
+def textures(task, fwhm):
+    """
+Computes the surface projections of a task (see surf_cache.py).
+    """
+    import surf_cache
+    from nilearn import datasets
+    surf_cache.task_textures(task, datasets.fetch_surf_fsaverage("fsaverage5"), fwhm=fwhm)
+
+
+def file_hash(fileName):
+    """
+Returns the SHA-1 hash of a file, or None if it does not exist.
+    """
+    import hashlib
+    if not os.path.exists(fileName):
+        return None
+    h = hashlib.sha1()
+    f = open(fileName, 'rb')
+    for block in iter(lambda: f.read(1 << 20), b""):
+        h.update(block)
+    f.close()
+    return h.hexdigest()
+
+
+def signature(node, hashes):
+    """
+Returns the hashes of the inputs of a node (hashes are memoized in
+the 'hashes' dictionary).
+    """
+    for x in node.inputs:
+        if x not in hashes:
+            hashes[x] = file_hash(x)
+    return [[x, hashes[x]] for x in node.inputs]
+
+
+def read_state(root):
+    path = os.path.join(root, CACHE_DIR, STATE)
+    if not os.path.exists(path):
+        return {}
+    f = open(path, 'r')
+    state = json.load(f)
+    f.close()
+    return state
+
+
+def write_state(root, state):
+    folder = os.path.join(root, CACHE_DIR)
+    if not os.path.isdir(folder):
+        os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, STATE)
+    f = open(path + ".tmp", 'w')
+    json.dump(state, f, indent=1)
+    f.close()
+    os.replace(path + ".tmp", path)
+
+
+def select(nodes, targets):
+    """
+Returns the figures named in 'targets' (figure names, or task names
+for all the figures of a task); all figures if 'targets' is empty.
+    """
+    figures = [x for x in nodes if x.IsFigure()]
+    if not targets:
+        return figures
+    return [x for x in figures
+            if x.name in targets or x.name.split(":")[-1] in targets]
+
+
+def plan(nodes, targets, state, hashes, force=False):
+    """
+Returns the names of the figures to draw and of all the nodes to
+run (the figures and their dependencies).
+    """
+    byname = dict((x.name, x) for x in nodes)
+    stale = []
+    for node in select(nodes, targets):
+        if force or not all(os.path.exists(x) for x in node.outputs) or \
+           state.get(node.name) != signature(node, hashes):
+            stale.append(node.name)
+
+    needed = set()
+    todo = list(stale)
+    while todo:
+        name = todo.pop()
+        if name not in needed:
+            needed.add(name)
+            todo += byname[name].deps
+    return stale, needed
+
+
+def _run_node(module, function, args):
+    """
+Runs one node in a worker: imports its module (with the Agg
+backend) and calls its function. Returns the time it took.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    if BIN_DIR not in sys.path:
+        sys.path.insert(0, BIN_DIR)
+
+    start = time.time()
+    if module == "make-figures":
+        getattr(sys.modules[__name__], function)(*args)
+    else:
+        getattr(importlib.import_module(module), function)(*args)
+        import matplotlib.pyplot as plt
+        plt.close('all')
+    return time.time() - start
+
+
+def run_graph(root, targets=(), tasks=TASKS, workers=1, force=False, dry=False):
+    """
+Draws the figures of 'targets' that are out of date (see HLP_MSG).
+Returns the list of nodes that failed.
+    """
+    os.chdir(root)
+    nodes = figure_graph(tasks)
+    byname = dict((x.name, x) for x in nodes)
+    state = read_state(".")
+    hashes = {}
+    stale, needed = plan(nodes, targets, state, hashes, force)
+
+    print("%d figure(s) to draw, %d step(s) in total" % (len(stale), len(needed)),
+          file=sys.stderr)
+    if dry:
+        for name in stale:
+            print(name)
+        return []
+
+    # Remaining dependencies of each node, and the nodes waiting on it
+    waiting = dict((x, set(d for d in byname[x].deps if d in needed)) for x in needed)
+    children = dict((x, []) for x in needed)
+    for x in needed:
+        for d in waiting[x]:
+            children[d].append(x)
+
+    done = queue.Queue()
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    failed = []
+    running = 0
+
+    def submit(name):
+        node = byname[name]
+        if pool is None:
+            try:
+                done.put((name, _run_node(node.module, node.function, node.args), None))
+            except Exception as e:
+                done.put((name, None, e))
+        else:
+            pool.apply_async(_run_node, (node.module, node.function, node.args),
+                             callback=lambda t: done.put((name, t, None)),
+                             error_callback=lambda e: done.put((name, None, e)))
+
+    ready = [x.name for x in nodes if x.name in needed and not waiting[x.name]]
+    while ready or running:
+        while ready:
+            running += 1
+            submit(ready.pop(0))
+
+        name, elapsed, error = done.get()
+        running -= 1
+        node = byname[name]
+        if error is not None:
+            print("%s: failed (%s)" % (name, error), file=sys.stderr)
+            failed.append(name)
+            # Nodes depending on a failed node are not run
+            todo = list(children[name])
+            while todo:
+                x = todo.pop()
+                if x in waiting:
+                    del waiting[x]
+                    failed.append(x)
+                    todo += children[x]
+            continue
+
+        print("%s: done in %.1f s" % (name, elapsed), file=sys.stderr)
+        if node.IsFigure():
+            state[name] = signature(node, hashes)
+            write_state(".", state)
+        for x in children[name]:
+            if x in waiting:
+                waiting[x].discard(name)
+                if not waiting[x]:
+                    ready.append(x)
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+    return failed
+
+
+if __name__ == "__main__":
+    opts, args = getopt.getopt(sys.argv[1:], "j:fnhd:")
+    opts = dict(opts)
+    if "-h" in opts:
+        print(HLP_MSG)
+    else:
+        failed = run_graph(opts.get("-d", "."), args, workers=int(opts.get("-j", 1)),
+                           force="-f" in opts, dry="-n" in opts)
+        if failed:
+            print("Failed: %s" % ", ".join(failed), file=sys.stderr)
+            sys.exit(1)
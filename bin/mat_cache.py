@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+# ------------------------------------------------------------------ #
+# Extracts the numeric fields of Matlab files (BMS.mat, DCM_*.mat) into
+# a folder of .npy files (or a single .npz file) with a JSON index, so
+# that any field can be opened lazily (and memory-mapped) without
+# parsing the whole Matlab structure again.
+#
+# Replaces tfMRI/all_architectures/WM/mat_to_py.py, which dumped the
+# variables of a .mat file as Python literals.
+#
+# --- History ------------------------------------------------------ #
+#
+# 2026-10-18 : * File created.
+# ------------------------------------------------------------------ #
+
+HLP_MSG="""
+Usage
+-----
+  $ mat_cache.py [-j <workers>] [-z] [-f] [-o <cache_dir>]
+                 <file1.mat> <file2.mat> ...
+
+Where:
+
+  <fileX.mat> is a Matlab file (e.g. <Task>/BMS.mat or DCM_*.mat).
+  <workers> is the number of files converted in parallel (default 1).
+  -z saves the fields in a single compressed .npz file, instead of
+    one .npy file per field (which can be memory-mapped).
+  -f converts the files even if their cache is up to date.
+  <cache_dir> is the folder where the caches are saved (default is a
+    '.cache' folder next to each file).
+
+Converts each file (if its cache is missing or out of date) and
+prints the fields it contains.
+
+Cache
+-----
+The cache of <dir>/<name>.mat is the folder <dir>/.cache/<name>/ (or
+<name>.npz with -z; with -o, <cache_dir>/<name>_<hash>, where <hash>
+depends on the file's absolute path, so that files with the same
+name do not share a cache) with an index.json file listing, for each
+field, its path in the Matlab structure, its shape, and its type.
+Paths use Matlab notation, e.g. 'BMS.DCM.rfx.F' or 'DCM.Ep.A'; the
+elements of struct arrays and cell arrays are indexed with their
+(1-based) linear index, e.g. 'DCM.U.name{2}'. Numeric and logical
+arrays are saved with their Matlab shape and type; strings are kept
+in the index; other objects (e.g. function handles) are skipped.
+
+Use load_mat() to open a file through its cache:
+
+  m = load_mat("WM/BMS.mat")
+  F = m.Field("BMS.DCM.rfx.F")
+"""
+
+import sys, os, json, getopt, hashlib
+import multiprocessing
+import numpy as np
+import scipy.io
+import scipy.sparse
+
+CACHE_DIR = ".cache"
+
+INDEX = "index.json"
+
+
+def flatten(value, path, arrays, strings, skipped):
+    """
+Walks a value returned by scipy.io.loadmat and collects its numeric
+arrays (in 'arrays') and strings (in 'strings'), indexed by their
+path. The paths of other values are appended to 'skipped'.
+    """
+    if scipy.sparse.issparse(value):
+        arrays[path] = value.toarray()
+    elif not isinstance(value, np.ndarray):
+        skipped.append(path)
+    elif value.dtype.names is not None:
+        # Structure (or struct array)
+        for i, elem in enumerate(value.ravel(order='F')):
+            prefix = path if value.size == 1 else "%s(%d)" % (path, i + 1)
+            for name in value.dtype.names:
+                flatten(elem[name], "%s.%s" % (prefix, name), arrays, strings, skipped)
+    elif value.dtype.kind == 'O':
+        # Cell array
+        for i, elem in enumerate(value.ravel(order='F')):
+            flatten(elem, "%s{%d}" % (path, i + 1), arrays, strings, skipped)
+    elif value.dtype.kind == 'U':
+        strings[path] = [str(x) for x in value.ravel()] if value.size != 1 else str(value.ravel()[0])
+    elif value.dtype.kind in 'biufc':
+        arrays[path] = value
+    else:
+        skipped.append(path)
+
+
+def read_mat(fileName):
+    """
+Reads all the variables of a Matlab file. Returns dictionaries of
+arrays and strings indexed by path, and the list of skipped paths.
+    """
+    mat = scipy.io.loadmat(fileName, squeeze_me=False, struct_as_record=True)
+    arrays = {}
+    strings = {}
+    skipped = []
+    for name, value in mat.items():
+        if not name.startswith("__"):
+            flatten(value, name, arrays, strings, skipped)
+    return arrays, strings, skipped
+
+
+def cache_path(fileName, cacheDir=None, compressed=False):
+    """
+Returns the path of the cache of a Matlab file. In a shared
+'cacheDir', the name also has a hash of the file's absolute path, so
+that files with the same name (e.g. the BMS.mat of each task) have
+caches of their own.
+    """
+    folder, base = os.path.split(os.path.abspath(fileName))
+    name = os.path.splitext(base)[0]
+    if cacheDir is None:
+        cacheDir = os.path.join(folder, CACHE_DIR)
+    else:
+        name += "_" + hashlib.sha1(os.path.abspath(fileName).encode()).hexdigest()[:12]
+    return os.path.join(cacheDir, name + ".npz" if compressed else name)
+
+
+def file_signature(fileName):
+    st = os.stat(fileName)
+    return [os.path.abspath(fileName), st.st_size, st.st_mtime]
+
+
+class MatCache(object):
+    """
+The cached fields of a Matlab file. Arrays are only read when they
+are requested with Field().
+
+  path     : the cache folder (or .npz file)
+  index    : the contents of the JSON index
+    """
+    def __init__(self, path, index):
+        self.path = path
+        self.index = index
+        self.npz = None
+
+    def Fields(self):
+        """
+        Returns the paths of all the numeric fields.
+        """
+        return list(self.index['fields'].keys())
+
+    def Strings(self):
+        return self.index['strings']
+
+    def Field(self, name, mmap=True, squeeze=False):
+        """
+        Returns the array of a field (memory-mapped, unless 'mmap' is
+        False or the cache is compressed).
+        """
+        entry = self.index['fields'][name]
+        if self.index['compressed']:
+            if self.npz is None:
+                self.npz = np.load(self.path)
+            value = self.npz[entry['key']]
+        else:
+            value = np.load(os.path.join(self.path, entry['key'] + ".npy"),
+                            mmap_mode='r' if mmap else None)
+        return np.squeeze(value) if squeeze else value
+
+    def __contains__(self, name):
+        return name in self.index['fields'] or name in self.index['strings']
+
+    def __getitem__(self, name):
+        if name in self.index['strings']:
+            return self.index['strings'][name]
+        return self.Field(name)
+
+
+def convert(fileName, cacheDir=None, compressed=False):
+    """
+Converts a Matlab file into its cache, and returns the cache's path.
+    """
+    arrays, strings, skipped = read_mat(fileName)
+    path = cache_path(fileName, cacheDir, compressed)
+    fields = {}
+    data = {}
+    for i, (name, value) in enumerate(sorted(arrays.items())):
+        key = "f%04d" % i
+        fields[name] = {'key' : key,
+                        'shape' : list(value.shape),
+                        'dtype' : value.dtype.str}
+        data[key] = value
+
+    index = {'source' : file_signature(fileName),
+             'compressed' : compressed,
+             'fields' : fields,
+             'strings' : strings,
+             'skipped' : skipped}
+
+    folder = os.path.dirname(path)
+    if not os.path.isdir(folder):
+        os.makedirs(folder, exist_ok=True)
+
+    # Every file is written under a temporary name of this process
+    # first, so that parallel conversions never see partial files
+    pid = os.getpid()
+    if compressed:
+        tmp = path[:-4] + ".%d.tmp.npz" % pid
+        np.savez_compressed(tmp, **data)
+        os.replace(tmp, path)
+        indexName = path[:-4] + ".json"
+    else:
+        if not os.path.isdir(path):
+            os.makedirs(path, exist_ok=True)
+        for key, value in data.items():
+            tmp = os.path.join(path, "%s.%d.tmp.npy" % (key, pid))
+            np.save(tmp, value)
+            os.replace(tmp, os.path.join(path, key + ".npy"))
+        indexName = os.path.join(path, INDEX)
+    f = open(indexName + ".%d.tmp" % pid, 'w')
+    json.dump(index, f, indent=1)
+    f.close()
+    os.replace(indexName + ".%d.tmp" % pid, indexName)
+    return path
+
+
+def read_index(fileName, cacheDir=None, compressed=False):
+    """
+Returns the index of the cache of a Matlab file, or None if the
+cache is missing or out of date.
+    """
+    path = cache_path(fileName, cacheDir, compressed)
+    indexName = path[:-4] + ".json" if compressed else os.path.join(path, INDEX)
+    if not os.path.exists(indexName):
+        return None
+    f = open(indexName, 'r')
+    index = json.load(f)
+    f.close()
+    if index['source'] != file_signature(fileName):
+        return None
+    return index
+
+
+def load_mat(fileName, cacheDir=None, compressed=False):
+    """
+Opens a Matlab file through its cache, converting it first if the
+cache is missing or out of date. Returns a MatCache.
+    """
+    index = read_index(fileName, cacheDir, compressed)
+    if index is None:
+        convert(fileName, cacheDir, compressed)
+        index = read_index(fileName, cacheDir, compressed)
+    return MatCache(cache_path(fileName, cacheDir, compressed), index)
+
+
+def _convert_job(args):
+    fileName, cacheDir, compressed, force = args
+    if force or read_index(fileName, cacheDir, compressed) is None:
+        convert(fileName, cacheDir, compressed)
+    return fileName
+
+
+def convert_all(files, cacheDir=None, compressed=False, force=False, workers=1):
+    """
+Converts several Matlab files (skipping those with an up-to-date
+cache, unless 'force'), in parallel. Returns the list of MatCache.
+    """
+    jobs = [(x, cacheDir, compressed, force) for x in files]
+    if workers > 1 and len(jobs) > 1:
+        pool = multiprocessing.Pool(min(workers, len(jobs)))
+        list(pool.imap_unordered(_convert_job, jobs))
+        pool.close()
+        pool.join()
+    else:
+        for job in jobs:
+            _convert_job(job)
+    return [load_mat(x, cacheDir, compressed) for x in files]
+
+
+if __name__ == "__main__":
+    opts, args = getopt.getopt(sys.argv[1:], "j:zfo:")
+    opts = dict(opts)
+    if len(args) < 1:
+        print(HLP_MSG)
+    else:
+        caches = convert_all(args, cacheDir=opts.get("-o", None),
+                             compressed="-z" in opts, force="-f" in opts,
+                             workers=int(opts.get("-j", 1)))
+        for fileName, m in zip(args, caches):
+            print("%s -> %s" % (fileName, m.path))
+            for name, entry in m.index['fields'].items():
+                print("  %s\t%s\t%s" % (name, np.dtype(entry['dtype']).name,
+                                        "x".join(str(x) for x in entry['shape'])))
@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+# ------------------------------------------------------------------ #
+# Group-level statistics of the DCM parameters: arithmetic,
+# precision-weighted and Bayesian averages, with the posterior
+# probabilities of the connections, for any number of subsets of the
+# subjects and all tasks at once (the <Task>_avg_A.txt and
+# <Task>_avg_pA.txt files were computed by hand in Matlab).
+#
+# --- History ------------------------------------------------------ #
+#
+# 2026-10-18 : * File created.
+# ------------------------------------------------------------------ #
+
+HLP_MSG="""
+Usage
+-----
+  $ param_average.py [-m <matrix>] [-d <pattern>] [-v <pattern>]
+                     [-s <sets_file>] [-c] [-t <threshold>]
+                     [-o <out_dir>] [-x] <root_dir>
+
+Where:
+
+  <root_dir> is the folder containing one subfolder per task (e.g.,
+    tfMRI/all_architectures).
+  <matrix> is the DCM matrix (default is A; see dcm_params.py).
+  -d gives the pattern of the parameter tables, relative to
+    <root_dir> (default is dcm_params.PATTERN, i.e.
+    '%(task)s/DCM_smm_direct_data_%(matrix)s.txt').
+  -v gives the pattern of the tables with the posterior variances of
+    the parameters, in the same format (e.g., the _vA.txt tables of
+    dcm_estimate.py). Without it, see 'Method'.
+  <sets_file> is a text file defining subsets of the subjects, with
+    one subject per line, optionally preceded by the name of its set
+    ('<set> <subject>'; the default set is 'Subset'). All the
+    subjects form the set 'All'.
+  -c adds the set 'Complete', of the subjects with parameters in all
+    the tasks.
+  <threshold> is the threshold of the posterior probabilities
+    (default is 0, as in SPM).
+  <out_dir> is the folder where the results are written (default is
+    <root_dir>).
+  -x also writes, for the A and C matrices, the Bayesian average and
+    the posterior probabilities of each set as comma-separated
+    matrices (rows are the targets), in the format of the Matlab
+    files: <out_dir>/<Task>/<Task>_<set>_avg_<matrix>.txt and
+    <Task>_<set>_avg_p<matrix>.txt.
+
+Writes <out_dir>/group_<matrix>.tsv, with one row per set, task and
+connection, and the columns Set, Task, Connection, N (number of
+subjects), Mean, SD, Weighted (precision-weighted mean), Ep and Cp
+(mean and variance of the Bayesian average), and Pp (posterior
+probability).
+
+Method
+------
+All the parameters are read from the cached (task, subject, ...)
+array of dcm_params.py, and the subsets are a (set, subject) array of
+weights, so the sums needed by all the statistics of all the sets,
+tasks and connections are a single einsum. Missing subjects are left
+out of each task.
+
+With posterior variances, the precision-weighted mean weights each
+subject by its posterior precision, and the Bayesian average is the
+fixed-effects average of spm_dcm_average: the product of the
+posteriors of the subjects, divided N - 1 times by the prior (of
+spm_dcm_fmri_priors; with diagonal covariances). Subjects without a
+positive variance count in the arithmetic statistics (N, Mean, SD),
+but not in the precision-weighted and Bayesian ones. Without
+variances, all the subjects have the same precision (the weighted
+mean is the arithmetic mean), and the Bayesian average combines the
+prior with the distribution of the group mean (a normal of variance
+SD^2 / N).
+
+The posterior probability of a connection is the probability that
+its magnitude exceeds <threshold>, 1 - Ncdf(threshold, |Ep|, Cp), as
+in spm_dcm_review. Connections that are absent from a task's model
+(zero for all its subjects) are kept at zero, with a probability of
+NaN (as in smm_Pa.txt).
+"""
+
+import sys, os, getopt
+import numpy as np
+from scipy.special import ndtr
+
+import dcm_params
+import dcm_estimate
+
+# Prior means (of the connections between different regions) and
+# variances of spm_dcm_fmri_priors
+PRIORS = {'A' : (1.0 / 128, dcm_estimate.PRIOR_A),
+          'B' : (0.0, 1.0),
+          'C' : (0.0, dcm_estimate.PRIOR_C),
+          'D' : (0.0, 1.0)}
+
+STATISTICS = ["N", "Mean", "SD", "Weighted", "Ep", "Cp", "Pp"]
+
+
+def read_sets(fileName):
+    """
+Reads a file of subsets ('[<set>] <subject>' lines). Returns the
+list of set names, and a dictionary of the subjects of each set.
+    """
+    f = open(fileName, 'r')
+    rows = [x.split() for x in f.read().split('\n') if len(x.strip()) > 0]
+    f.close()
+    names = []
+    sets = {}
+    for row in rows:
+        name, subject = row if len(row) > 1 else ("Subset", row[0])
+        if name not in sets:
+            names.append(name)
+            sets[name] = []
+        sets[name].append(subject)
+    return names, sets
+
+
+def subject_sets(params, fileName=None, complete=False):
+    """
+Returns the names of the sets of subjects ('All', 'Complete' and
+those in 'fileName'), and their (set, subject) array of weights.
+    """
+    names = ["All"]
+    weights = [np.ones(len(params.subjects))]
+    if complete:
+        names.append("Complete")
+        weights.append(np.all(params.Present(), axis=0).astype(np.float64))
+    if fileName is not None:
+        setNames, sets = read_sets(fileName)
+        for name in setNames:
+            missing = [x for x in sets[name] if x not in params.subject_index]
+            if len(missing) > 0:
+                raise Exception("Unknown subjects in set %s: %s" % (name, missing))
+            w = np.zeros(len(params.subjects))
+            w[[params.subject_index[x] for x in sets[name]]] = 1.0
+            names.append(name)
+            weights.append(w)
+    return names, np.array(weights)
+
+
+def prior_moments(matrix, axes, present):
+    """
+Returns the prior means and variances of a (task, ...) array of
+parameters, where 'present' marks the connections of each task's
+model (the others are fixed at zero).
+    """
+    mean, var = PRIORS[matrix.upper()]
+    pE = np.where(present, mean, 0.0)
+    if matrix.upper() == 'A':
+        pE[:, np.eye(len(axes[0]), dtype=bool)] = 0.0
+    return pE, np.where(present, var, 0.0)
+
+
+def group_statistics(params, weights, variances=None, threshold=0.0):
+    """
+Computes the group statistics (see HLP_MSG) of the subjects' weights
+of each set, with the posterior variances in 'variances' (another
+Parameters object, with the same tasks and subjects) if given.
+Returns a dictionary of (set, task, ...) arrays, one per name in
+STATISTICS.
+    """
+    values = np.asarray(params.values)
+    ntask, nsubj = values.shape[0:2]
+    shape = values.shape[2:]
+    X = values.reshape((ntask, nsubj, -1))
+    ok = ~np.isnan(X)
+    X = np.where(ok, X, 0.0)
+    columns = [ok, X, X * X]
+    if variances is not None:
+        V = np.asarray(variances.values).reshape((ntask, nsubj, -1))
+        okV = ok & (V > 0)
+        P = np.where(okV, 1.0 / np.where(okV, V, 1.0), 0.0)
+        columns += [okV, P, P * X]
+
+    # All the sums of all the sets in one pass
+    sums = np.einsum('ns,tsck->cntk', np.asarray(weights, dtype=np.float64),
+                     np.stack(columns, axis=2))
+
+    present = np.any(X != 0, axis=1)
+    pE, pV = prior_moments(params.matrix, params.axes, present.reshape((ntask,) + shape))
+    pE = pE.reshape((1, ntask, -1))
+    pV = pV.reshape((1, ntask, -1))
+    ipV = np.where(pV > 0, 1.0 / np.where(pV > 0, pV, 1.0), 0.0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        n = sums[0]
+        mean = sums[1] / n
+        var = np.maximum(sums[2] - n * mean * mean, 0.0) / (n - 1)
+        if variances is not None:
+            nV = sums[3]
+            weighted = sums[5] / sums[4]
+            Pb = np.maximum(sums[4] - (nV - 1) * ipV, ipV)
+            Eb = (sums[5] - (nV - 1) * ipV * pE) / Pb
+        else:
+            weighted = mean
+            L = np.where((n > 1) & (var > 0), n / var, 0.0)
+            Pb = ipV + L
+            Eb = (ipV * pE + L * np.nan_to_num(mean)) / Pb
+
+        absent = ~present[None] | (Pb == 0)
+        Eb = np.where(absent, np.nan_to_num(mean), Eb)
+        Cb = np.where(absent, 0.0, 1.0 / Pb)
+        Pp = np.where(absent, np.nan, ndtr((np.abs(Eb) - threshold) / np.sqrt(Cb)))
+
+    stats = dict(zip(STATISTICS, [n, mean, np.sqrt(var), weighted, Eb, Cb, Pp]))
+    return dict((k, v.reshape(v.shape[0:2] + shape)) for k, v in stats.items())
+
+
+def connection_names(params, task):
+    """
+Returns the flat indices and the names (as the columns of the
+tables) of the connections of a task (without the padding of the
+input axis; see dcm_params.Parameters).
+    """
+    axes = list(params.axes)
+    if task in params.inputs:
+        axes[0] = params.inputs[task]
+    shape = tuple(len(x) for x in params.axes)
+    names = []
+    for flat, index in enumerate(np.ndindex(*shape)):
+        if all(i < len(a) for i, a in zip(index, axes)):
+            labels = [a[i] for i, a in zip(index, axes)]
+            if len(labels) == 2:
+                names.append((flat, "%s-to-%s" % tuple(labels)))
+            else:
+                names.append((flat, "%s-to-%s-by-%s" % (labels[1], labels[2], labels[0])))
+    return names
+
+
+def write_statistics(fileName, params, setNames, stats):
+    out = open(fileName, 'w')
+    out.write("Set\tTask\tConnection\t" + "\t".join(STATISTICS) + "\n")
+    nset, ntask = stats["N"].shape[0:2]
+    flat = [stats[x].reshape((nset, ntask, -1)) for x in STATISTICS]
+    for i, name in enumerate(setNames):
+        for t, task in enumerate(params.tasks):
+            for k, connection in connection_names(params, task):
+                out.write("%s\t%s\t%s\t%d\t" % (name, task, connection, flat[0][i, t, k]) +
+                          "\t".join("%.6g" % x[i, t, k] if np.isfinite(x[i, t, k]) else "NaN"
+                                    for x in flat[1:]) + "\n")
+    out.close()
+
+
+def write_matrix(fileName, matrix):
+    """
+Writes a (from, to) matrix as comma-separated values, with one row
+per target (the reverse of dcm_params.read_matrix).
+    """
+    f = open(fileName, 'w')
+    for row in matrix.T:
+        f.write(",".join("%.5g" % x if np.isfinite(x) else "NaN" for x in row) + "\n")
+    f.close()
+
+
+def save_matrices(outDir, params, setNames, stats):
+    """
+Writes the Bayesian average and the posterior probabilities of each
+set and task as <Task>_<set>_avg_<matrix>.txt and
+<Task>_<set>_avg_p<matrix>.txt (A and C matrices only).
+    """
+    for t, task in enumerate(params.tasks):
+        taskDir = os.path.join(outDir, task)
+        if not os.path.isdir(taskDir):
+            os.makedirs(taskDir, exist_ok=True)
+        ninputs = len(params.inputs.get(task, params.axes[0]))
+        for i, name in enumerate(setNames):
+            base = os.path.join(taskDir, "%s_%s_avg_" % (task, name))
+            write_matrix(base + "%s.txt" % params.matrix, stats["Ep"][i, t, 0:ninputs])
+            write_matrix(base + "p%s.txt" % params.matrix, stats["Pp"][i, t, 0:ninputs])
+
+
+if __name__ == "__main__":
+    opts, args = getopt.getopt(sys.argv[1:], "m:d:v:s:ct:o:x")
+    opts = dict(opts)
+    if len(args) < 1:
+        print(HLP_MSG)
+    else:
+        root = args[0]
+        outDir = opts.get("-o", root)
+        matrix = opts.get("-m", "A")
+        params = dcm_params.load_parameters(root, matrix,
+                                            pattern=opts.get("-d", dcm_params.PATTERN))
+        variances = None
+        if "-v" in opts:
+            # A cache of their own, so that the tables of the means and
+            # of the variances do not replace each other's
+            variances = dcm_params.load_parameters(
+                root, matrix, pattern=opts["-v"],
+                cacheDir=os.path.join(root, dcm_params.CACHE_DIR, "variances"))
+            variances = variances.Select(params.subjects, params.tasks)
+
+        setNames, weights = subject_sets(params, opts.get("-s", None), "-c" in opts)
+        stats = group_statistics(params, weights, variances, float(opts.get("-t", 0.0)))
+
+        if not os.path.isdir(outDir):
+            os.makedirs(outDir, exist_ok=True)
+        write_statistics(os.path.join(outDir, "group_%s.tsv" % matrix), params, setNames, stats)
+        if "-x" in opts:
+            if len(params.axes) != 2:
+                raise Exception("Only the A and C matrices can be written as matrices")
+            save_matrices(outDir, params, setNames, stats)
+
+        for i, name in enumerate(setNames):
+            for t, task in enumerate(params.tasks):
+                Pp = stats["Pp"][i, t]
+                print("%s\t%s\t%d subjects\t%d/%d connections with Pp > 0.95" %
+                      (name, task, np.max(stats["N"][i, t]),
+                       np.sum(Pp > 0.95), np.sum(np.isfinite(Pp))))
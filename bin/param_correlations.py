@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+# ------------------------------------------------------------------ #
+# Cross-task correlations of the DCM parameters (as param.analysis.R):
+# for each connection, the correlations of its values across the
+# subjects who completed all the tasks, for each pair of tasks, with
+# permutation p-values.
+#
+# --- History ------------------------------------------------------ #
+#
+# 2026-10-18 : * File created.
+# ------------------------------------------------------------------ #
+
+HLP_MSG="""
+Usage
+-----
+  $ param_correlations.py [-m <matrix>] [-t <table>] [-n <perms>]
+                          [-c <chunk>] [-j <workers>] [-s <seed>]
+                          [-o <out_dir>] [-p] <root_dir>
+
+Where:
+
+  <root_dir> is the folder containing one subfolder per task (e.g.,
+    tfMRI/all_architectures).
+  <matrix> is the DCM matrix (default is A; see dcm_params.py).
+  <table> is a table with the parameters of all the tasks, with a
+    Task column (e.g., <root_dir>/data_A.txt, as param.analysis.R);
+    by default, the tables of each task are read with dcm_params.py.
+  <perms> is the number of permutations (default is 10000; 0 skips
+    the permutation tests).
+  <chunk> is the number of permutations per job (default is 500).
+  <workers> is the number of worker processes (default is 1).
+  <seed> is the seed of the random numbers (default is 0).
+  <out_dir> is the folder where the results are written (default is
+    <root_dir>).
+  -p also draws the correlation matrix of each connection as
+    <out_dir>/<connection>.png (with the names of param.analysis.R,
+    e.g. 'Action.to.LTM.png').
+
+Writes <out_dir>/param_correlations.tsv, with one row per connection
+and pair of tasks, and columns Edge, Task1, Task2, N (number of
+subjects), r, and p, and prints the mean correlation of each
+connection across the pairs of different tasks (as param.analysis.R)
+with its p-value.
+
+Method
+------
+Only the subjects with parameters in all the tasks are kept (as in
+param.analysis.R, subjects with duplicated rows are left out; see
+dcm_params.py), and the connections with no variance (i.e., absent
+from the model) are dropped. The parameters are arranged once as a (subject, task, edge)
+tensor, and standardized along the subjects, so that all the
+(edge, task, task) correlations are a single einsum.
+
+Under the null hypothesis, the values of a connection in different
+tasks are unrelated, so the subjects are shuffled independently in
+each task. Permutations are run in batches (one einsum per batch)
+and in chunks, each with its own seed (derived from <seed> and the
+chunk's number), so the results do not depend on the number of
+workers. p-values are two-sided: (1 + number of permutations with
+|r| >= |observed r|) / (1 + N).
+"""
+
+import sys, os, getopt, itertools
+import multiprocessing
+import numpy as np
+
+import dcm_params
+
+# Number of permutations per einsum
+BATCH = 100
+
+
+def complete_tensor(params):
+    """
+Returns the (subject, task, edge) tensor of the subjects present in
+all the tasks, for the edges with some variance, with the list of
+subjects and the names of the edges (as the columns of the tables,
+e.g. '<from>-to-<to>').
+    """
+    present = np.all(params.Present(), axis=0)
+    values = np.asarray(params.values)[:, present]
+    ntask, nsubj = values.shape[0:2]
+    X = values.reshape((ntask, nsubj, -1)).transpose((1, 0, 2))
+
+    if len(params.axes) == 2:
+        names = ["%s-to-%s" % x for x in itertools.product(*params.axes)]
+    else:
+        names = ["%s-to-%s-by-%s" % (f, t, m) for m, f, t in itertools.product(*params.axes)]
+
+    keep = np.all(np.var(X, axis=0) > 0, axis=0) if nsubj > 1 else np.zeros(X.shape[2], bool)
+    subjects = [x for x, p in zip(params.subjects, present) if p]
+    return X[:, :, keep], subjects, [x for x, k in zip(names, keep) if k]
+
+
+def standardize(X):
+    """
+Standardizes a (subject, ...) array along the subjects, so that the
+correlations are Z' Z / (N - 1).
+    """
+    return (X - X.mean(axis=0)) / X.std(axis=0, ddof=1)
+
+
+def correlations(Z):
+    """
+Returns the (edge, task, task) correlations of a standardized
+(subject, task, edge) tensor.
+    """
+    return np.einsum('ste,sue->etu', Z, Z) / (Z.shape[0] - 1)
+
+
+def mean_offdiagonal(R):
+    """
+Returns the mean correlation between different tasks of (..., task,
+task) matrices.
+    """
+    k = R.shape[-1]
+    return (np.sum(R, axis=(-2, -1)) - np.trace(R, axis1=-2, axis2=-1)) / (k * (k - 1))
+
+
+def permutation_counts(Z, R, n, rng, batch=BATCH):
+    """
+Runs 'n' permutations of a standardized (subject, task, edge)
+tensor, shuffling the subjects independently in each task. Returns
+the (edge, task, task) counts of |r| >= |R|, and the (edge,) counts
+of |mean r| >= |mean R|.
+    """
+    nsubj, ntask, nedge = Z.shape
+    Zt = Z.transpose((1, 0, 2))
+    tasks = np.arange(ntask)[None, :, None]
+    absR = np.abs(R) - 1e-12
+    absM = np.abs(mean_offdiagonal(R)) - 1e-12
+    counts = np.zeros(R.shape, dtype=np.int64)
+    mcounts = np.zeros(nedge, dtype=np.int64)
+    for start in range(0, n, batch):
+        b = min(batch, n - start)
+        idx = np.argsort(rng.random((b, ntask, nsubj)), axis=2)
+        Zp = Zt[tasks, idx]
+        Rp = np.einsum('btse,buse->betu', Zp, Zp) / (nsubj - 1)
+        counts += np.sum(np.abs(Rp) >= absR, axis=0)
+        mcounts += np.sum(np.abs(mean_offdiagonal(Rp)) >= absM, axis=0)
+    return counts, mcounts
+
+
+def _permutation_job(args):
+    Z, R, n, seed, chunk = args
+    return permutation_counts(Z, R, n, np.random.default_rng([seed, chunk]))
+
+
+def permutation_pvalues(Z, R, nperm=10000, chunk=500, seed=0, workers=1):
+    """
+Returns the (edge, task, task) and (edge,) permutation p-values of
+the correlations and of their means (see HLP_MSG).
+    """
+    jobs = [(Z, R, min(chunk, nperm - start), seed, k)
+            for k, start in enumerate(range(0, nperm, chunk))]
+    if workers > 1 and len(jobs) > 1:
+        pool = multiprocessing.Pool(min(workers, len(jobs)))
+        results = pool.map(_permutation_job, jobs)
+        pool.close()
+        pool.join()
+    else:
+        results = [_permutation_job(x) for x in jobs]
+
+    counts = sum(x[0] for x in results)
+    mcounts = sum(x[1] for x in results)
+    return (1.0 + counts) / (1.0 + nperm), (1.0 + mcounts) / (1.0 + nperm)
+
+
+def write_correlations(fileName, names, tasks, nsubj, R, P):
+    out = open(fileName, 'w')
+    out.write("Edge\tTask1\tTask2\tN\tr\tp\n")
+    for e, name in enumerate(names):
+        for i, t1 in enumerate(tasks):
+            for j, t2 in enumerate(tasks):
+                if i != j:
+                    out.write("%s\t%s\t%s\t%d\t%.6f\t%s\n" %
+                              (name, t1, t2, nsubj, R[e, i, j],
+                               "NA" if P is None else "%.6g" % P[e, i, j]))
+    out.close()
+
+
+def plot_correlations(outDir, names, tasks, R):
+    """
+Draws the correlation matrix of each connection (with a zero
+diagonal), as the levelplots of param.analysis.R.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    for e, name in enumerate(names):
+        m = R[e].copy()
+        np.fill_diagonal(m, 0)
+        fig = plt.figure(figsize=(5, 5))
+        plt.imshow(m, cmap=plt.get_cmap("jet", 50), origin="lower")
+        plt.colorbar(shrink=0.8)
+        plt.xticks(range(len(tasks)), tasks, rotation=90)
+        plt.yticks(range(len(tasks)), tasks)
+        plt.title(name)
+        plt.tight_layout()
+        plt.savefig(os.path.join(outDir, "%s.png" % name.replace("-", ".")), dpi=300)
+        plt.close(fig)
+
+
+if __name__ == "__main__":
+    opts, args = getopt.getopt(sys.argv[1:], "m:t:n:c:j:s:o:p")
+    opts = dict(opts)
+    if len(args) < 1:
+        print(HLP_MSG)
+    else:
+        root = args[0]
+        outDir = opts.get("-o", root)
+        if "-t" in opts:
+            params = dcm_params.read_combined(opts["-t"], opts.get("-m", "A"))
+        else:
+            params = dcm_params.load_parameters(root, opts.get("-m", "A"))
+
+        X, subjects, names = complete_tensor(params)
+        Z = standardize(X)
+        R = correlations(Z)
+
+        nperm = int(opts.get("-n", 10000))
+        P = M = None
+        if nperm > 0:
+            P, M = permutation_pvalues(Z, R, nperm, int(opts.get("-c", 500)),
+                                       int(opts.get("-s", 0)), int(opts.get("-j", 1)))
+
+        write_correlations(os.path.join(outDir, "param_correlations.tsv"),
+                           names, params.tasks, len(subjects), R, P)
+        if "-p" in opts:
+            plot_correlations(outDir, names, params.tasks, R)
+
+        print("%d subjects in all %d tasks, %d connections" %
+              (len(subjects), len(params.tasks), len(names)))
+        for e, name in enumerate(names):
+            print("%s\t%.6f%s" % (name, mean_offdiagonal(R[e]),
+                                  "" if M is None else "\tp = %.4g" % M[e]))
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# ------------------------------------------------------------------ #
+# Numpy arrays in shared memory blocks, which the workers of a
+# multiprocessing pool read without copying (used by
+# dcm_bms_resample.py and granger_null.py).
+#
+# --- History ------------------------------------------------------ #
+#
+# 2026-10-18 : * File created.
+# ------------------------------------------------------------------ #
+
+HLP_MSG="""
+Usage
+-----
+In the parent process, copy a dictionary of arrays into shared memory
+and attach every worker to it with the pool's initializer:
+
+  blocks, specs = share({"WM" : lme})
+  try:
+      pool = multiprocessing.Pool(workers, attach, (specs,))
+      ...
+  finally:
+      release(blocks)
+
+In the workers (or in the parent, after attach(specs)), get("WM")
+returns the shared array. release() detaches the process from the
+blocks and frees the blocks it created.
+"""
+
+from multiprocessing import shared_memory
+import numpy as np
+
+# Arrays the process is attached to (key -> (block, array))
+_shared = {}
+
+
+def share(arrays):
+    """
+Copies a dictionary of arrays into shared memory blocks. Returns the
+blocks (which must be kept, and eventually released) and the
+specifications (name, shape, dtype) needed to attach to them.
+    """
+    blocks = []
+    specs = {}
+    for key, x in arrays.items():
+        x = np.ascontiguousarray(x)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, x.nbytes))
+        np.ndarray(x.shape, dtype=x.dtype, buffer=shm.buf)[:] = x
+        blocks.append(shm)
+        specs[key] = (shm.name, x.shape, x.dtype.str)
+    return blocks, specs
+
+
+def attach(specs):
+    """
+Worker initializer: attaches to the shared arrays described by
+'specs' (see share()).
+    """
+    for key, (name, shape, dtype) in specs.items():
+        shm = shared_memory.SharedMemory(name=name)
+        _shared[key] = (shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+
+
+def get(key):
+    return _shared[key][1]
+
+
+def release(blocks=()):
+    """
+Detaches the process from the shared arrays, then closes and unlinks
+the 'blocks' it created with share().
+    """
+    for key in list(_shared.keys()):
+        _shared.pop(key)[0].close()
+    for shm in blocks:
+        shm.close()
+        shm.unlink()
+
+
+if __name__ == "__main__":
+    print(HLP_MSG)
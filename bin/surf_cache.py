@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+# ------------------------------------------------------------------ #
+# Projections of the task T-maps onto the fsaverage surfaces, as done
+# by nilearn's surface.vol_to_surf, with a cache of the surface
+# textures and of the sparse (vertex x voxel) sampling matrices.
+#
+# --- History ------------------------------------------------------ #
+#
+# 2026-10-18 : * File created.
+#              * Falls back to vol_to_surf without nilearn's private helpers.
+#              * Texture names depend on the sampling parameters and nilearn.
+# ------------------------------------------------------------------ #
+
+HLP_MSG="""
+Usage
+-----
+  $ surf_cache.py [-w <fwhm>] [-r <radius>] <task1> <task2> ...
+
+Where:
+
+  <taskX> is a task folder with a spmT_0001.nii file.
+  <fwhm> is the width of the smoothing kernel of the T-map, in mm
+    (default is 4; see tmap_cache.py).
+  <radius> is the half-length of the segment, along the normal of
+    each vertex, on which the volume is sampled (default is 3 mm, as
+    in vol_to_surf).
+
+Projects the T-map of each task on the left and right pial surfaces
+of fsaverage5 (if not cached yet) and prints a summary.
+
+Method
+------
+vol_to_surf samples the volume at points along the normal of each
+vertex, with trilinear interpolation, and averages the samples of
+each vertex. Since this is a linear operation, it is the product of
+a sparse (vertex x voxel) matrix with the volume's data. The matrix
+only depends on the mesh, the affine and shape of the volume, and
+the sampling parameters, so it is computed once and saved (as a
+.npz file); projecting another volume is then a single sparse
+matrix-vector product. Vertices without any sample inside the volume
+are NaN, as in vol_to_surf. Non-finite voxels are treated as 0 (the
+smoothed T-maps do not have any).
+
+The sample points are those of nilearn's private helpers of
+vol_to_surf. If they cannot be imported (e.g. in a later version of
+nilearn), volumes are projected by vol_to_surf itself, without any
+matrix. The version of nilearn is part of the matrices' names, so
+they are rebuilt when nilearn is updated.
+
+Cache
+-----
+Textures are saved in a '.cache' folder next to the T-map, and the
+matrices, which are shared by all tasks, in a '.cache' folder in the
+current directory. Texture names include the hash of the T-map (see
+tmap_cache.py), the smoothing and threshold, the mesh, and the
+radius, and a hash of the sampling parameters, of the version of
+nilearn, and of whether vol_to_surf itself was used; matrix names
+include the hash of the mesh and of the sampling parameters.
+"""
+
+import sys, os, getopt, hashlib
+import numpy as np
+import scipy.sparse
+import nilearn
+from nilearn import datasets, surface
+from nilearn.surface import load_surf_mesh
+try:
+    # Private helpers of vol_to_surf, used to get the same sample points
+    # (they may change in any nilearn release; without them, volumes
+    # are projected by vol_to_surf itself)
+    from nilearn.surface.surface import _sample_locations, _masked_indices
+except ImportError:
+    _sample_locations = _masked_indices = None
+
+import tmap_cache
+
+CACHE_DIR = tmap_cache.CACHE_DIR
+
+HEMIS = ["left", "right"]
+
+# Matrices already loaded by this process (path -> matrix)
+_matrices = {}
+
+
+def mesh_hash(mesh):
+    """
+Returns a hash of a mesh, given as a file or as its coordinates and
+faces.
+    """
+    if isinstance(mesh, str):
+        return tmap_cache.file_hash(mesh)
+    mesh = load_surf_mesh(mesh)
+    h = hashlib.sha1()
+    h.update(np.ascontiguousarray(mesh.coordinates).tobytes())
+    h.update(np.ascontiguousarray(mesh.faces).tobytes())
+    return h.hexdigest()
+
+
+def mesh_name(mesh):
+    """
+Returns a short name for a mesh (e.g. 'pial_left').
+    """
+    if isinstance(mesh, str):
+        name = os.path.basename(mesh)
+        while os.path.splitext(name)[1] in [".gz", ".gii"]:
+            name = os.path.splitext(name)[0]
+        return name
+    return "mesh"
+
+
+def build_sampling_matrix(mesh, affine, shape, radius=3.0, kind="auto", n_samples=None):
+    """
+Returns the sparse (vertex x voxel) matrix of the projection of a
+volume onto a mesh (see HLP_MSG), for volumes with the given affine
+and shape.
+    """
+    mesh = load_surf_mesh(mesh)
+    locations = _sample_locations(mesh, affine, radius, kind=kind, n_points=n_samples)
+    nv, npts, _ = locations.shape
+    points = locations.reshape((-1, 3))
+    kept = ~_masked_indices(points, shape)
+    rows = np.repeat(np.arange(nv), npts)[kept]
+    points = points[kept]
+
+    # Trilinear weights of the 8 corners of each point's cell (points
+    # in the last slab of the volume are extrapolated from the last
+    # cell, like RegularGridInterpolator with fill_value=None)
+    shape = np.asarray(shape)
+    low = np.clip(np.floor(points).astype(int), 0, shape - 2)
+    frac = points - low
+
+    counts = np.bincount(rows, minlength=nv).astype(np.float64)
+    scale = 1.0 / counts[rows]
+
+    ri = []
+    ci = []
+    vals = []
+    for corner in range(8):
+        bits = np.array([(corner >> k) & 1 for k in range(3)])
+        w = np.prod(np.where(bits, frac, 1 - frac), axis=1) * scale
+        idx = low + bits
+        ri.append(rows)
+        ci.append(np.ravel_multi_index(idx.T, tuple(shape)))
+        vals.append(w)
+
+    proj = scipy.sparse.csr_matrix((np.concatenate(vals),
+                                    (np.concatenate(ri), np.concatenate(ci))),
+                                   shape=(nv, int(np.prod(shape))))
+    proj.sum_duplicates()
+    return proj
+
+
+def matrix_path(mesh, affine, shape, radius, kind, n_samples, cacheDir):
+    h = hashlib.sha1()
+    h.update(np.asarray(affine, dtype=np.float64).tobytes())
+    h.update(repr((tuple(int(x) for x in shape), float(radius), kind, n_samples,
+                   nilearn.__version__)).encode())
+    name = "proj_%s_%s_%s.npz" % (mesh_name(mesh), mesh_hash(mesh)[:16], h.hexdigest()[:16])
+    return os.path.join(cacheDir, name)
+
+
+def sampling_matrix(mesh, affine, shape, radius=3.0, kind="auto", n_samples=None,
+                    cacheDir=CACHE_DIR):
+    """
+Returns the sampling matrix of a mesh and volume geometry, from the
+cache if possible.
+    """
+    path = matrix_path(mesh, affine, shape[:3], radius, kind, n_samples, cacheDir)
+    if path in _matrices:
+        return _matrices[path]
+
+    if os.path.exists(path):
+        proj = scipy.sparse.load_npz(path)
+    else:
+        proj = build_sampling_matrix(mesh, affine, shape[:3], radius, kind, n_samples)
+        if not os.path.isdir(cacheDir):
+            os.makedirs(cacheDir, exist_ok=True)
+        tmp = path[:-4] + ".%d.tmp.npz" % os.getpid()
+        scipy.sparse.save_npz(tmp, proj)
+        os.replace(tmp, path)
+
+    _matrices[path] = proj
+    return proj
+
+
+def project(img, mesh, radius=3.0, kind="auto", n_samples=None, cacheDir=CACHE_DIR):
+    """
+Projects a 3-D image onto a mesh. Returns a (vertex,) texture, like
+surface.vol_to_surf(img, mesh, radius, kind=kind, n_samples=n_samples).
+    """
+    if _sample_locations is None:
+        return surface.vol_to_surf(img, mesh, radius=radius, interpolation="linear",
+                                   kind=kind, n_samples=n_samples)
+    proj = sampling_matrix(mesh, img.affine, img.shape, radius, kind, n_samples, cacheDir)
+    data = np.nan_to_num(np.asarray(img.get_fdata(), dtype=np.float64).ravel(),
+                         nan=0.0, posinf=0.0, neginf=0.0)
+    texture = proj.dot(data)
+    texture[np.diff(proj.indptr) == 0] = np.nan
+    return texture
+
+
+def texture_path(task, mesh, fwhm, threshold, radius, kind, n_samples, cacheDir):
+    fileName = os.path.join(task, tmap_cache.TMAP)
+    base = os.path.basename(tmap_cache.cache_path(fileName, fwhm, threshold))[:-4]
+    # Same sampling parameters as matrix_path, and whether the volume is
+    # projected by vol_to_surf itself
+    h = hashlib.sha1(repr((float(radius), kind, n_samples, nilearn.__version__,
+                           _sample_locations is None)).encode())
+    name = "%s_%s_%s_r%g_%s.npy" % (base, mesh_name(mesh), mesh_hash(mesh)[:8],
+                                    radius, h.hexdigest()[:8])
+    return os.path.join(cacheDir, name)
+
+
+def load_texture(task, mesh, fwhm=4, threshold=0.0, radius=3.0, kind="auto",
+                 n_samples=None, cacheDir=None, matrixDir=CACHE_DIR):
+    """
+Returns the projection of the preprocessed T-map of a task (see
+tmap_cache.load_tmap) onto a mesh, from the cache if possible. The
+texture is cached in 'cacheDir' (by default, <task>/.cache), and the
+sampling matrix, which is shared by all tasks, in 'matrixDir'.
+    """
+    if cacheDir is None:
+        cacheDir = os.path.join(task, CACHE_DIR)
+    path = texture_path(task, mesh, fwhm, threshold, radius, kind, n_samples, cacheDir)
+    if os.path.exists(path):
+        return np.load(path)
+
+    img = tmap_cache.load_tmap(task, fwhm, threshold)
+    texture = project(img, mesh, radius, kind, n_samples, cacheDir=matrixDir)
+    if not os.path.isdir(cacheDir):
+        os.makedirs(cacheDir, exist_ok=True)
+    tmp = path[:-4] + ".%d.tmp.npy" % os.getpid()
+    np.save(tmp, texture)
+    os.replace(tmp, path)
+    return texture
+
+
+def task_textures(task, fs, fwhm=4, threshold=0.0, radius=3.0):
+    """
+Returns the (left, right) projections of the T-map of a task onto
+the pial surfaces of an fsaverage dataset.
+    """
+    return tuple(load_texture(task, fs["pial_%s" % hemi], fwhm, threshold, radius)
+                 for hemi in HEMIS)
+
+
+if __name__ == "__main__":
+    opts, args = getopt.getopt(sys.argv[1:], "w:r:")
+    opts = dict(opts)
+    if len(args) < 1:
+        print(HLP_MSG)
+    else:
+        fs = datasets.fetch_surf_fsaverage("fsaverage5")
+        for task in args:
+            left, right = task_textures(task, fs, fwhm=float(opts.get("-w", 4)),
+                                        radius=float(opts.get("-r", 3.0)))
+            print("%s: %d + %d vertices, max %.2f / %.2f" %
+                  (task, len(left), len(right), np.nanmax(left), np.nanmax(right)))
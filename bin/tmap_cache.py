@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# ------------------------------------------------------------------ #
+# Preprocessing of the task T-maps (<Task>/spmT_0001.nii) shared by
+# the figure scripts: negative values are removed and the map is
+# smoothed, and the result is cached on disk, so that each map is
+# loaded and smoothed only once.
+#
+# --- History ------------------------------------------------------ #
+#
+# 2026-10-18 : * File created.
+# ------------------------------------------------------------------ #
+
+HLP_MSG="""
+Usage
+-----
+  $ tmap_cache.py [-w <fwhm>] [-t <threshold>] <task1> <task2> ...
+
+Where:
+
+  <taskX> is a task folder with a spmT_0001.nii file.
+  <fwhm> is the width of the smoothing kernel, in mm (default is 4;
+    0 means no smoothing).
+  <threshold> is the value below which voxels are set to 0 (default
+    is 0, i.e. negative values are removed).
+
+Preprocesses the T-map of each task (if it is not cached yet) and
+prints the path of its cached version.
+
+Cache
+-----
+The preprocessed maps are saved as NIfTI files in a '.cache' folder
+next to the original, with names that include the SHA-1 hash of the
+original file, the FWHM, and the threshold. Any change of the
+original file, or of the parameters, gives a different name, so a
+cached map never needs to be invalidated. Within a process, maps are
+also kept in memory.
+"""
+
+import sys, os, getopt, hashlib
+from nilearn import image
+
+CACHE_DIR = ".cache"
+
+TMAP = "spmT_0001.nii"
+
+# Maps already loaded by this process (cache path -> image)
+_loaded = {}
+
+# Hashes already computed by this process ((path, size, mtime) -> hash)
+_hashes = {}
+
+
+def file_hash(fileName):
+    """
+Returns the SHA-1 hash of the contents of a file.
+    """
+    st = os.stat(fileName)
+    key = (os.path.abspath(fileName), st.st_size, st.st_mtime)
+    if key not in _hashes:
+        h = hashlib.sha1()
+        f = open(fileName, 'rb')
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+        f.close()
+        _hashes[key] = h.hexdigest()
+    return _hashes[key]
+
+
+def cache_path(fileName, fwhm=4, threshold=0.0, cacheDir=None):
+    """
+Returns the path of the cached version of a preprocessed map.
+    """
+    folder, base = os.path.split(fileName)
+    if cacheDir is None:
+        cacheDir = os.path.join(folder, CACHE_DIR)
+    name = "%s_%s_fwhm%g_thr%g.nii" % (os.path.splitext(base)[0],
+                                        file_hash(fileName)[:16],
+                                        fwhm or 0, threshold)
+    return os.path.join(cacheDir, name)
+
+
+def rectify_smooth(fileName, fwhm=4, threshold=0.0):
+    """
+Loads a map, sets the values below 'threshold' to 0, and smooths it
+with a Gaussian kernel of width 'fwhm' (unless 'fwhm' is 0 or None).
+    """
+    img = image.load_img(fileName)
+    data = img.get_fdata()
+    data[data < threshold] = 0.0
+    img = image.new_img_like(img, data, copy_header=True)
+    if fwhm:
+        img = image.smooth_img(img, fwhm=fwhm)
+    return img
+
+
+def preprocess(fileName, fwhm=4, threshold=0.0, cacheDir=None):
+    """
+Returns the rectified and smoothed version of a map (see
+rectify_smooth), from the cache if possible.
+    """
+    path = cache_path(fileName, fwhm, threshold, cacheDir)
+    if path in _loaded:
+        return _loaded[path]
+
+    if os.path.exists(path):
+        img = image.load_img(path)
+    else:
+        img = rectify_smooth(fileName, fwhm, threshold)
+        folder = os.path.dirname(path)
+        if not os.path.isdir(folder):
+            os.makedirs(folder, exist_ok=True)
+        tmp = path[:-4] + ".%d.tmp.nii" % os.getpid()
+        img.to_filename(tmp)
+        os.replace(tmp, path)
+
+    _loaded[path] = img
+    return img
+
+
+def load_tmap(task, fwhm=4, threshold=0.0, cacheDir=None):
+    """
+Returns the preprocessed T-map of a task (<task>/spmT_0001.nii).
+    """
+    return preprocess(os.path.join(task, TMAP), fwhm, threshold, cacheDir)
+
+
+if __name__ == "__main__":
+    opts, args = getopt.getopt(sys.argv[1:], "w:t:")
+    opts = dict(opts)
+    if len(args) < 1:
+        print(HLP_MSG)
+    else:
+        fwhm = float(opts.get("-w", 4))
+        threshold = float(opts.get("-t", 0.0))
+        for task in args:
+            load_tmap(task, fwhm, threshold)
+            print(cache_path(os.path.join(task, TMAP), fwhm, threshold))
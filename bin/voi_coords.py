@@ -0,0 +1,363 @@
+#!/usr/bin/env python
+# ------------------------------------------------------------------ #
+# Loads the VOI coordinates of all tasks (the group peaks in
+# <Task>/vois.txt and the individual VOIs in <Task>/<VOI>_xyz.txt)
+# into structured NumPy arrays, with a binary cache, so that the
+# figure and analysis scripts do not parse the text files again.
+#
+# --- History ------------------------------------------------------ #
+#
+# 2026-10-18 : * File created.
+# ------------------------------------------------------------------ #
+
+HLP_MSG="""
+Usage
+-----
+  $ voi_coords.py <root_dir> [<task1> <task2> ...]
+
+Where:
+
+  <root_dir> is the folder containing one subfolder per task (e.g.,
+    tfMRI/all_architectures).
+  <taskX> is the name of a task (default is all of them).
+
+Loads the coordinates of all tasks (building the cache if needed)
+and prints, for each task and VOI, the number of subjects, the
+group peak, and the mean individual coordinates.
+
+Files
+-----
+vois.txt has one line per VOI with its name, the coordinates of the
+group peak (as 'x,y,z'), and the radius of the sphere, followed by
+other settings of dcm-generate-vois.sh, which are ignored.
+
+<VOI>_xyz.txt files (written by dcm-extract-model-data.sh) have a
+header and one line per subject, with the subject, the VOI, the
+coordinates of the centroid of the subject's VOI, and its size (in
+voxels).
+
+Blank or incomplete lines are skipped in both.
+
+Arrays
+------
+The individual VOIs are loaded into a single structured array with
+one record per (task, subject, VOI) and the fields
+
+  task, subject, voi, x, y, z, size
+
+and the group peaks into one with one record per (task, VOI) and
+the fields
+
+  task, voi, x, y, z, radius
+
+Both arrays are cached as .npy files (with a .json index) in a
+'.cache' folder inside <root_dir>. The cache is rebuilt whenever one
+of the text files changes.
+"""
+
+import sys, os, json
+import numpy as np
+
+TASKS = ["Emotion", "Gambling", "Language", "Relational", "Social", "WM"]
+
+VOIS = ['Action', 'LTM', 'Perception', 'Procedural', 'WM']
+
+CACHE_DIR = ".cache"
+
+RECORD = np.dtype([('task', 'U16'), ('subject', 'U16'), ('voi', 'U16'),
+                   ('x', 'f8'), ('y', 'f8'), ('z', 'f8'), ('size', 'f8')])
+
+PEAK = np.dtype([('task', 'U16'), ('voi', 'U16'),
+                 ('x', 'f8'), ('y', 'f8'), ('z', 'f8'), ('radius', 'f8')])
+
+# Coordinates already loaded by this process (root -> Coordinates)
+_loaded = {}
+
+
+def read_xyz(fileName):
+    """
+Reads a <VOI>_xyz.txt file. Returns the list of subjects, the list of
+VOI names (one per subject), and a (subject, 4) array with the x, y,
+z coordinates and the size.
+    """
+    f = open(fileName, 'r')
+    rows = [x.split() for x in f.read().split('\n')[1:]]
+    f.close()
+    rows = [x for x in rows if len(x) >= 6]
+    values = np.array([x[2:6] for x in rows], dtype=np.float64).reshape((-1, 4))
+    return [x[0] for x in rows], [x[1] for x in rows], values
+
+
+def read_vois(fileName):
+    """
+Reads a vois.txt file. Returns the list of VOI names and a (VOI, 4)
+array with the x, y, z coordinates of the peak and the radius.
+    """
+    f = open(fileName, 'r')
+    rows = [x.split() for x in f.read().split('\n')]
+    f.close()
+    rows = [x for x in rows if len(x) >= 3]
+    values = [[float(y) for y in x[1].split(",")] + [float(x[2])] for x in rows]
+    return [x[0] for x in rows], np.array(values, dtype=np.float64).reshape((-1, 4))
+
+
+class Coordinates(object):
+    """
+The VOI coordinates of all tasks (see HLP_MSG).
+
+  records  : structured array of the individual VOIs
+  peaks    : structured array of the group peaks
+  tasks    : list of task names
+  vois     : list of VOI names
+  subjects : list of subject IDs (union over all tasks)
+
+The integer codes of the task, VOI and subject of each record (in
+the lists above) are in 'task_code', 'voi_code' and 'subject_code'.
+    """
+    def __init__(self, records, peaks, tasks, vois, subjects):
+        self.records = records
+        self.peaks = peaks
+        self.tasks = tasks
+        self.vois = vois
+        self.subjects = subjects
+        self.task_index = dict((x, i) for i, x in enumerate(tasks))
+        self.voi_index = dict((x, i) for i, x in enumerate(vois))
+        self.subject_index = dict((x, i) for i, x in enumerate(subjects))
+        self.task_code = self._codes(records['task'], tasks)
+        self.voi_code = self._codes(records['voi'], vois)
+        self.subject_code = self._codes(records['subject'], subjects)
+
+    @staticmethod
+    def _codes(values, labels):
+        labels = np.asarray(labels, dtype=values.dtype)
+        order = np.argsort(labels)
+        return order[np.searchsorted(labels, values, sorter=order)]
+
+    def Mask(self, task=None, voi=None, subject=None):
+        """
+        Returns a boolean mask of the records of a task, VOI and
+        subject (any of them if None; each can also be a list).
+        """
+        mask = np.ones(len(self.records), dtype=bool)
+        for value, codes, index in [(task, self.task_code, self.task_index),
+                                    (voi, self.voi_code, self.voi_index),
+                                    (subject, self.subject_code, self.subject_index)]:
+            if value is None:
+                continue
+            if isinstance(value, str):
+                value = [value]
+            mask &= np.isin(codes, [index[x] for x in value if x in index])
+        return mask
+
+    def Select(self, task=None, voi=None, subject=None):
+        """
+        Returns the records of a task, VOI and subject (see Mask).
+        """
+        return self.records[self.Mask(task, voi, subject)]
+
+    def XYZ(self, task=None, voi=None, subject=None):
+        """
+        Returns the (record, 3) coordinates of the selected records
+        (see Mask).
+        """
+        return xyz(self.Select(task, voi, subject))
+
+    def Individual(self, task):
+        """
+        Returns a dictionary with the (subject, 3) coordinates of each
+        VOI of a task.
+        """
+        return dict((v, self.XYZ(task, v)) for v in self.vois
+                    if np.any(self.Mask(task, v)))
+
+    def Group(self, task):
+        """
+        Returns a dictionary with the [x, y, z] coordinates of the
+        group peak of each VOI of a task.
+        """
+        peaks = self.peaks[self.peaks['task'] == task]
+        return dict((str(p['voi']), [float(p['x']), float(p['y']), float(p['z'])])
+                    for p in peaks)
+
+    def Grid(self, field=None):
+        """
+        Returns the coordinates as a dense (task, VOI, subject, 3)
+        array, or a (task, VOI, subject) array of a single field
+        (e.g. 'size'), with NaN where a subject has no VOI.
+        """
+        fields = ['x', 'y', 'z'] if field is None else [field]
+        grid = np.full((len(self.tasks), len(self.vois), len(self.subjects), len(fields)),
+                       np.nan)
+        for k, f in enumerate(fields):
+            grid[self.task_code, self.voi_code, self.subject_code, k] = self.records[f]
+        return grid if field is None else grid[..., 0]
+
+    def Present(self):
+        """
+        Returns a boolean (task, subject) array, True where the subject
+        has at least one VOI in the task.
+        """
+        present = np.zeros((len(self.tasks), len(self.subjects)), dtype=bool)
+        present[self.task_code, self.subject_code] = True
+        return present
+
+
+def xyz(records):
+    """
+Returns the (record, 3) coordinates of a structured array.
+    """
+    return np.column_stack([records['x'], records['y'], records['z']])
+
+
+def coordinate_files(root, task, vois=VOIS):
+    return [os.path.join(root, task, "%s_xyz.txt" % v) for v in vois] + \
+        [os.path.join(root, task, "vois.txt")]
+
+
+def build_coordinates(root, tasks=TASKS, vois=VOIS):
+    """
+Parses the coordinate files of all tasks and returns a Coordinates
+object. Missing files are skipped.
+    """
+    records = []
+    peaks = []
+    for task in tasks:
+        for v in vois:
+            fileName = os.path.join(root, task, "%s_xyz.txt" % v)
+            if not os.path.exists(fileName):
+                continue
+            subjects, names, values = read_xyz(fileName)
+            rec = np.zeros(len(subjects), dtype=RECORD)
+            rec['task'] = task
+            rec['subject'] = subjects
+            rec['voi'] = names
+            for k, f in enumerate(['x', 'y', 'z', 'size']):
+                rec[f] = values[:, k]
+            records.append(rec)
+
+        fileName = os.path.join(root, task, "vois.txt")
+        if os.path.exists(fileName):
+            names, values = read_vois(fileName)
+            rec = np.zeros(len(names), dtype=PEAK)
+            rec['task'] = task
+            rec['voi'] = names
+            for k, f in enumerate(['x', 'y', 'z', 'radius']):
+                rec[f] = values[:, k]
+            peaks.append(rec)
+
+    records = np.concatenate(records) if records else np.zeros(0, dtype=RECORD)
+    peaks = np.concatenate(peaks) if peaks else np.zeros(0, dtype=PEAK)
+
+    # VOIs named in the files but not in 'vois' are kept, after them
+    names = list(vois) + sorted(set(records['voi']) - set(vois))
+    subjects = sorted(set(records['subject']))
+    return Coordinates(records, peaks, list(tasks), names, subjects)
+
+
+def file_signature(root, tasks, vois):
+    """
+Returns the size and modification time of each coordinate file
+(None for missing files), which are used to check whether a cache
+is still valid.
+    """
+    sig = []
+    for task in tasks:
+        for fileName in coordinate_files(root, task, vois):
+            if os.path.exists(fileName):
+                st = os.stat(fileName)
+                sig.append([fileName, st.st_size, st.st_mtime])
+            else:
+                sig.append([fileName, None, None])
+    return sig
+
+
+def load_coordinates(root=".", tasks=TASKS, vois=VOIS, cacheDir=None, mmap=False):
+    """
+Loads the coordinates of all tasks, using the binary cache in
+'cacheDir' (by default, <root>/.cache) whenever it is up to date.
+With 'mmap', the cached arrays are memory-mapped (read-only) instead
+of being read in memory.
+    """
+    if cacheDir is None:
+        cacheDir = os.path.join(root, CACHE_DIR)
+
+    base = os.path.join(cacheDir, "coords")
+    sig = file_signature(root, tasks, vois)
+    mode = 'r' if mmap else None
+
+    if all(os.path.exists(base + x) for x in [".json", ".npy", "_peaks.npy"]):
+        f = open(base + ".json", 'r')
+        index = json.load(f)
+        f.close()
+        if index['signature'] == sig:
+            return Coordinates(np.load(base + ".npy", mmap_mode=mode),
+                               np.load(base + "_peaks.npy", mmap_mode=mode),
+                               index['tasks'], index['vois'], index['subjects'])
+
+    coords = build_coordinates(root, tasks, vois)
+
+    if not os.path.isdir(cacheDir):
+        os.makedirs(cacheDir, exist_ok=True)
+    # Written to temporary files first, as figures are drawn by
+    # several processes at once (see make-figures.py)
+    tmp = ".%d.tmp" % os.getpid()
+    np.save(base + tmp + ".npy", coords.records)
+    np.save(base + "_peaks" + tmp + ".npy", coords.peaks)
+    f = open(base + tmp + ".json", 'w')
+    json.dump({'signature' : sig,
+               'tasks' : coords.tasks,
+               'vois' : coords.vois,
+               'subjects' : coords.subjects}, f)
+    f.close()
+    os.replace(base + tmp + ".npy", base + ".npy")
+    os.replace(base + "_peaks" + tmp + ".npy", base + "_peaks.npy")
+    os.replace(base + tmp + ".json", base + ".json")
+
+    if mmap:
+        coords.records = np.load(base + ".npy", mmap_mode='r')
+        coords.peaks = np.load(base + "_peaks.npy", mmap_mode='r')
+    return coords
+
+
+def task_coordinates(root="."):
+    """
+Returns the coordinates of all the tasks in 'root' (loaded once per
+process).
+    """
+    key = os.path.abspath(root)
+    if key not in _loaded:
+        _loaded[key] = load_coordinates(root)
+    return _loaded[key]
+
+
+def load_vois(task, root="."):
+    """
+Returns the group peaks of a task, as a dictionary of [x, y, z]
+coordinates (the former load_vois of the figure scripts).
+    """
+    return task_coordinates(root).Group(task)
+
+
+def load_individual_coords(task, root="."):
+    """
+Returns the individual coordinates of a task, as a dictionary of
+(subject, 3) arrays (the former load_individual_coords of the figure
+scripts).
+    """
+    return task_coordinates(root).Individual(task)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(HLP_MSG)
+    else:
+        coords = load_coordinates(sys.argv[1])
+        for task in (sys.argv[2:] or coords.tasks):
+            peaks = coords.Group(task)
+            for v in coords.vois:
+                sel = coords.XYZ(task, v)
+                if len(sel) == 0:
+                    continue
+                peak = peaks.get(v, [np.nan] * 3)
+                print("%s\t%s\tN=%d\tpeak=(%g, %g, %g)\tmean=(%.1f, %.1f, %.1f)" %
+                      ((task, v, len(sel)) + tuple(peak) + tuple(sel.mean(axis=0))))
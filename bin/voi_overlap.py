@@ -0,0 +1,353 @@
+#!/usr/bin/env python
+# ------------------------------------------------------------------ #
+# Overlap of the individual VOI masks across tasks and with the
+# resting-state masks: the sizes and intersections written by
+# calculate_overlap_rs.sh, the summed masks written by merge_vois.sh,
+# and the Dice and Jaccard coefficients between the VOIs of each
+# subject in every pair of tasks, computed in a single pass over the
+# masks.
+#
+# --- History ------------------------------------------------------ #
+#
+# 2026-10-18 : * File created.
+# ------------------------------------------------------------------ #
+
+HLP_MSG="""
+Usage
+-----
+  $ voi_overlap.py [-r <rest_dir>] [-o <out_dir>] [-b <block>] <task_dir1> ...
+
+Where:
+
+  <task_dirX> is the folder of a task, with one subfolder per subject
+    containing the subject's VOI masks (<subject>/dcm_results/
+    VOI_<voi>_mask.nii, as in merge_vois.sh). The name of the folder
+    is used as the name of the task.
+  <rest_dir> is the folder with the resting-state masks
+    (<voi>_optimized_mask.nii, with 'motor' for the Action VOI, as in
+    calculate_overlap_rs.sh).
+  <out_dir> is the folder where the results are saved (default is the
+    current folder).
+  <block> is the number of masks packed, or of pairs of masks
+    compared, at once (default is 512; see Method).
+
+For each task, writes <Task>_overlap.csv (subject, VOI, size, and size
+of the intersection with the resting-state mask, with no header, as
+calculate_overlap_rs.sh) and <Task>/VOI_<voi>_mask_sum.nii (the
+number of subjects whose VOI includes each voxel, as merge_vois.sh).
+Also writes overlap_pairs.csv, with the size of the intersection and
+the Dice and Jaccard coefficients of the VOIs of each subject in each
+pair of tasks (and with the resting-state masks, as task 'Rest'), and
+prints the mean Dice coefficients of each VOI.
+
+Method
+------
+The masks are read once, and each is kept as the sorted array of the
+(flat) indices of its voxels. The summed masks and the intersections
+with the resting-state masks are updated as each mask is read.
+
+The masks are then packed as bitsets over the voxels that belong to
+at least one mask, so that each mask takes a few hundred bytes. The
+intersection of two masks is the popcount of the AND of their
+bitsets. The masks are packed, and the pairs compared, <block> at a
+time, so the memory used is bounded by (block x voxels in the
+support) bytes while packing, and (block x bytes per mask) while
+comparing.
+"""
+
+import sys, os, getopt
+import numpy as np
+import nibabel as nib
+
+VOIS = ['Action', 'LTM', 'Perception', 'Procedural', 'WM']
+
+# Names of the resting-state masks (see calculate_overlap_rs.sh)
+REST_NAMES = {'Action' : 'motor'}
+
+REST = "Rest"
+
+MASK = "%(subject)s/dcm_results/VOI_%(voi)s_mask.nii"
+
+# Number of bits set in each byte
+_POPCOUNT = np.array([bin(x).count("1") for x in range(256)], dtype=np.uint8)
+
+
+def popcount(x, axis=-1):
+    """
+Returns the number of bits set in an array of bytes, along an axis.
+    """
+    if hasattr(np, "bitwise_count"):
+        counts = np.bitwise_count(x)
+    else:
+        counts = _POPCOUNT[x]
+    return counts.sum(axis=axis, dtype=np.int64)
+
+
+def rest_mask_path(restDir, voi):
+    return os.path.join(restDir, "%s_optimized_mask.nii" % REST_NAMES.get(voi, voi.lower()))
+
+
+def mask_indices(fileName):
+    """
+Returns the geometry (shape and affine) of a mask, and the sorted
+flat indices of its non-zero voxels.
+    """
+    img = nib.load(fileName)
+    data = np.asanyarray(img.dataobj)
+    if data.ndim > 3:
+        data = data.reshape(data.shape[0:3])
+    return (data.shape, img.affine), np.flatnonzero(data).astype(np.int32)
+
+
+def task_subjects(taskDir):
+    """
+Returns the subjects of a task folder (six-digit subfolders) that
+have DCM VOIs, as merge_vois.sh.
+    """
+    subjects = [x for x in sorted(os.listdir(taskDir))
+                if len(x) == 6 and x.isdigit()]
+    return [x for x in subjects
+            if os.path.exists(os.path.join(taskDir, MASK % {'subject' : x, 'voi' : VOIS[0]}))]
+
+
+class MaskSet(object):
+    """
+A set of binary masks, each stored as the sorted flat indices of its
+voxels (concatenated in 'indices', mask i being
+indices[offsets[i]:offsets[i + 1]]).
+
+  tasks, subjects, vois : the labels of each mask
+  shape, affine         : the geometry shared by all the masks
+    """
+    def __init__(self, shape, affine):
+        self.shape = tuple(shape)
+        self.affine = affine
+        self.tasks = []
+        self.subjects = []
+        self.vois = []
+        self._chunks = []
+        self._sizes = []
+        self.indices = None
+        self.offsets = None
+
+    def Add(self, task, subject, voi, indices):
+        self.tasks.append(task)
+        self.subjects.append(subject)
+        self.vois.append(voi)
+        self._chunks.append(indices)
+        self._sizes.append(len(indices))
+
+    def Close(self):
+        """
+        Concatenates the masks added so far.
+        """
+        if self._chunks:
+            self.indices = np.concatenate(self._chunks)
+        else:
+            self.indices = np.zeros(0, dtype=np.int32)
+        self.offsets = np.concatenate([[0], np.cumsum(self._sizes)]).astype(np.int64)
+        self._chunks = []
+
+    def Sizes(self):
+        return np.diff(self.offsets)
+
+    def Mask(self, i):
+        return self.indices[self.offsets[i]:self.offsets[i + 1]]
+
+    def Packed(self, block=512):
+        """
+        Returns the masks as a (mask, byte) array of bitsets over the
+        voxels that belong to at least one mask (packed 'block' masks
+        at a time).
+        """
+        support, cols = np.unique(self.indices, return_inverse=True)
+        cols = cols.ravel()
+        n = len(self.tasks)
+        packed = np.zeros((n, (len(support) + 7) // 8), dtype=np.uint8)
+        for i in range(0, n, block):
+            j = min(n, i + block)
+            start, end = self.offsets[i], self.offsets[j]
+            rows = np.repeat(np.arange(j - i), np.diff(self.offsets[i:j + 1]))
+            bits = np.zeros((j - i, len(support)), dtype=bool)
+            bits[rows, cols[start:end]] = True
+            packed[i:j] = np.packbits(bits, axis=1)
+        return packed
+
+
+def pair_intersections(packed, first, second, block=512):
+    """
+Returns the sizes of the intersections of the pairs of masks
+(first[k], second[k]), computed in blocks.
+    """
+    result = np.zeros(len(first), dtype=np.int64)
+    for k in range(0, len(first), block):
+        result[k:k + block] = popcount(packed[first[k:k + block]] &
+                                       packed[second[k:k + block]])
+    return result
+
+
+def dice_jaccard(size1, size2, inter):
+    """
+Returns the Dice and Jaccard coefficients of masks with the given
+sizes and intersections (NaN if both are empty).
+    """
+    size1 = np.asarray(size1, dtype=np.float64)
+    size2 = np.asarray(size2, dtype=np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        dice = 2.0 * inter / (size1 + size2)
+        jaccard = inter / (size1 + size2 - inter)
+    return dice, jaccard
+
+
+def load_masks(taskDirs, restDir=None, vois=VOIS):
+    """
+Reads the masks of all the subjects of each task in one pass.
+Returns the MaskSet of the masks, a dictionary with the summed masks
+of each (task, VOI), and a dictionary with the size of the
+intersection of each mask with the resting-state mask of its VOI
+(None without 'restDir').
+
+The resting-state masks are added to the MaskSet with the task
+'Rest' and the subject 'group'.
+    """
+    masks = None
+    sums = {}
+    rest = {}
+    restHits = {} if restDir is not None else None
+
+    def check(geometry):
+        if masks is None:
+            return MaskSet(*geometry)
+        if geometry[0] != masks.shape or not np.allclose(geometry[1], masks.affine):
+            raise Exception("Masks with different geometries")
+        return masks
+
+    for taskDir in taskDirs:
+        task = os.path.basename(os.path.normpath(taskDir))
+        for subject in task_subjects(taskDir):
+            for voi in vois:
+                geometry, idx = mask_indices(os.path.join(taskDir, MASK % {'subject' : subject,
+                                                                            'voi' : voi}))
+                masks = check(geometry)
+                masks.Add(task, subject, voi, idx)
+
+                key = (task, voi)
+                if key not in sums:
+                    sums[key] = np.zeros(int(np.prod(masks.shape)), dtype=np.uint16)
+                sums[key][idx] += 1
+
+                if restDir is not None:
+                    if voi not in rest:
+                        geometry, rest[voi] = mask_indices(rest_mask_path(restDir, voi))
+                        masks = check(geometry)
+                        masks.Add(REST, "group", voi, rest[voi])
+                    restHits[(task, subject, voi)] = \
+                        int(np.count_nonzero(np.isin(idx, rest[voi], assume_unique=True)))
+
+    if masks is None:
+        raise Exception("No masks found")
+    masks.Close()
+    return masks, sums, restHits
+
+
+def overlap_pairs(masks, block=512):
+    """
+Returns the intersections of the VOIs of each subject across tasks
+(and with the resting-state masks) as a list of (subject, VOI, task1,
+task2, size1, size2, intersection, Dice, Jaccard) rows.
+    """
+    tasks = np.asarray(masks.tasks)
+    subjects = np.asarray(masks.subjects)
+    vois = np.asarray(masks.vois)
+    sizes = masks.Sizes()
+
+    # Pairs of masks of the same subject and VOI in different tasks
+    first = []
+    second = []
+    order = np.lexsort((tasks, subjects, vois))
+    key = np.char.add(np.char.add(subjects[order], "/"), vois[order])
+    bounds = np.flatnonzero(np.concatenate([[True], key[1:] != key[:-1], [True]]))
+    for s, e in zip(bounds[:-1], bounds[1:]):
+        grp = order[s:e]
+        if subjects[grp[0]] == "group":
+            continue
+        i, j = np.triu_indices(len(grp), k=1)
+        first.append(grp[i])
+        second.append(grp[j])
+
+    # Each mask with the resting-state mask of its VOI
+    restIndex = dict((v, k) for k, (t, v) in enumerate(zip(tasks, vois)) if t == REST)
+    subj = np.flatnonzero(tasks != REST)
+    withRest = np.array([v in restIndex for v in vois[subj]], dtype=bool)
+    if np.any(withRest):
+        first.append(subj[withRest])
+        second.append(np.array([restIndex[v] for v in vois[subj[withRest]]]))
+
+    first = np.concatenate(first) if first else np.zeros(0, dtype=np.int64)
+    second = np.concatenate(second) if second else np.zeros(0, dtype=np.int64)
+
+    inter = pair_intersections(masks.Packed(block), first, second, block)
+    dice, jaccard = dice_jaccard(sizes[first], sizes[second], inter)
+    return [(subjects[a], vois[a], tasks[a], tasks[b], sizes[a], sizes[b], n, d, j)
+            for a, b, n, d, j in zip(first, second, inter, dice, jaccard)]
+
+
+def save_sums(masks, sums, outDir):
+    for (task, voi), total in sums.items():
+        folder = os.path.join(outDir, task)
+        if not os.path.isdir(folder):
+            os.makedirs(folder, exist_ok=True)
+        img = nib.Nifti1Image(total.reshape(masks.shape).astype(np.float64), masks.affine)
+        img.to_filename(os.path.join(folder, "VOI_%s_mask_sum.nii" % voi))
+
+
+def save_overlaps(masks, restHits, outDir):
+    sizes = masks.Sizes()
+    files = {}
+    for k, (task, subject, voi) in enumerate(zip(masks.tasks, masks.subjects, masks.vois)):
+        if task == REST:
+            continue
+        if task not in files:
+            files[task] = open(os.path.join(outDir, "%s_overlap.csv" % task), 'w')
+        files[task].write("%s,%s,%d,%d\n" % (subject, voi, sizes[k],
+                                             restHits[(task, subject, voi)]))
+    for f in files.values():
+        f.close()
+
+
+def save_pairs(rows, fileName):
+    f = open(fileName, 'w')
+    f.write("subject,voi,task1,task2,size1,size2,intersection,dice,jaccard\n")
+    for r in rows:
+        f.write("%s,%s,%s,%s,%d,%d,%d,%.6f,%.6f\n" % tuple(r))
+    f.close()
+
+
+def mean_dice(rows):
+    """
+Returns a dictionary with the mean Dice coefficient of each (VOI,
+task1, task2).
+    """
+    values = {}
+    for r in rows:
+        key = (r[1],) + tuple(sorted([r[2], r[3]]))
+        values.setdefault(key, []).append(r[7])
+    return dict((k, np.nanmean(v)) for k, v in values.items())
+
+
+if __name__ == "__main__":
+    opts, args = getopt.getopt(sys.argv[1:], "r:o:b:")
+    opts = dict(opts)
+    if len(args) < 1:
+        print(HLP_MSG)
+    else:
+        outDir = opts.get("-o", ".")
+        masks, sums, restHits = load_masks(args, opts.get("-r", None))
+        save_sums(masks, sums, outDir)
+        if restHits is not None:
+            save_overlaps(masks, restHits, outDir)
+
+        rows = overlap_pairs(masks, int(opts.get("-b", 512)))
+        save_pairs(rows, os.path.join(outDir, "overlap_pairs.csv"))
+        for (voi, t1, t2), d in sorted(mean_dice(rows).items()):
+            print("%s\t%s\t%s\t%.3f" % (voi, t1, t2, d))
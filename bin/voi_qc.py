@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+# ------------------------------------------------------------------ #
+# Quality control of the individual VOIs: distances of each subject's
+# VOI to the group peak, VOIs of a subject that are too close to each
+# other, spread of each VOI across subjects, and outliers, computed
+# for all tasks at once with KD-trees (see voi_coords.py).
+#
+# --- History ------------------------------------------------------ #
+#
+# 2026-10-18 : * File created.
+# ------------------------------------------------------------------ #
+
+HLP_MSG="""
+Usage
+-----
+  $ voi_qc.py [-r <radius>] [-k <k>] [-o <out_file>] <root_dir> [<task1> ...]
+
+Where:
+
+  <root_dir> is the folder containing one subfolder per task (e.g.,
+    tfMRI/all_architectures).
+  <taskX> is the name of a task (default is all of them).
+  <radius> is the distance, in mm, below which two VOIs of the same
+    subject and task are reported as too close (default is 8).
+  <k> is the number of median absolute deviations above the median
+    distance to the group peak beyond which a VOI is an outlier
+    (default is 3).
+  <out_file> is a tab-separated file where the table of all VOIs is
+    saved (with the subject, distance to the group peak, nearest
+    group peak, distance to the closest other VOI of the subject, and
+    outlier flag).
+
+Prints the spread of each VOI, the pairs of VOIs that are too close,
+and the outliers.
+
+Queries
+-------
+All the queries are vectorized over the records of voi_coords.py:
+the distances to the group peaks use a (task, VOI) table of peaks
+indexed by the record codes, and the neighbour queries use a single
+KD-tree. Queries restricted to groups of records (e.g. the VOIs of
+one subject in one task) add the group code, multiplied by a large
+offset, as a fourth coordinate, so that records of different groups
+are never within the query radius of each other.
+"""
+
+import sys, getopt
+import numpy as np
+from scipy.spatial import cKDTree
+
+import voi_coords
+
+# Offset between groups in the 4-D trees (much larger than the brain)
+GROUP_OFFSET = 1.0e4
+
+
+def group_codes(*codes):
+    """
+Returns a single integer code for each combination of the given
+integer codes (e.g. task_code and subject_code).
+    """
+    codes = [np.asarray(c, dtype=np.int64) for c in codes]
+    _, combined = np.unique(np.column_stack(codes), axis=0, return_inverse=True)
+    return combined.ravel()
+
+
+def grouped_points(points, groups):
+    """
+Returns (point, 4) coordinates where groups are GROUP_OFFSET apart.
+    """
+    return np.column_stack([points, np.asarray(groups, dtype=np.float64) * GROUP_OFFSET])
+
+
+def build_tree(coords, mask=None):
+    """
+Returns a KD-tree of the coordinates of the records (or of those
+selected by 'mask'), and the indices of those records.
+    """
+    rows = np.arange(len(coords.records)) if mask is None else np.flatnonzero(mask)
+    return cKDTree(voi_coords.xyz(coords.records[rows])), rows
+
+
+def peak_table(coords):
+    """
+Returns the group peaks as a (task, VOI, 3) array (NaN where a task
+has no peak for a VOI).
+    """
+    table = np.full((len(coords.tasks), len(coords.vois), 3), np.nan)
+    for p in coords.peaks:
+        t = coords.task_index.get(str(p['task']))
+        v = coords.voi_index.get(str(p['voi']))
+        if t is not None and v is not None:
+            table[t, v] = [p['x'], p['y'], p['z']]
+    return table
+
+
+def peak_distances(coords):
+    """
+Returns the distance of each record to the group peak of its task
+and VOI.
+    """
+    peaks = peak_table(coords)[coords.task_code, coords.voi_code]
+    return np.linalg.norm(voi_coords.xyz(coords.records) - peaks, axis=1)
+
+
+def nearest_peaks(coords):
+    """
+Returns, for each record, the index (in coords.vois) of the nearest
+group peak of its task, and the distance to it. A VOI whose nearest
+peak is not its own is likely to be mislabeled.
+    """
+    table = peak_table(coords)
+    t, v = np.nonzero(~np.isnan(table[:, :, 0]))
+    tree = cKDTree(grouped_points(table[t, v], t))
+    dist, idx = tree.query(grouped_points(voi_coords.xyz(coords.records), coords.task_code))
+    return v[idx], dist
+
+
+def within_radius(coords, points, radius, mask=None):
+    """
+Returns, for each of the (point, 3) 'points', the indices of the
+records (or of those selected by 'mask') within 'radius' of it.
+    """
+    tree, rows = build_tree(coords, mask)
+    found = tree.query_ball_point(np.atleast_2d(points), radius)
+    return [rows[np.asarray(x, dtype=np.int64)] for x in found]
+
+
+def close_pairs(coords, radius=8.0, by=("task", "subject")):
+    """
+Returns a (pair, 2) array with the indices of the records that are
+closer than 'radius' to each other and belong to the same group
+(by default, the same subject and task), and their distances.
+    """
+    codes = [getattr(coords, "%s_code" % x) for x in by]
+    tree = cKDTree(grouped_points(voi_coords.xyz(coords.records), group_codes(*codes)))
+    pairs = tree.query_pairs(radius, output_type='ndarray')
+    pairs = pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+    xyz = voi_coords.xyz(coords.records)
+    dist = np.linalg.norm(xyz[pairs[:, 0]] - xyz[pairs[:, 1]], axis=1)
+    return pairs, dist
+
+
+def closest_other(coords, by=("task", "subject")):
+    """
+Returns, for each record, the distance to the closest other record of
+the same group (by default, the same subject and task), or inf if it
+is alone.
+    """
+    codes = [getattr(coords, "%s_code" % x) for x in by]
+    points = grouped_points(voi_coords.xyz(coords.records), group_codes(*codes))
+    dist, _ = cKDTree(points).query(points, k=2, distance_upper_bound=GROUP_OFFSET / 2)
+    return dist[:, 1]
+
+
+def spread(coords):
+    """
+Returns, for each task and VOI, the number of subjects, the centroid
+of the individual VOIs, and the mean and maximum distance to it, as
+arrays of shape (task, VOI) (and (task, VOI, 3) for the centroid).
+    """
+    grid = coords.Grid()
+    n = np.sum(~np.isnan(grid[..., 0]), axis=2)
+    with np.errstate(invalid='ignore'):
+        centroid = np.nanmean(grid, axis=2)
+        dist = np.linalg.norm(grid - centroid[:, :, None, :], axis=3)
+        return n, centroid, np.nanmean(dist, axis=2), np.nanmax(dist, axis=2)
+
+
+def group_medians(values, groups):
+    """
+Returns the median of 'values' in each group (groups are integer
+codes), from the values sorted by group and value.
+    """
+    counts = np.bincount(groups)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    s = values[np.lexsort((values, groups))]
+    lo = s[starts + (counts - 1) // 2]
+    hi = s[starts + counts // 2]
+    return (lo + hi) / 2.0
+
+
+def outliers(coords, k=3.0, dist=None):
+    """
+Returns a boolean array, True for the records whose distance to the
+group peak (or 'dist', if given) is more than 'k' (scaled) median
+absolute deviations above the median of their task and VOI.
+    """
+    if dist is None:
+        dist = peak_distances(coords)
+    if len(dist) == 0:
+        return np.zeros(0, dtype=bool)
+    groups = group_codes(coords.task_code, coords.voi_code)
+    med = group_medians(dist, groups)[groups]
+    mad = group_medians(np.abs(dist - med), groups)[groups]
+    return dist > med + k * 1.4826 * mad
+
+
+def qc_table(coords, k=3.0):
+    """
+Returns the QC table of all records, as a structured array with the
+fields of the records and the distance to the group peak, the
+nearest group peak, the distance to the closest other VOI of the
+same subject and task, and the outlier flag.
+    """
+    dist = peak_distances(coords)
+    nearest, _ = nearest_peaks(coords)
+    fields = coords.records.dtype.descr + [('peak_dist', 'f8'), ('nearest_peak', 'U16'),
+                                           ('closest_voi', 'f8'), ('outlier', '?')]
+    table = np.zeros(len(coords.records), dtype=fields)
+    for f in coords.records.dtype.names:
+        table[f] = coords.records[f]
+    table['peak_dist'] = dist
+    table['nearest_peak'] = np.asarray(coords.vois)[nearest]
+    table['closest_voi'] = closest_other(coords)
+    table['outlier'] = outliers(coords, k, dist)
+    return table
+
+
+def save_table(fileName, table):
+    f = open(fileName, 'w')
+    f.write("\t".join(table.dtype.names) + "\n")
+    for row in table:
+        f.write("\t".join(str(int(x)) if isinstance(x, np.bool_) else str(x)
+                          for x in row) + "\n")
+    f.close()
+
+
+if __name__ == "__main__":
+    opts, args = getopt.getopt(sys.argv[1:], "r:k:o:")
+    opts = dict(opts)
+    if len(args) < 1:
+        print(HLP_MSG)
+    else:
+        coords = voi_coords.load_coordinates(args[0])
+        radius = float(opts.get("-r", 8.0))
+        k = float(opts.get("-k", 3.0))
+
+        table = qc_table(coords, k)
+        if len(args) > 1:
+            table = table[np.isin(table['task'], args[1:])]
+
+        n, centroid, mean, maximum = spread(coords)
+        print("Task\tVOI\tN\tCentroid\tMean dist.\tMax dist.")
+        for i, task in enumerate(coords.tasks):
+            if len(args) > 1 and task not in args[1:]:
+                continue
+            for j, voi in enumerate(coords.vois):
+                if n[i, j] > 0:
+                    print("%s\t%s\t%d\t(%.1f, %.1f, %.1f)\t%.2f\t%.2f" %
+                          ((task, voi, n[i, j]) + tuple(centroid[i, j]) +
+                           (mean[i, j], maximum[i, j])))
+
+        pairs, dist = close_pairs(coords, radius)
+        first = coords.records[pairs[:, 0]]
+        second = coords.records[pairs[:, 1]]
+        if len(args) > 1:
+            sel = np.isin(first['task'], args[1:])
+            first, second, dist = first[sel], second[sel], dist[sel]
+        print("\n%d pair(s) of VOIs of the same subject closer than %g mm"
+              % (len(dist), radius))
+        for a, b, d in zip(first, second, dist):
+            print("%s\t%s\t%s\t%s\t%.2f" % (a['task'], a['subject'], a['voi'], b['voi'], d))
+
+        flagged = table[table['outlier'] | (table['nearest_peak'] != table['voi'])]
+        print("\n%d outlier(s) or VOI(s) nearest to another group peak" % len(flagged))
+        for r in flagged:
+            print("%s\t%s\t%s\t%.2f mm from peak, nearest peak: %s" %
+                  (r['task'], r['subject'], r['voi'], r['peak_dist'], r['nearest_peak']))
+
+        if "-o" in opts:
+            save_table(opts["-o"], table)